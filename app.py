@@ -3,15 +3,20 @@ from flask_login import LoginManager, login_user, logout_user, login_required, c
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
+from concurrent.futures import (
+    ThreadPoolExecutor, TimeoutError as FutureTimeout,
+)
 from datetime import datetime, timedelta
-import cv2
+from PIL import Image, UnidentifiedImageError
 from pyzbar.pyzbar import decode
 import qrcode
 from io import BytesIO
 import base64
 import os
+import threading
 from functools import wraps
 from dotenv import load_dotenv
+from sqlalchemy import event, inspect
 
 # Load environment variables from .env file
 load_dotenv()
@@ -56,6 +61,43 @@ def librarian_required(f):
     return decorated_function
 
 
+# Top available books per genre, ranked by rating then borrow count.
+# A genre is reloaded after any of its books is inserted, updated or deleted.
+GENRE_POOL_SIZE = int(os.environ.get('GENRE_POOL_SIZE', 12))
+genre_pools = {}
+
+
+def get_genre_pool(genre):
+    """Get the ranked recommendation pool for a genre"""
+    pool = genre_pools.get(genre)
+    if pool is None:
+        borrow_count = db.func.count(Borrowing.id)
+        pool = genre_pools[genre] = [
+            {'id': row.id, 'title': row.title, 'author': row.author,
+             'genre': row.genre}
+            for row in db.session.query(
+                Book.id, Book.title, Book.author, Book.genre
+            )
+            .outerjoin(Borrowing, Borrowing.book_id == Book.id)
+            .filter(Book.genre == genre, Book.status == BookStatus.AVAILABLE)
+            .group_by(Book.id)
+            .order_by(Book.average_rating.desc(), borrow_count.desc(), Book.id)
+            .limit(GENRE_POOL_SIZE)
+        ]
+    return pool
+
+
+@event.listens_for(Book, 'after_insert')
+@event.listens_for(Book, 'after_update')
+@event.listens_for(Book, 'after_delete')
+def drop_genre_pool(mapper, connection, target):
+    """Reload a genre's pool after one of its books changes"""
+    genre_pools.pop(target.genre, None)
+    history = inspect(target).attrs.genre.history
+    for genre in history.deleted or ():
+        genre_pools.pop(genre, None)
+
+
 def log_activity(action, book_id=None, user_id=None, details=None):
     """Log user activities"""
     activity = ActivityLog(
@@ -89,6 +131,44 @@ def create_notification(user_id, title, message, notification_type):
     }, room=f'user_{user_id}')
 
 
+# Barcode decoding runs in a small bounded pool, as in library/scanning.py.
+# Uploads beyond the workers and the queue are refused, and each request
+# waits at most BARCODE_DECODE_TIMEOUT seconds for its result.
+BARCODE_DECODE_WORKERS = int(os.environ.get('BARCODE_DECODE_WORKERS', 2))
+BARCODE_DECODE_QUEUE = int(os.environ.get('BARCODE_DECODE_QUEUE', 8))
+BARCODE_DECODE_TIMEOUT = float(os.environ.get('BARCODE_DECODE_TIMEOUT', 5))
+decode_executor = ThreadPoolExecutor(
+    max_workers=BARCODE_DECODE_WORKERS, thread_name_prefix='barcode'
+)
+decode_slots = threading.BoundedSemaphore(
+    BARCODE_DECODE_WORKERS + BARCODE_DECODE_QUEUE
+)
+
+
+class ScannerBusy(Exception):
+    """Raised when every decoding slot is taken or decoding overruns"""
+
+
+def decode_upload(data):
+    """Decode the barcodes in uploaded image bytes in the bounded pool"""
+    if not decode_slots.acquire(blocking=False):
+        raise ScannerBusy()
+    try:
+        future = decode_executor.submit(
+            lambda: decode(Image.open(BytesIO(data)).convert('L'))
+        )
+    except Exception:
+        decode_slots.release()
+        raise
+    future.add_done_callback(lambda _: decode_slots.release())
+
+    try:
+        return future.result(timeout=BARCODE_DECODE_TIMEOUT)
+    except FutureTimeout:
+        future.cancel()
+        raise ScannerBusy()
+
+
 # ============== AUTHENTICATION ROUTES ==============
 
 @app.route('/register', methods=['GET', 'POST'])
@@ -413,29 +493,27 @@ def scan_book():
         if not rack_no:
             return render_template('scan.html', error="Please enter a rack number.")
 
-        # Initialize camera
-        cap = cv2.VideoCapture(0)
-        scanned_data = None
-
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            barcodes = decode(frame)
-            for barcode in barcodes:
-                scanned_data = barcode.data.decode('utf-8')
-                break
-
-            if scanned_data:
-                break
-
-            cv2.imshow("Barcode Scanner", frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+        # Decode a photo uploaded by the client; the server has no camera
+        upload = request.files.get('image')
+        if not upload:
+            return render_template(
+                'scan.html',
+                error="Please take or upload a photo of the barcode.",
+            )
 
-        cap.release()
-        cv2.destroyAllWindows()
+        try:
+            barcodes = decode_upload(upload.read())
+        except ScannerBusy:
+            return render_template(
+                'scan.html',
+                error="The scanner is busy right now. Please try again.",
+            )
+        except (UnidentifiedImageError, OSError):
+            return render_template(
+                'scan.html',
+                error="The uploaded file is not a readable image.",
+            )
+        scanned_data = barcodes[0].data.decode('utf-8') if barcodes else None
 
         if not scanned_data:
             return render_template('scan.html', error="No barcode detected. Try again.")
@@ -443,11 +521,10 @@ def scan_book():
         book = Book.query.filter_by(barcode=scanned_data).first()
         if book:
             if book.rack_no == rack_no:
-                recommendations = Book.query.filter(
-                    Book.genre == book.genre,
-                    Book.id != book.id,
-                    Book.status == BookStatus.AVAILABLE
-                ).limit(3).all()
+                recommendations = [
+                    rec for rec in get_genre_pool(book.genre)
+                    if rec['id'] != book.id
+                ][:3]
 
                 log_activity('scan_success', book_id=book.id)
                 return render_template(
@@ -654,9 +731,13 @@ def add_review(book_id):
         )
         db.session.add(review)
 
-    # Update book's average rating
-    all_reviews = Review.query.filter_by(book_id=book_id).all()
-    avg_rating = sum(r.rating for r in all_reviews) / len(all_reviews)
+    # Recomputes AVG() over the book's reviews on every write. Incremental
+    # aggregates (rating_sum, rating_count) exist only in the Django app;
+    # this legacy schema has no migrations to add them.
+    db.session.flush()
+    avg_rating = db.session.query(db.func.avg(Review.rating)).filter_by(
+        book_id=book_id
+    ).scalar() or 0
     book.average_rating = round(avg_rating, 2)
 
     db.session.commit()
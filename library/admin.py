@@ -7,7 +7,7 @@ from .models import User, Book, Borrowing, Reservation, Review, ActivityLog, Not
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
     list_display = ('username', 'email', 'get_full_name_display', 'role', 'is_active', 'created_at')
-    list_filter = ('role', 'is_active', 'created_at')
+    list_filter = ('role', 'is_active', 'notification_delivery', 'created_at')
     search_fields = ('username', 'email', 'first_name', 'last_name')
     readonly_fields = ('created_at', 'updated_at')
 
@@ -89,7 +89,7 @@ class ActivityLogAdmin(admin.ModelAdmin):
 
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
-    list_display = ('title', 'user', 'type', 'is_read', 'created_at')
+    list_display = ('title', 'user', 'type', 'count', 'is_read', 'created_at')
     list_filter = ('type', 'is_read', 'created_at')
     search_fields = ('user__username', 'title')
     readonly_fields = ('created_at',)
@@ -0,0 +1,212 @@
+"""Shelf audits: decode many frames of one rack and compare with the catalogue.
+
+Frames come from a batch of photos or a short video. Near-identical frames
+are dropped before decoding, the rest are decoded as they are read, and the
+decoded set is diffed against the books recorded for the rack. The
+``audit_rack`` command decodes in a process pool; the web view runs
+``decode_frames`` inline in the bounded scanner pool from ``scanning``.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+import hashlib
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Book
+from .preprocessing import (
+    FramePreprocessor, frame_signature, signature_distance,
+)
+from .rack_index import rack_index
+from .scanning import DecodeTimeout, decode_pil, open_image
+
+# Optional: OpenCV is only needed to read video uploads
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def unique_frames(frames, max_distance=None):
+    """Skip exact repeats and frames nearly identical to the last kept one.
+
+    The average hash is too coarse to tell apart different sections of a
+    shelf with a similar layout, so it is only compared with the previous
+    kept frame. An earlier frame is skipped only if its pixels are identical.
+    """
+    if max_distance is None:
+        max_distance = settings.AUDIT_FRAME_MAX_DISTANCE
+    seen = set()
+    previous = None
+    for image in frames:
+        digest = hashlib.blake2b(image.tobytes(), digest_size=16)
+        digest.update(f'{image.mode}{image.size}'.encode())
+        digest = digest.digest()
+        if digest in seen:
+            continue
+        signature = frame_signature(image)
+        if (
+            previous is not None
+            and signature_distance(signature, previous) <= max_distance
+        ):
+            continue
+        seen.add(digest)
+        previous = signature
+        yield image
+
+
+def image_frames(uploads):
+    """Preprocessed frames from encoded image bytes.
+
+    Near-duplicate skipping is left to ``unique_frames``, which also catches
+    exact repeats that are not adjacent.
+    """
+    preprocessor = FramePreprocessor(
+        **{**settings.BARCODE_PREPROCESSING, 'skip_distance': None}
+    )
+    for data in uploads:
+        yield open_image(data, preprocessor)
+
+
+def video_frames(path, every=5):
+    """Grayscale frames sampled from a video file (requires OpenCV)."""
+    if cv2 is None:
+        raise RuntimeError(
+            'Video audits need OpenCV (opencv-python-headless) installed.'
+        )
+
+    from PIL import Image
+
+    preprocessor = FramePreprocessor(
+        **{**settings.BARCODE_PREPROCESSING, 'skip_distance': None}
+    )
+    capture = cv2.VideoCapture(path)
+    try:
+        index = 0
+        while True:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            if index % every == 0:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                yield preprocessor.process(Image.fromarray(gray))
+            index += 1
+    finally:
+        capture.release()
+
+
+def video_upload_frames(upload, every=5):
+    """Frames of an uploaded video, spooled to a temporary file for OpenCV."""
+    suffix = os.path.splitext(upload.name)[1] or '.mp4'
+    with tempfile.NamedTemporaryFile(suffix=suffix) as spool:
+        for chunk in upload.chunks():
+            spool.write(chunk)
+        spool.flush()
+        yield from video_frames(spool.name, every)
+
+
+def _decode_frame(image):
+    return [barcode['data'] for barcode in decode_pil(image)]
+
+
+def decode_frames(frames, workers=None, max_frames=None, deadline=None):
+    """Decode distinct frames and return ``(barcodes seen, frames decoded)``.
+
+    Frames are deduplicated and decoded as they are read, so only the frames
+    in flight are held in memory. At most ``max_frames`` distinct frames are
+    decoded, and ``DecodeTimeout`` is raised once ``time.monotonic()`` passes
+    ``deadline``. ``workers=0`` decodes in the calling thread.
+    """
+    if workers is None:
+        workers = settings.AUDIT_WORKERS or os.cpu_count() or 1
+    frames = islice(unique_frames(frames), max_frames)
+
+    def check_deadline():
+        if deadline is not None and time.monotonic() > deadline:
+            raise DecodeTimeout()
+
+    seen = set()
+    decoded = 0
+    if workers == 0:
+        for image in frames:
+            check_deadline()
+            seen.update(_decode_frame(image))
+            decoded += 1
+        return seen, decoded
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        try:
+            for image in frames:
+                check_deadline()
+                pending.append(executor.submit(_decode_frame, image))
+                if len(pending) >= 2 * workers:
+                    seen.update(pending.popleft().result())
+                    decoded += 1
+            for future in pending:
+                seen.update(future.result())
+                decoded += 1
+        except BaseException:
+            executor.shutdown(cancel_futures=True)
+            raise
+    return seen, decoded
+
+
+def audit_rack(rack_no, frames, workers=None, max_frames=None):
+    """Decode the frames of one rack and return its audit report."""
+    seen, decoded = decode_frames(frames, workers, max_frames)
+    return audit_report(rack_no, seen, decoded)
+
+
+def audit_report(rack_no, seen, frames_decoded):
+    """Compare decoded barcodes with a rack and mark correct books verified.
+
+    Returns a report with the books found on the rack, books that belong
+    elsewhere, expected books that were not seen and barcodes that are not in
+    the catalogue.
+    """
+    expected = rack_index.rack_barcodes(rack_no)
+    entries = {barcode: rack_index.lookup(barcode) for barcode in seen}
+    entries = {barcode: entry for barcode, entry in entries.items() if entry}
+    book_ids = [entry.book_id for entry in entries.values()]
+    titles = dict(
+        Book.objects.filter(pk__in=book_ids).values_list('id', 'title')
+    )
+    found = {
+        barcode: {
+            'id': entry.book_id,
+            'barcode': barcode,
+            'title': titles.get(entry.book_id, ''),
+            'rack_no': entry.rack_no,
+            'shelf_no': entry.shelf_no,
+        }
+        for barcode, entry in entries.items()
+    }
+
+    verified = sorted(barcode for barcode in seen if barcode in expected)
+    verified_at = timezone.now()
+    if verified:
+        Book.objects.filter(barcode__in=verified).update(
+            last_location_verified=verified_at
+        )
+
+    return {
+        'rack_no': rack_no,
+        'frames_decoded': frames_decoded,
+        'verified': [found[barcode] for barcode in verified],
+        'misplaced': sorted(
+            (book for book in found.values() if book['rack_no'] != rack_no),
+            key=lambda book: book['barcode']
+        ),
+        'missing': [
+            {'id': rack_index.lookup(barcode).book_id, 'barcode': barcode}
+            for barcode in sorted(expected - seen)
+        ],
+        'unknown': sorted(seen - found.keys()),
+        'coverage': rack_index.coverage(rack_no, seen),
+        'verified_at': verified_at.isoformat(),
+    }
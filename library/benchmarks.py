@@ -0,0 +1,186 @@
+"""Query-count and latency budgets for the busiest views.
+
+Each scenario sends one request through the test client, as a student, a
+librarian or an anonymous visitor. A run repeats every scenario after one
+warm-up request. It records the highest query count seen and the median and
+95th-percentile wall times. The results are compared against the budgets
+committed in ``benchmark_budgets.json``.
+
+Query counts are checked exactly. They do not depend on the machine or on
+the dataset size, so any increase is a regression. The test suite runs the
+scenarios on a much smaller dataset than ``benchmark_views`` and requires the
+same counts, which catches queries that run once per row. Wall-time budgets
+only apply to ``manage.py benchmark_views``. That command measures against a
+generated dataset of known size, and the timings only mean something there.
+"""
+from collections import namedtuple
+import json
+from pathlib import Path
+import statistics
+import time
+
+from django.db import connection
+from django.db.models import Count, Q
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Book, BookStatus, Borrowing, Reservation, User, UserRole
+
+BUDGETS_PATH = Path(__file__).with_name('benchmark_budgets.json')
+
+Result = namedtuple('Result', 'name queries median_ms p95_ms status')
+
+
+class Fixture:
+    """The users, books and borrowings the scenarios act on.
+
+    They are picked from existing data.
+    """
+
+    def __init__(self):
+        active = Q(borrowings__returned_at__isnull=True)
+        self.student = (
+            User.objects.filter(role=UserRole.STUDENT)
+            .annotate(active=Count('borrowings', filter=active))
+            .order_by('-active', 'id').first()
+        )
+        self.librarian = (
+            User.objects.filter(role=UserRole.LIBRARIAN).order_by('id').first()
+        )
+        if self.librarian is None:
+            self.librarian = User.objects.create_user(
+                'benchmark-librarian', 'benchmark-librarian@example.com',
+                'unused', role=UserRole.LIBRARIAN
+            )
+        self.book = (
+            Book.objects.annotate(n=Count('borrowings'))
+            .order_by('-n', 'id').first()
+        )
+        borrowed = self.student.borrowings.filter(
+            returned_at__isnull=True
+        ).values('book')
+        self.to_borrow = iter(
+            Book.objects.filter(
+                status=BookStatus.AVAILABLE, available_copies__gt=0
+            )
+            .exclude(pk__in=borrowed).order_by('id')
+            .values_list('id', flat=True)
+        )
+
+    def clients(self):
+        clients = {'anonymous': Client()}
+        for role, user in (('student', self.student),
+                           ('librarian', self.librarian)):
+            clients[role] = Client()
+            clients[role].force_login(user)
+        return clients
+
+    def next_borrowing(self):
+        # Returns that notify a waiting reader run extra queries, so they are
+        # left out to keep the count the same on every dataset
+        waiting = Reservation.objects.filter(
+            is_fulfilled=False, canceled_at__isnull=True
+        ).values('book')
+        return (
+            Borrowing.objects.filter(
+                user=self.student, returned_at__isnull=True
+            )
+            .exclude(book__in=waiting)
+            .order_by('-id').values_list('id', flat=True).first()
+        )
+
+
+# name -> function(fixture) returning (role, method, path)
+SCENARIOS = {
+    'view_books': lambda f: ('student', 'get', reverse('view_books')),
+    'view_books_search': lambda f: (
+        'student', 'get', reverse('view_books') + '?q=river'
+    ),
+    'view_book_detail': lambda f: (
+        'student', 'get', reverse('view_book_detail', args=[f.book.id])
+    ),
+    'student_dashboard': lambda f: ('student', 'get', reverse('dashboard')),
+    'librarian_dashboard': lambda f: (
+        'librarian', 'get', reverse('dashboard')
+    ),
+    'get_user_borrowings': lambda f: (
+        'student', 'get', reverse('get_user_borrowings')
+    ),
+    'get_stats': lambda f: ('anonymous', 'get', reverse('get_stats')),
+    # Writes come last so they do not change what the read scenarios see
+    'borrow_book': lambda f: (
+        'student', 'post', reverse('borrow_book', args=[next(f.to_borrow)])
+    ),
+    'return_book': lambda f: (
+        'student', 'post', reverse('return_book', args=[f.next_borrowing()])
+    ),
+}
+
+
+def load_budgets(path=BUDGETS_PATH):
+    with open(path) as handle:
+        return json.load(handle)
+
+
+def run_scenarios(repeat=10, names=None, fixture=None):
+    """Run each scenario ``repeat`` times after a warm-up.
+
+    Returns a list of Results.
+    """
+    fixture = fixture or Fixture()
+    clients = fixture.clients()
+    results = []
+    for name, scenario in SCENARIOS.items():
+        if names and name not in names:
+            continue
+        timings, queries, status = [], 0, None
+        for attempt in range(repeat + 1):
+            role, method, path = scenario(fixture)
+            client = clients[role]
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = getattr(client, method)(path)
+                elapsed = time.perf_counter() - started
+            status = response.status_code
+            if attempt:  # the first request warms caches and pools
+                timings.append(elapsed * 1000)
+                queries = max(queries, len(context.captured_queries))
+        timings.sort()
+        p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+        results.append(Result(
+            name, queries, statistics.median(timings), p95, status
+        ))
+    return results
+
+
+def regressions(results, budgets, check_time=True, exact=False):
+    """Describe every result that exceeds its budget.
+
+    With ``exact``, query counts below the budget are reported too, so a
+    budget recorded with a per-row query cannot hide a new one.
+    """
+    problems = []
+    for result in results:
+        budget = budgets.get(result.name)
+        if budget is None:
+            problems.append(f'{result.name}: no budget')
+            continue
+        if result.status >= 400:
+            problems.append(f'{result.name}: HTTP {result.status}')
+        if result.queries > budget['queries']:
+            problems.append(
+                f'{result.name}: {result.queries} queries '
+                f'(budget {budget["queries"]})'
+            )
+        elif exact and result.queries < budget['queries']:
+            problems.append(
+                f'{result.name}: {result.queries} queries, '
+                f'lower the budget of {budget["queries"]}'
+            )
+        if check_time and result.median_ms > budget['median_ms']:
+            problems.append(
+                f'{result.name}: {result.median_ms:.1f} ms median '
+                f'(budget {budget["median_ms"]})'
+            )
+    return problems
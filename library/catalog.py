@@ -0,0 +1,333 @@
+"""Bulk catalogue import from CSV and MARC21 files.
+
+Records are read as a stream and handled in batches. Each batch costs two
+lookups: existing books by ISBN and by barcode. New books are written with
+``bulk_create`` and, when updating is enabled, changed books with
+``bulk_update``, all in one transaction per batch. If another writer adds one
+of the batch's ISBNs or barcodes first, that batch is retried row by row and
+the clashing rows are counted as conflicts. After each batch the number
+of records consumed is written to a checkpoint file. An interrupted import can
+then resume where the last committed batch ended.
+
+ISBNs are compacted with ``compact_isbn``, the normaliser ``Book.clean``
+applies to ISBNs entered through forms, and migration 0010 converted the
+hyphenated ones already stored. Rows whose ISBN is not then an ISBN-10 or
+ISBN-13 number are counted as invalid rather than stored truncated.
+
+CSV files need a header row whose columns are ``Book`` field names
+(``title``, ``author``, ``isbn``, ``barcode``, ``genre``, ``rack_no`` are
+required). MARC21 (ISO 2709, UTF-8) records map as follows:
+
+========  ==========================================
+020 $a    isbn
+100 $a    author (110 $a when there is no 100)
+245 $ab   title
+250 $a    edition
+260 $b/c  publisher / publication year (or 264)
+300 $a    pages
+520 $a    description
+650 $a    genre (first subject heading)
+852 $c    rack_no, $j shelf_no, $p barcode (001 if absent)
+========  ==========================================
+"""
+import csv
+from itertools import islice
+import json
+import os
+import re
+
+from django.db import IntegrityError, transaction
+
+from .models import ISBN_PATTERN, Book, compact_isbn
+
+REQUIRED_FIELDS = ['title', 'author', 'isbn', 'barcode', 'genre', 'rack_no']
+TEXT_FIELDS = REQUIRED_FIELDS + [
+    'category', 'shelf_no', 'edition', 'publisher', 'description',
+]
+INT_FIELDS = ['publication_year', 'pages', 'total_copies']
+UPDATE_FIELDS = [
+    field for field in TEXT_FIELDS + INT_FIELDS
+    if field not in ('isbn', 'total_copies')
+]
+
+FIELD_TERMINATOR = b'\x1e'
+RECORD_TERMINATOR = b'\x1d'
+SUBFIELD_DELIMITER = '\x1f'
+
+
+class CatalogError(ValueError):
+    """Raised when an input file cannot be read as a catalogue."""
+
+
+def _first_int(value):
+    match = re.search(r'\d+', value or '')
+    return int(match.group()) if match else None
+
+
+# ----- readers -----
+
+def read_csv(path):
+    """Yield one dict per CSV row."""
+    with open(path, newline='', encoding='utf-8-sig') as handle:
+        reader = csv.DictReader(handle)
+        missing = set(REQUIRED_FIELDS) - set(reader.fieldnames or ())
+        if missing:
+            raise CatalogError(
+                f'CSV is missing columns: {", ".join(sorted(missing))}'
+            )
+        yield from reader
+
+
+def iter_marc(handle):
+    """Yield raw ISO 2709 records from a binary file handle."""
+    while True:
+        leader = handle.read(24)
+        if not leader:
+            return
+        if len(leader) < 24 or not leader[:5].isdigit():
+            raise CatalogError('Truncated or invalid MARC record leader')
+        body = handle.read(int(leader[:5]) - 24)
+        yield leader + body
+
+
+def parse_marc(record):
+    """Split a raw MARC record into ``{tag: [field, ...]}``.
+
+    Control fields (00X) are strings; data fields are ``{code: [value, ...]}``.
+    """
+    encoding = 'utf-8' if record[9:10] == b'a' else 'latin-1'
+    base = int(record[12:17])
+    directory = record[24:base - 1]
+    fields = {}
+    for start in range(0, len(directory) - len(directory) % 12, 12):
+        entry = directory[start:start + 12].decode('ascii')
+        tag, length, offset = entry[:3], int(entry[3:7]), int(entry[7:12])
+        raw = record[base + offset:base + offset + length].rstrip(
+            FIELD_TERMINATOR + RECORD_TERMINATOR
+        )
+        text = raw.decode(encoding, errors='replace')
+        if tag < '010':
+            fields.setdefault(tag, []).append(text)
+            continue
+        subfields = {}
+        for chunk in text.split(SUBFIELD_DELIMITER)[1:]:
+            if chunk:
+                subfields.setdefault(chunk[0], []).append(chunk[1:].strip())
+        fields.setdefault(tag, []).append(subfields)
+    return fields
+
+
+def marc_to_row(fields):
+    """Map parsed MARC fields onto Book field names."""
+    def sub(tag, code):
+        for field in fields.get(tag, ()):
+            values = field.get(code)
+            if values:
+                return values[0]
+        return ''
+
+    title = ' '.join(
+        part for part in (sub('245', 'a'), sub('245', 'b')) if part
+    )
+    return {
+        'isbn': sub('020', 'a'),
+        'author': (sub('100', 'a') or sub('110', 'a')).rstrip(' ,.'),
+        'title': title.rstrip(' /:;,.'),
+        'edition': sub('250', 'a').rstrip(' /.'),
+        'publisher': (sub('260', 'b') or sub('264', 'b')).rstrip(' ,;:'),
+        'publication_year': sub('260', 'c') or sub('264', 'c'),
+        'pages': sub('300', 'a'),
+        'description': sub('520', 'a'),
+        'genre': sub('650', 'a').rstrip(' .'),
+        'rack_no': sub('852', 'c'),
+        'shelf_no': sub('852', 'j'),
+        'barcode': sub('852', 'p') or (fields.get('001') or [''])[0].strip(),
+    }
+
+
+def read_marc(path):
+    """Yield one Book-field dict per MARC record."""
+    with open(path, 'rb') as handle:
+        for record in iter_marc(handle):
+            yield marc_to_row(parse_marc(record))
+
+
+def read_catalog(path, fmt=None):
+    """Yield rows from a CSV or MARC file.
+
+    The reader is picked from ``fmt``, or else from the file extension.
+    """
+    fmt = fmt or ('csv' if path.lower().endswith('.csv') else 'marc')
+    if fmt == 'csv':
+        return read_csv(path)
+    if fmt == 'marc':
+        return read_marc(path)
+    raise CatalogError(f'Unknown catalogue format: {fmt}')
+
+
+def clean_row(row):
+    """Normalise a row into Book field values, or None if it is unusable.
+
+    Rows missing a required field, or whose ISBN is not an ISBN-10 or ISBN-13
+    number once compacted, are unusable.
+    """
+    values = {field: (row.get(field) or '').strip() for field in TEXT_FIELDS}
+    values['isbn'] = compact_isbn(values['isbn'])
+    for field in INT_FIELDS:
+        values[field] = _first_int(row.get(field))
+    if not all(values[field] for field in REQUIRED_FIELDS):
+        return None
+    if not ISBN_PATTERN.fullmatch(values['isbn']):
+        return None
+    for field in TEXT_FIELDS:
+        max_length = Book._meta.get_field(field).max_length
+        if max_length:
+            values[field] = values[field][:max_length]
+    values['total_copies'] = max(values['total_copies'] or 1, 1)
+    return values
+
+
+# ----- checkpoints -----
+
+class Checkpoint:
+    """Records how many input records have been committed.
+
+    The count is keyed to the input file's size and modification time.
+    """
+
+    def __init__(self, source, path=None):
+        self.source = source
+        self.path = path or f'{source}.import-state'
+        stat = os.stat(source)
+        self.fingerprint = [stat.st_size, int(stat.st_mtime)]
+
+    def load(self):
+        """Get the committed record count, or 0 without a checkpoint."""
+        try:
+            with open(self.path) as handle:
+                state = json.load(handle)
+        except (OSError, ValueError):
+            return 0
+        if state.get('fingerprint') != self.fingerprint:
+            return 0
+        return state['records']
+
+    def save(self, records):
+        temporary = f'{self.path}.tmp'
+        with open(temporary, 'w') as handle:
+            json.dump(
+                {'fingerprint': self.fingerprint, 'records': records}, handle
+            )
+        os.replace(temporary, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+# ----- import -----
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def import_rows(rows, batch_size=2000, update=False, skip=0, on_batch=None):
+    """Import rows into the catalogue, returning a dict of counts.
+
+    ``skip`` rows are consumed without being imported (for resuming).
+    ``on_batch(records, stats)`` is called after each committed batch with the
+    total number of records consumed so far.
+    """
+    stats = {
+        'created': 0, 'updated': 0, 'unchanged': 0,
+        'duplicate': 0, 'conflict': 0, 'invalid': 0,
+    }
+    seen_isbns, seen_barcodes = set(), set()
+    records = skip
+
+    try:
+        for batch in _batches(islice(rows, skip, None), batch_size):
+            cleaned = []
+            for row in batch:
+                values = clean_row(row)
+                if values is None:
+                    stats['invalid'] += 1
+                elif (values['isbn'] in seen_isbns
+                      or values['barcode'] in seen_barcodes):
+                    stats['duplicate'] += 1
+                else:
+                    seen_isbns.add(values['isbn'])
+                    seen_barcodes.add(values['barcode'])
+                    cleaned.append(values)
+
+            existing = Book.objects.in_bulk(
+                [values['isbn'] for values in cleaned], field_name='isbn'
+            )
+            barcodes = [values['barcode'] for values in cleaned]
+            taken = dict(
+                Book.objects.filter(barcode__in=barcodes)
+                .values_list('barcode', 'isbn')
+            )
+
+            to_create, to_update = [], []
+            for values in cleaned:
+                owner = taken.get(values['barcode'])
+                if owner is not None and compact_isbn(owner) != values['isbn']:
+                    stats['conflict'] += 1
+                    continue
+                book = existing.get(values['isbn'])
+                if book is None:
+                    to_create.append(
+                        Book(available_copies=values['total_copies'], **values)
+                    )
+                elif update and any(
+                    getattr(book, field) != values[field]
+                    for field in UPDATE_FIELDS
+                ):
+                    for field in UPDATE_FIELDS:
+                        setattr(book, field, values[field])
+                    to_update.append(book)
+                else:
+                    stats['unchanged'] += 1
+
+            try:
+                with transaction.atomic():
+                    Book.objects.bulk_create(to_create)
+                    if to_update:
+                        Book.objects.bulk_update(to_update, UPDATE_FIELDS)
+                stats['created'] += len(to_create)
+            except IntegrityError:
+                # Another writer took some of these ISBNs or barcodes after the
+                # lookup: insert the batch row by row and count the losers
+                with transaction.atomic():
+                    if to_update:
+                        Book.objects.bulk_update(to_update, UPDATE_FIELDS)
+                for book in to_create:
+                    book.pk = None
+                    try:
+                        with transaction.atomic():
+                            Book.objects.bulk_create([book])
+                        stats['created'] += 1
+                    except IntegrityError:
+                        stats['conflict'] += 1
+            stats['updated'] += len(to_update)
+
+            records += len(batch)
+            if on_batch:
+                on_batch(records, stats)
+    finally:
+        if stats['created'] or stats['updated']:
+            # bulk writes bypass the signals that keep these in step
+            from .rack_index import rack_index
+            from .recommendations import genre_pools
+            rack_index.invalidate()
+            genre_pools.invalidate()
+    stats['records'] = records
+    return stats
@@ -1,32 +1,150 @@
 """WebSocket consumers for real-time updates."""
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+import asyncio
 import json
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 
+from .models import Borrowing, Notification, User
+
+
+# Per-process counters, exposed through get_connection_metrics().
+connection_metrics = {
+    'active_connections': 0,
+    'rejected_connections': 0,
+    'rate_limited_messages': 0,
+    'dropped_messages': 0,
+    'overflow_disconnects': 0,
+}
+
+# Close code telling the client it missed messages and should reconnect
+RESYNC_CLOSE_CODE = 4008
+
+
+def get_connection_metrics():
+    """Return a snapshot of this process's WebSocket counters."""
+    return dict(connection_metrics)
+
+
+class TokenBucket:
+    """Token bucket allowing ``rate`` events per second.
+
+    Bursts of up to ``capacity`` events are allowed.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def consume(self, tokens=1):
+        """Take ``tokens`` from the bucket; False if there are not enough."""
+        now = time.monotonic()
+        refill = (now - self.updated_at) * self.rate
+        self.tokens = min(self.capacity, self.tokens + refill)
+        self.updated_at = now
+        if self.tokens < tokens:
+            return False
+        self.tokens -= tokens
+        return True
+
+
+def _count_subquery(queryset):
+    """Wrap a per-user queryset as a correlated COUNT subquery."""
+    counted = (
+        queryset.filter(user=OuterRef('pk'))
+        .order_by()
+        .values('user')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def get_realtime_counts(user_id):
+    """Fetch active, overdue and unread counts for a user in one query."""
+    active = Borrowing.objects.filter(returned_at__isnull=True)
+    overdue = active.filter(due_date__lt=timezone.now())
+    unread = Notification.objects.filter(is_read=False)
+    return User.objects.filter(pk=user_id).values(
+        active_borrowings=_count_subquery(active),
+        overdue_count=_count_subquery(overdue),
+        unread_notifications=_count_subquery(unread),
+    ).first() or {}
+
+
+def get_cached_realtime_counts(user_id):
+    """Get the user's counts, shared briefly across that user's connections."""
+    cache_key = f'realtime_counts:{user_id}'
+    counts = cache.get(cache_key)
+    if counts is None:
+        counts = get_realtime_counts(user_id)
+        timeout = getattr(settings, 'REALTIME_COUNTS_CACHE_SECONDS', 5)
+        cache.set(cache_key, counts, timeout)
+    return counts
+
+
+def notification_payload(event):
+    """Client payload for a ``notification.message`` channel-layer event."""
+    return {
+        'type': 'notification',
+        'title': event['title'],
+        'message': event['message'],
+        'notification_type': event['notification_type']
+    }
+
 
 class NotificationConsumer(AsyncWebsocketConsumer):
     """Consumer for real-time notifications."""
 
     async def connect(self):
         """Handle WebSocket connection."""
-        if self.scope["user"].is_authenticated:
-            self.group_name = f'user_{self.scope["user"].id}'
-            await self.channel_layer.group_add(
-                self.group_name,
-                self.channel_name
-            )
-            await self.accept()
-            await self.send(text_data=json.dumps({
-                'type': 'connection_established',
-                'message': 'Connected to real-time updates'
-            }))
-        else:
+        self.registered = False
+        if not self.scope["user"].is_authenticated:
+            await self.close()
+            return
+
+        active = connection_metrics['active_connections']
+        if active >= settings.WEBSOCKET_MAX_CONNECTIONS:
+            connection_metrics['rejected_connections'] += 1
             await self.close()
+            return
+
+        connection_metrics['active_connections'] += 1
+        self.registered = True
+        self.group_name = f'user_{self.scope["user"].id}'
+        self.last_counts = {}
+        self.rate_limiter = TokenBucket(
+            settings.WEBSOCKET_RATE_LIMIT, settings.WEBSOCKET_RATE_BURST
+        )
+        self.outbound = asyncio.Queue(
+            maxsize=settings.WEBSOCKET_OUTBOUND_QUEUE_SIZE
+        )
+        self.overflowed = False
+
+        await self.channel_layer.group_add(
+            self.group_name,
+            self.channel_name
+        )
+        await self.accept()
+        self.writer = asyncio.ensure_future(self.write_outbound())
+        await self.enqueue({
+            'type': 'connection_established',
+            'message': 'Connected to real-time updates'
+        })
 
     async def disconnect(self, close_code):
         """Handle WebSocket disconnection."""
-        if self.scope["user"].is_authenticated:
+        if self.registered:
+            self.registered = False
+            connection_metrics['active_connections'] -= 1
+            self.writer.cancel()
             await self.channel_layer.group_discard(
                 self.group_name,
                 self.channel_name
@@ -34,6 +152,10 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     async def receive(self, text_data):
         """Handle incoming messages."""
+        if not self.rate_limiter.consume():
+            connection_metrics['rate_limited_messages'] += 1
+            return
+
         try:
             data = json.loads(text_data)
             event_type = data.get('type')
@@ -43,35 +165,57 @@ class NotificationConsumer(AsyncWebsocketConsumer):
         except json.JSONDecodeError:
             pass
 
+    async def enqueue(self, payload):
+        """Queue a message for the writer, dropping it if the queue is full.
+
+        The queue is a safety cap on messages waiting for the writer task. It
+        is not flow control for slow clients: under daphne ``send()`` returns
+        once the frame is handed to Twisted, and ASGI exposes no transport
+        buffer size to measure. Once a message is dropped the socket has
+        missed an event, so every later message is dropped too and the writer
+        closes the socket with ``RESYNC_CLOSE_CODE`` after sending what is
+        queued; the client reconnects and fetches current state.
+        """
+        if not self.overflowed:
+            try:
+                self.outbound.put_nowait(json.dumps(payload))
+                return
+            except asyncio.QueueFull:
+                self.overflowed = True
+                connection_metrics['overflow_disconnects'] += 1
+        connection_metrics['dropped_messages'] += 1
+
+    async def write_outbound(self):
+        """Drain the outbound queue onto the socket."""
+        while True:
+            text_data = await self.outbound.get()
+            await self.send(text_data=text_data)
+            if self.overflowed and self.outbound.empty():
+                await self.close(code=RESYNC_CLOSE_CODE)
+                return
+
     async def send_updates(self):
-        """Send current user updates."""
-        user = self.scope["user"]
-        borrowings = await self.get_active_borrowings(user)
-        overdue_count = await self.count_overdue(user)
+        """Send the counts that changed since this socket's last update."""
+        counts = await self.get_counts(self.scope["user"].id)
+        changed = {
+            key: value for key, value in counts.items()
+            if self.last_counts.get(key) != value
+        }
+        if not changed:
+            return
 
-        await self.send(text_data=json.dumps({
+        self.last_counts = counts
+        await self.enqueue({
             'type': 'updates',
-            'active_borrowings': len(borrowings),
-            'overdue_count': overdue_count,
+            **changed,
             'timestamp': timezone.now().isoformat()
-        }))
+        })
 
     async def notification_message(self, event):
         """Handle notification message."""
-        await self.send(text_data=json.dumps({
-            'type': 'notification',
-            'title': event['title'],
-            'message': event['message'],
-            'notification_type': event['notification_type']
-        }))
-
-    @database_sync_to_async
-    def get_active_borrowings(self, user):
-        """Get user's active borrowings."""
-        return list(user.borrowings.filter(returned_at__isnull=True))
+        await self.enqueue(notification_payload(event))
 
     @database_sync_to_async
-    def count_overdue(self, user):
-        """Count overdue borrowings."""
-        borrowings = user.borrowings.filter(returned_at__isnull=True)
-        return sum(1 for b in borrowings if b.is_overdue())
+    def get_counts(self, user_id):
+        """Get the user's counts, shared briefly across that user's sockets."""
+        return get_cached_realtime_counts(user_id)
@@ -1,5 +1,5 @@
 """Context processors for library app."""
-from .models import Notification, UserRole
+from .models import Notification, NotificationDelivery, UserRole
 
 
 def library_context(request):
@@ -7,6 +7,7 @@ def library_context(request):
     context = {
         'site_name': 'Smart Library Management',
         'UserRole': UserRole,
+        'NotificationDelivery': NotificationDelivery,
     }
 
     if request.user.is_authenticated:
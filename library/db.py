@@ -0,0 +1,58 @@
+"""SQLite tuning for new database connections.
+
+SQLite's defaults suit one process. Several daphne workers writing to the
+same file get ``database is locked`` errors and slow commits.
+``configure_sqlite`` runs on ``connection_created`` and applies
+``SQLITE_PRAGMAS`` to each new connection:
+
+* ``journal_mode=wal`` lets readers carry on while one writer commits.
+* ``synchronous=normal`` only syncs at WAL checkpoints. This is safe in WAL
+  mode: a power cut can lose the last commits but cannot corrupt the file.
+* ``busy_timeout`` makes a writer wait for the lock instead of failing.
+* ``cache_size`` and ``mmap_size`` keep hot pages in memory.
+
+Django 4.2 opens transactions with a plain ``BEGIN``. A transaction that
+reads first and writes later can then fail straight away with
+``SQLITE_BUSY``, because ``busy_timeout`` does not apply when a read lock is
+upgraded. With ``SQLITE_TRANSACTION_MODE = 'IMMEDIATE'``, ``atomic()`` takes
+the write lock up front and waits in line instead. Django 5.1 added this as
+``OPTIONS['transaction_mode']``, which settings use on 5.1 and later. Older
+versions get a patched ``_start_transaction_under_autocommit``, a private
+hook, so the patch is only applied where ``NATIVE_TRANSACTION_MODE`` is
+False.
+"""
+import re
+
+import django
+from django.conf import settings
+
+NATIVE_TRANSACTION_MODE = django.VERSION >= (5, 1)
+
+_PRAGMA_NAME = re.compile(r'^[a-z_]+$')
+_PRAGMA_VALUE = re.compile(r'^(-?\d+|[A-Za-z_]+)$')
+
+
+def pragma_statements(pragmas):
+    """``PRAGMA`` statements for a ``{name: value}`` dict."""
+    statements = []
+    for name, value in pragmas.items():
+        if not _PRAGMA_NAME.match(name) or not _PRAGMA_VALUE.match(str(value)):
+            raise ValueError(f'Invalid SQLite pragma: {name}={value!r}')
+        statements.append(f'PRAGMA {name} = {value}')
+    return statements
+
+
+def configure_sqlite(connection):
+    """Apply the configured pragmas and transaction mode to a connection."""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for statement in pragma_statements(settings.SQLITE_PRAGMAS):
+            cursor.execute(statement)
+
+    mode = settings.SQLITE_TRANSACTION_MODE.upper()
+    if not NATIVE_TRANSACTION_MODE and mode in ('IMMEDIATE', 'EXCLUSIVE'):
+        def start_transaction():
+            connection.cursor().execute(f'BEGIN {mode}')
+
+        connection._start_transaction_under_autocommit = start_transaction
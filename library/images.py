@@ -0,0 +1,177 @@
+"""Resized WebP and JPEG variants of uploaded cover and profile images.
+
+Uploads are stored as they arrive, which can be several megabytes. After the
+upload's transaction commits, a small thread pool renders each size in
+``IMAGE_VARIANTS`` as WebP and JPEG next to the original. Pillow releases the
+GIL while it resizes and encodes, so threads are enough. Once every variant
+is stored, the model's ``*_variants_source`` field is set to the image name.
+Only saves that change the image schedule work, each image is rendered by
+one thread at a time, and replaced images have their old variants deleted.
+A failed render is retried by ``process_images``, not by the next save.
+Templates only emit ``srcset`` for images whose variants match the current
+file. ``manage.py process_images`` backfills existing uploads across a
+process pool.
+"""
+from concurrent.futures import Future, ThreadPoolExecutor
+from io import BytesIO
+import logging
+import os
+import threading
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .utils import save_atomic
+
+FORMATS = {'webp': 'WEBP', 'jpg': 'JPEG'}
+
+# model label -> (image field, field recording which image has variants)
+IMAGE_FIELDS = {
+    'library.book': ('cover_image', 'cover_variants_source'),
+    'library.user': ('profile_image', 'profile_image_variants_source'),
+}
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_in_flight = set()  # image names being rendered
+_lock = threading.Lock()
+
+
+def variant_name(name, variant, ext):
+    """Storage name of one variant of an image.
+
+    ``book_covers/x.png`` -> ``book_covers/variants/x_card.webp``.
+    """
+    folder, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(folder, 'variants', f'{stem}_{variant}.{ext}')
+
+
+def render_variants(data, variants=None, quality=None):
+    """Render every variant of an image as ``{(variant, ext): bytes}``."""
+    variants = variants or settings.IMAGE_VARIANTS
+    quality = quality or settings.IMAGE_QUALITY
+    with Image.open(BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+
+    rendered = {}
+    for variant, width in variants.items():
+        resized = image.copy()
+        resized.thumbnail((width, width * 4), Image.LANCZOS)
+        for ext, fmt in FORMATS.items():
+            output = BytesIO()
+            frame = resized
+            if fmt == 'JPEG' and frame.mode != 'RGB':
+                frame = Image.new('RGB', frame.size, 'white')
+                frame.paste(resized, mask=resized.getchannel('A'))
+            frame.save(output, fmt, quality=quality,
+                       optimize=fmt == 'JPEG', progressive=fmt == 'JPEG')
+            rendered[variant, ext] = output.getvalue()
+    return rendered
+
+
+def store_variants(name, rendered):
+    """Save rendered variants beside the original, replacing stale ones."""
+    for (variant, ext), data in rendered.items():
+        save_atomic(variant_name(name, variant, ext), data)
+
+
+def delete_variants(name):
+    """Remove every stored variant of an image."""
+    for variant in settings.IMAGE_VARIANTS:
+        for ext in FORMATS:
+            default_storage.delete(variant_name(name, variant, ext))
+
+
+def process_image(model, pk, name):
+    """Render and store an image's variants, then mark the row as done."""
+    field, source_field = IMAGE_FIELDS[model._meta.label_lower]
+    with default_storage.open(name, 'rb') as handle:
+        rendered = render_variants(handle.read())
+    store_variants(name, rendered)
+    # Only mark the row if the image was not replaced in the meantime
+    updated = model.objects.filter(pk=pk, **{field: name}).update(
+        **{source_field: name}
+    )
+    if not updated:
+        delete_variants(name)
+    return updated
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                thread_name_prefix='image-variants',
+            )
+        return _executor
+
+
+def schedule_variants(instance):
+    """Queue variant rendering for a saved instance whose image has none yet.
+
+    With ``IMAGE_VARIANT_WORKERS = 0`` the work runs inline. Returns a Future,
+    or None when there is nothing to do or the image is already being
+    rendered.
+    """
+    field, source_field = IMAGE_FIELDS[instance._meta.label_lower]
+    name = getattr(instance, field).name
+    if not name or name == getattr(instance, source_field):
+        return None
+
+    with _lock:
+        if name in _in_flight:
+            return None
+        _in_flight.add(name)
+
+    model = type(instance)
+    if not settings.IMAGE_VARIANT_WORKERS:
+        future = Future()
+        try:
+            future.set_result(process_image(model, instance.pk, name))
+        except Exception as exc:
+            future.set_exception(exc)
+        finally:
+            _done(name)
+        return future
+    try:
+        return _get_executor().submit(
+            _process_in_thread, model, instance.pk, name
+        )
+    except BaseException:
+        _done(name)
+        raise
+
+
+def _done(name):
+    with _lock:
+        _in_flight.discard(name)
+
+
+def _process_in_thread(model, pk, name):
+    from django.db import close_old_connections
+
+    try:
+        return process_image(model, pk, name)
+    except Exception:
+        logger.exception('Could not render image variants for %s', name)
+        raise
+    finally:
+        _done(name)
+        close_old_connections()
+
+
+def image_srcset(field_file, variants_source, ext):
+    """Build a ``srcset`` for one format, or '' until variants exist."""
+    if not field_file or field_file.name != variants_source:
+        return ''
+    return ', '.join(
+        f'{default_storage.url(variant_name(field_file.name, variant, ext))}'
+        f' {width}w'
+        for variant, width in settings.IMAGE_VARIANTS.items()
+    )
@@ -0,0 +1,424 @@
+"""Weighted-scenario load generator for the library app.
+
+Each virtual user runs in its own thread, in the style of Locust. It is a
+student or a librarian, picked by class weight. It logs in once and then
+picks tasks by weight until the run ends, with a random think time between
+tasks. Students search, open book pages, borrow, return and poll
+``/api/user/borrowings/``. Librarians check the dashboard and statistics,
+look at rack summaries and scan barcodes.
+
+Requests go through one of two transports:
+
+* ``ClientTransport`` uses Django's test client in this process. No server
+  is involved, so the figures show the cost of the application alone.
+* ``HTTPTransport`` sends real HTTP requests to a server on this machine,
+  such as ``runserver`` or daphne. Only loopback addresses are accepted.
+
+``manage.py load_test`` sets up the data and prints the per-endpoint report.
+"""
+from http.cookiejar import CookieJar
+import ipaddress
+import json
+import random
+import statistics
+import threading
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urlsplit
+from urllib.request import (
+    HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener,
+)
+import uuid
+
+from django.test import Client
+from django.urls import reverse
+
+from .models import Book, BookStatus, User, UserRole
+from .scanning import BARCODE_SCANNING_AVAILABLE
+from .utils import render_qr_png
+
+SEARCH_TERMS = [
+    'river', 'shadow', 'history', 'quantum', 'garden', 'city', 'light', 'code',
+    'zzz-no-match',
+]
+
+
+class LocalOnlyError(ValueError):
+    """Raised when a load test targets a server not on this machine."""
+
+
+# ----- statistics -----
+
+class Stats:
+    """Latencies and failures per endpoint, shared by all virtual users."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.failures = {}
+        self.errors = []  # exceptions that stopped a virtual user early
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def record(self, name, seconds, ok):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+            if not ok:
+                self.failures[name] = self.failures.get(name, 0) + 1
+
+    def stop(self):
+        self.finished = time.perf_counter()
+
+    def rows(self):
+        """One dict per endpoint plus a "total" row, latencies in ms."""
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        with self.lock:
+            named = sorted(self.latencies.items())
+            everything = [
+                latency for _, latencies in named for latency in latencies
+            ]
+            failures = dict(self.failures)
+        rows = [
+            _row(name, latencies, failures.get(name, 0), elapsed)
+            for name, latencies in named
+        ]
+        if everything:
+            rows.append(
+                _row('total', everything, sum(failures.values()), elapsed)
+            )
+        return rows
+
+
+def _row(name, latencies, failures, elapsed):
+    ordered = sorted(latencies)
+    if len(ordered) > 1:
+        cuts = statistics.quantiles(ordered, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = ordered[0]
+    return {
+        'name': name,
+        'requests': len(ordered),
+        'failures': failures,
+        'error_rate': failures / len(ordered),
+        'rps': len(ordered) / elapsed if elapsed else 0.0,
+        'p50_ms': p50 * 1000,
+        'p95_ms': p95 * 1000,
+        'p99_ms': p99 * 1000,
+    }
+
+
+# ----- transports -----
+
+class ClientTransport:
+    """Drive the app in-process through Django's test client."""
+
+    def __init__(self):
+        self.client = Client()
+
+    def login(self, user, password=None):
+        self.client.force_login(user)
+
+    def request(self, method, path, data=None, files=None):
+        if method == 'get':
+            response = self.client.get(path, data)
+        else:
+            payload = dict(data or {})
+            for field, (filename, content, _) in (files or {}).items():
+                payload[field] = _NamedBytes(filename, content)
+            response = self.client.post(path, payload)
+        if response.streaming:
+            body = b''.join(response.streaming_content)
+        else:
+            body = response.content
+        return response.status_code, body
+
+
+class _NamedBytes:
+    """File-like upload for the test client."""
+
+    def __init__(self, name, content):
+        self.name = name
+        self.content = content
+
+    def read(self, *args):
+        return self.content
+
+
+class _NoRedirects(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None  # report the 3xx itself, like the test client
+
+
+class HTTPTransport:
+    """Send real HTTP requests to a server on this machine."""
+
+    def __init__(self, base_url, timeout=30):
+        check_local(base_url)
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(
+            HTTPCookieProcessor(self.cookies), _NoRedirects
+        )
+
+    def csrf_token(self):
+        return next((
+            cookie.value for cookie in self.cookies
+            if cookie.name == 'csrftoken'
+        ), '')
+
+    def login(self, user, password=None):
+        self.request('get', reverse('login'))
+        status, _ = self.request('post', reverse('login'), {
+            'username': user.username, 'password': password,
+        })
+        if status != 302:
+            raise RuntimeError(
+                f'Could not log in as {user.username} (HTTP {status})'
+            )
+
+    def request(self, method, path, data=None, files=None):
+        url = self.base_url + path
+        headers = {'Referer': self.base_url + '/'}
+        body = None
+        if method == 'get':
+            if data:
+                url += '?' + urlencode(data)
+        else:
+            headers['X-CSRFToken'] = self.csrf_token()
+            if files:
+                body, headers['Content-Type'] = encode_multipart(
+                    data or {}, files
+                )
+            else:
+                body = urlencode(data or {}).encode()
+                headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        request = Request(url, body, headers, method=method.upper())
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except HTTPError as exc:
+            return exc.code, exc.read()
+        except (URLError, OSError):
+            return 0, b''
+
+
+def check_local(base_url):
+    """Refuse any target that is not a loopback address."""
+    host = urlsplit(base_url).hostname or ''
+    if host == 'localhost':
+        return
+    try:
+        if ipaddress.ip_address(host).is_loopback:
+            return
+    except ValueError:
+        pass
+    raise LocalOnlyError(
+        'Load tests only run against this machine, '
+        f'not {host or base_url!r}.'
+    )
+
+
+def encode_multipart(fields, files):
+    """Encode form fields and files as multipart form data.
+
+    ``files`` maps names to ``(filename, bytes, content type)``.
+    """
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"\r\n\r\n'
+            f'{value}\r\n'.encode()
+        )
+    for name, (filename, content, content_type) in files.items():
+        parts.append(
+            f'--{boundary}\r\n'
+            f'Content-Disposition: form-data; name="{name}"; '
+            f'filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode()
+            + content + b'\r\n'
+        )
+    parts.append(f'--{boundary}--\r\n'.encode())
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+# ----- scenarios -----
+
+class Workload:
+    """IDs and files the scenarios pick from, loaded once before the run."""
+
+    def __init__(self, students, librarians, book_ids, scan_images,
+                 password=None):
+        self.students = students
+        self.librarians = librarians
+        self.book_ids = book_ids
+        self.scan_images = scan_images  # [(rack_no, png bytes)]
+        self.password = password
+
+
+def load_workload(prefix, password=None, scan_images=20):
+    """Pick the generated accounts and books the scenarios use."""
+    users = User.objects.filter(
+        username__startswith=f'{prefix}-', is_active=True
+    )
+    students = list(users.filter(role=UserRole.STUDENT).order_by('id')[:500])
+    librarians = list(users.exclude(role=UserRole.STUDENT).order_by('id')[:50])
+    books = Book.objects.filter(isbn__startswith=f'{prefix}-').order_by('id')
+    book_ids = list(books.values_list('id', flat=True)[:5000])
+    images = []
+    if BARCODE_SCANNING_AVAILABLE:
+        available = books.filter(status=BookStatus.AVAILABLE).values_list(
+            'barcode', 'rack_no'
+        )[:scan_images]
+        images = [
+            (rack_no, render_qr_png(barcode, box_size=6))
+            for barcode, rack_no in available
+        ]
+    return Workload(students, librarians, book_ids, images, password)
+
+
+class VirtualUser:
+    """A logged-in user who runs weighted tasks until the deadline."""
+
+    weight = 1
+    tasks = {}  # method name -> weight
+
+    def __init__(self, transport, stats, workload, rng):
+        self.transport = transport
+        self.stats = stats
+        self.workload = workload
+        self.rng = rng
+
+    def request(self, name, method, path, data=None, files=None):
+        started = time.perf_counter()
+        try:
+            status, body = self.transport.request(method, path, data, files)
+        except Exception:
+            status, body = 0, b''
+        elapsed = time.perf_counter() - started
+        self.stats.record(name, elapsed, 0 < status < 400)
+        return status, body
+
+    def run(self, deadline, think_time):
+        names = list(self.tasks)
+        weights = [self.tasks[name] for name in names]
+        while time.monotonic() < deadline:
+            getattr(self, self.rng.choices(names, weights)[0])()
+            if think_time:
+                time.sleep(self.rng.uniform(0, think_time))
+
+
+class StudentUser(VirtualUser):
+    weight = 9
+    tasks = {
+        'search': 4, 'view_detail': 4, 'poll_borrowings': 3, 'borrow': 1,
+        'return_book': 1,
+    }
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.user = self.rng.choice(self.workload.students)
+        self.borrowing_ids = []
+
+    def search(self):
+        self.request('view_books (search)', 'get', reverse('view_books'),
+                     {'q': self.rng.choice(SEARCH_TERMS)})
+
+    def view_detail(self):
+        book_id = self.rng.choice(self.workload.book_ids)
+        self.request('view_book_detail', 'get',
+                     reverse('view_book_detail', args=[book_id]))
+
+    def poll_borrowings(self):
+        status, body = self.request('get_user_borrowings', 'get',
+                                    reverse('get_user_borrowings'))
+        if status == 200:
+            self.borrowing_ids = [
+                row['borrowing_id'] for row in json.loads(body)
+            ]
+
+    def borrow(self):
+        book_id = self.rng.choice(self.workload.book_ids)
+        self.request('borrow_book', 'post',
+                     reverse('borrow_book', args=[book_id]))
+
+    def return_book(self):
+        if not self.borrowing_ids:
+            return self.poll_borrowings()
+        borrowing_id = self.borrowing_ids.pop(
+            self.rng.randrange(len(self.borrowing_ids))
+        )
+        self.request('return_book', 'post',
+                     reverse('return_book', args=[borrowing_id]))
+
+
+class LibrarianUser(VirtualUser):
+    weight = 1
+    tasks = {'dashboard': 3, 'library_stats': 2, 'racks': 2, 'scan': 2}
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.user = self.rng.choice(self.workload.librarians)
+
+    def dashboard(self):
+        self.request('dashboard', 'get', reverse('dashboard'))
+
+    def library_stats(self):
+        self.request('get_stats', 'get', reverse('get_stats'))
+
+    def racks(self):
+        self.request('rack_summary', 'get', reverse('rack_summary'))
+
+    def scan(self):
+        if not self.workload.scan_images:
+            return self.racks()
+        rack_no, image = self.rng.choice(self.workload.scan_images)
+        self.request(
+            'decode_barcodes', 'post', reverse('decode_barcodes'),
+            {'rack_no': rack_no}, {'image': ('frame.png', image, 'image/png')},
+        )
+
+
+USER_CLASSES = [StudentUser, LibrarianUser]
+
+
+def run_load(transport_factory, workload, users=10, duration=30.0,
+             think_time=0.5, seed=42):
+    """Run ``users`` virtual users for ``duration`` seconds; return Stats."""
+    stats = Stats()
+    deadline = time.monotonic() + duration
+
+    def virtual_user(index):
+        from django.db import close_old_connections
+
+        rng = random.Random(f'{seed}:{index}')
+        user_class = rng.choices(
+            USER_CLASSES, [cls.weight for cls in USER_CLASSES]
+        )[0]
+        try:
+            if user_class is LibrarianUser and not workload.librarians:
+                user_class = StudentUser
+            user = user_class(transport_factory(), stats, workload, rng)
+            user.transport.login(user.user, workload.password)
+            user.run(deadline, think_time)
+        except Exception as exc:
+            with stats.lock:
+                stats.errors.append(exc)
+        finally:
+            close_old_connections()
+
+    threads = [
+        threading.Thread(target=virtual_user, args=(index,), daemon=True)
+        for index in range(users)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats.stop()
+    if stats.errors and not stats.latencies:
+        raise stats.errors[0]
+    return stats
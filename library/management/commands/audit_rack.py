@@ -0,0 +1,64 @@
+"""Management command to audit a rack from shelf photos or a video."""
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.audit import audit_rack, image_frames, video_frames
+
+
+class Command(BaseCommand):
+    help = ('Decode shelf photos or a video of one rack and report '
+            'misplaced, missing and unknown books')
+
+    def add_arguments(self, parser):
+        parser.add_argument('rack_no', help='Rack being audited')
+        parser.add_argument('paths', nargs='*',
+                            help='Image files of the shelf')
+        parser.add_argument('--video',
+                            help='Video file of the shelf (requires OpenCV)')
+        parser.add_argument('--every', type=int, default=5,
+                            help='Decode every Nth video frame')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Decoding processes (default: '
+                                 'AUDIT_WORKERS or CPU count)')
+        parser.add_argument('--json', action='store_true',
+                            help='Print the full report as JSON')
+
+    def handle(self, *args, **options):
+        """Run the audit and print a summary."""
+        if options['video']:
+            frames = video_frames(options['video'], options['every'])
+        elif options['paths']:
+            frames = image_frames(self.read(path) for path in options['paths'])
+        else:
+            raise CommandError('Give image paths or --video.')
+
+        try:
+            report = audit_rack(options['rack_no'], frames, options['workers'])
+        except RuntimeError as exc:
+            raise CommandError(str(exc))
+
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+
+        self.stdout.write(
+            f"Rack {report['rack_no']}: {report['frames_decoded']} distinct "
+            'frames decoded'
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Verified: {len(report['verified'])}")
+        )
+        for book in report['misplaced']:
+            self.stdout.write(self.style.WARNING(
+                f"Misplaced: {book['barcode']} '{book['title']}' belongs on "
+                f"rack {book['rack_no']}"
+            ))
+        for book in report['missing']:
+            self.stdout.write(self.style.ERROR(f"Missing: {book['barcode']}"))
+        for barcode in report['unknown']:
+            self.stdout.write(f'Unknown barcode: {barcode}')
+
+    def read(self, path):
+        with open(path, 'rb') as image:
+            return image.read()
@@ -0,0 +1,101 @@
+"""Management command to compare barcode preprocessing configurations."""
+from io import BytesIO
+import random
+import time
+
+import qrcode
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image, ImageFilter
+
+from library.preprocessing import FramePreprocessor
+from library.scanning import (
+    BARCODE_SCANNING_AVAILABLE, decode_pil, open_image,
+)
+
+CONFIGURATIONS = {
+    'baseline (RGB, full size)': {'grayscale': False},
+    'grayscale': {'grayscale': True},
+    'grayscale + 1280px': {'grayscale': True, 'max_width': 1280},
+    'grayscale + 960px': {'grayscale': True, 'max_width': 960},
+    'grayscale + 640px': {'grayscale': True, 'max_width': 640},
+    'grayscale + 960px + centre ROI': {
+        'grayscale': True, 'max_width': 960, 'roi': (0.2, 0.15, 0.8, 0.85),
+    },
+    'grayscale + 960px + skip': {
+        'grayscale': True, 'max_width': 960, 'skip_distance': 2,
+    },
+}
+
+
+def synthetic_frame(payload, rng, size=(1920, 1080)):
+    """A JPEG camera-like frame with one QR code somewhere near the middle."""
+    qr = qrcode.QRCode(box_size=rng.randint(4, 8), border=2)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    image = qr.make_image(fill_color='black', back_color='white')
+    code = image.get_image().convert('RGB')
+
+    shade = rng.randint(150, 230)
+    frame = Image.new('RGB', size, (shade, shade, shade))
+    left = rng.randint(size[0] // 5, size[0] * 4 // 5 - code.width)
+    top = rng.randint(size[1] // 6, size[1] * 5 // 6 - code.height)
+    frame.paste(code, (left, top))
+    frame = frame.filter(ImageFilter.GaussianBlur(rng.uniform(0, 1.2)))
+
+    buffer = BytesIO()
+    frame.save(buffer, format='JPEG', quality=85)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = ('Report frames/sec and decode recall of each barcode '
+            'preprocessing configuration')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100,
+                            help='Distinct barcodes in the corpus')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='Consecutive near-identical frames per '
+                                 'barcode, as in a video')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        """Build the corpus once and run every configuration over it."""
+        if not BARCODE_SCANNING_AVAILABLE:
+            raise CommandError(
+                'pyzbar and the zbar shared library are required.'
+            )
+
+        rng = random.Random(options['seed'])
+        corpus = []
+        for i in range(options['count']):
+            payload = f'BAR{i:06d}'
+            frame = synthetic_frame(payload, rng)
+            corpus.extend([(payload, frame)] * options['repeat'])
+        self.stdout.write(
+            f"Corpus: {len(corpus)} frames, {options['count']} barcodes\n"
+        )
+
+        self.stdout.write(
+            f"{'configuration':<34} {'frames/s':>9} {'recall':>8} "
+            f"{'skipped':>8}"
+        )
+        for name, config in CONFIGURATIONS.items():
+            preprocessor = FramePreprocessor(**config)
+            found = set()
+            skipped = 0
+            started = time.perf_counter()
+            for payload, data in corpus:
+                image = open_image(data, preprocessor)
+                if image is None:
+                    skipped += 1
+                    continue
+                barcodes = decode_pil(image)
+                if any(barcode['data'] == payload for barcode in barcodes):
+                    found.add(payload)
+            elapsed = time.perf_counter() - started
+
+            self.stdout.write(
+                f"{name:<34} {len(corpus) / elapsed:>9.1f} "
+                f"{len(found) / options['count']:>8.1%} {skipped:>8}"
+            )
@@ -0,0 +1,87 @@
+"""Management command to measure group_send fan-out on the channel layer."""
+import asyncio
+import time
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Benchmark group_send fan-out throughput of the configured '
+            'channel layer')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--members', type=int, default=100,
+                            help='Number of channels in the group')
+        parser.add_argument('--messages', type=int, default=100,
+                            help='Number of group_send calls')
+        parser.add_argument('--timeout', type=float, default=60.0,
+                            help='Seconds to wait for all deliveries')
+
+    def handle(self, *args, **options):
+        """Run the benchmark and print send and delivery rates."""
+        channel_layer = get_channel_layer()
+        if channel_layer is None:
+            raise CommandError('No channel layer is configured.')
+
+        layer_class = type(channel_layer).__name__
+        self.stdout.write(
+            f'Backend: {settings.CHANNEL_LAYER_BACKEND} ({layer_class})'
+        )
+        send_seconds, deliver_seconds, delivered = asyncio.run(self.run(
+            channel_layer, options['members'], options['messages'],
+            options['timeout'],
+        ))
+
+        expected = options['members'] * options['messages']
+        send_rate = options['messages'] / send_seconds
+        self.stdout.write(f'group_send: {send_rate:,.0f} calls/s')
+        self.stdout.write(
+            f'Deliveries: {delivered:,}/{expected:,} '
+            f'in {deliver_seconds:.2f}s '
+            f'({delivered / deliver_seconds:,.0f} msgs/s)'
+        )
+        if delivered < expected:
+            self.stdout.write(self.style.WARNING(
+                f'{expected - delivered} messages were dropped '
+                '(channel capacity or timeout).'
+            ))
+
+    async def run(self, channel_layer, members, messages, timeout):
+        """Fan out ``messages`` group sends to ``members`` receivers."""
+        group = f'benchmark_{time.monotonic_ns()}'
+        channels = [await channel_layer.new_channel() for _ in range(members)]
+        for channel in channels:
+            await channel_layer.group_add(group, channel)
+
+        async def drain(channel):
+            received = 0
+            try:
+                while received < messages:
+                    await channel_layer.receive(channel)
+                    received += 1
+            except asyncio.CancelledError:
+                pass
+            return received
+
+        receivers = [
+            asyncio.ensure_future(drain(channel)) for channel in channels
+        ]
+
+        started = time.perf_counter()
+        for i in range(messages):
+            await channel_layer.group_send(
+                group, {'type': 'benchmark.message', 'seq': i}
+            )
+        send_seconds = time.perf_counter() - started
+
+        done, pending = await asyncio.wait(receivers, timeout=timeout)
+        deliver_seconds = time.perf_counter() - started
+        for task in pending:
+            task.cancel()
+        delivered = sum([await task for task in receivers])
+
+        for channel in channels:
+            await channel_layer.group_discard(group, channel)
+        return send_seconds, deliver_seconds, delivered
@@ -0,0 +1,143 @@
+"""Management command to compare SQLite throughput with and without tuning."""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library.db import pragma_statements
+
+# Roughly what Django does on a fresh SQLite connection: no pragmas, a 5 s
+# busy timeout from the sqlite3 module and deferred transactions
+PROFILES = {
+    'default': ({}, 'BEGIN'),
+    # SQLITE_PRAGMAS and SQLITE_TRANSACTION_MODE from settings
+    'tuned': (None, None),
+}
+
+
+def create_database(path, books):
+    connection = sqlite3.connect(path)
+    connection.executescript("""
+        CREATE TABLE book (
+            id INTEGER PRIMARY KEY, title TEXT, available INTEGER NOT NULL
+        );
+        CREATE TABLE borrowing (
+            id INTEGER PRIMARY KEY, book_id INTEGER, user_id INTEGER,
+            borrowed_at REAL
+        );
+        CREATE INDEX borrowing_book ON borrowing (book_id);
+    """)
+    connection.executemany(
+        'INSERT INTO book (id, title, available) VALUES (?, ?, ?)',
+        ((i, f'Book {i}', 1_000_000) for i in range(1, books + 1)),
+    )
+    connection.commit()
+    connection.close()
+
+
+def run_worker(path, pragmas, begin, duration, write_share, books, seed):
+    """Mix page reads with borrow transactions for ``duration`` seconds.
+
+    Returns the read, write and locked-error counts.
+    """
+    connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+    for statement in pragma_statements(pragmas):
+        connection.execute(statement).fetchall()
+    rng = random.Random(seed)
+    reads = writes = locked = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        book_id = rng.randint(1, books)
+        try:
+            if rng.random() < write_share:
+                # Same shape as borrow_book: check the book, then insert and
+                # update
+                connection.execute(begin)
+                try:
+                    connection.execute(
+                        'SELECT available FROM book WHERE id = ?', (book_id,)
+                    ).fetchone()
+                    connection.execute(
+                        'INSERT INTO borrowing (book_id, user_id, borrowed_at)'
+                        ' VALUES (?, ?, ?)',
+                        (book_id, seed, time.time()),
+                    )
+                    connection.execute(
+                        'UPDATE book SET available = available - 1'
+                        ' WHERE id = ?',
+                        (book_id,),
+                    )
+                    connection.execute('COMMIT')
+                except BaseException:
+                    connection.execute('ROLLBACK')
+                    raise
+                writes += 1
+            else:
+                connection.execute(
+                    'SELECT title, available FROM book WHERE id = ?',
+                    (book_id,),
+                ).fetchone()
+                connection.execute(
+                    'SELECT COUNT(*) FROM borrowing WHERE book_id = ?',
+                    (book_id,),
+                ).fetchone()
+                reads += 1
+        except sqlite3.OperationalError as exc:
+            if 'locked' not in str(exc) and 'busy' not in str(exc):
+                raise
+            locked += 1
+    connection.close()
+    return reads, writes, locked
+
+
+class Command(BaseCommand):
+    help = ('Measure concurrent SQLite read/write throughput with default '
+            'and tuned connection settings')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8,
+                            help='Concurrent processes, like daphne workers')
+        parser.add_argument('--duration', type=float, default=5.0,
+                            help='Seconds per profile')
+        parser.add_argument('--write-share', type=float, default=0.2,
+                            help='Share of operations that write')
+        parser.add_argument('--books', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        """Run the same workload against a fresh database per profile."""
+        self.stdout.write(
+            f"{options['workers']} processes, {options['duration']:g}s each, "
+            f"{options['write_share']:.0%} writes"
+        )
+        self.stdout.write(
+            f"{'profile':<9} {'reads/s':>9} {'writes/s':>9} "
+            f"{'locked errors':>14}"
+        )
+        duration = options['duration']
+        for name, (pragmas, begin) in PROFILES.items():
+            if pragmas is None:
+                pragmas = settings.SQLITE_PRAGMAS
+                begin = f'BEGIN {settings.SQLITE_TRANSACTION_MODE}'
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, 'benchmark.sqlite3')
+                create_database(path, options['books'])
+                workers = options['workers']
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = [
+                        pool.submit(
+                            run_worker, path, pragmas, begin, duration,
+                            options['write_share'], options['books'], seed,
+                        )
+                        for seed in range(options['workers'])
+                    ]
+                    results = [future.result() for future in futures]
+            reads, writes, locked = (sum(column) for column in zip(*results))
+            self.stdout.write(
+                f"{name:<9} {reads / duration:>9,.0f} "
+                f"{writes / duration:>9,.0f} {locked:>14,}"
+            )
@@ -0,0 +1,90 @@
+"""Management command to check hot views against query and latency budgets."""
+from io import StringIO
+import json
+import math
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+
+from library.benchmarks import (
+    BUDGETS_PATH, load_budgets, regressions, run_scenarios,
+)
+
+
+class Command(BaseCommand):
+    help = ('Benchmark hot views on a generated dataset and fail if they '
+            'exceed the committed budgets')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.1,
+                            help='generate_dataset scale '
+                                 '(0.1 = 1,000 books, 5,000 borrowings)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Measured requests per view')
+        parser.add_argument('--view', action='append', dest='views',
+                            help='Only run this scenario (repeatable)')
+        parser.add_argument('--budgets', default=str(BUDGETS_PATH))
+        parser.add_argument('--update-budgets', action='store_true',
+                            help='Write the measured values (with headroom) '
+                                 'as the new budgets')
+
+    def handle(self, *args, **options):
+        """Run the scenarios in a throwaway test database."""
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            cache.clear()
+            call_command(
+                'generate_dataset', scale=options['scale'],
+                seed=options['seed'], prefix='bench', stdout=StringIO(),
+            )
+            results = run_scenarios(options['repeat'], options['views'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        budgets = (
+            {} if options['update_budgets']
+            else load_budgets(options['budgets'])
+        )
+        self.stdout.write(
+            f"{'view':<22} {'queries':>13} {'median ms':>17} {'p95 ms':>8}"
+        )
+        for result in results:
+            budget = budgets.get(result.name, {})
+            self.stdout.write(
+                f"{result.name:<22} {result.queries:>5} / "
+                f"{budget.get('queries', '-'):>5} "
+                f"{result.median_ms:>8.1f} / "
+                f"{budget.get('median_ms', '-'):>6} {result.p95_ms:>8.1f}"
+            )
+
+        if options['update_budgets']:
+            budgets = load_budgets(options['budgets'])
+            for result in results:
+                budgets[result.name] = {
+                    'queries': result.queries,
+                    # Wall time varies between machines; leave room for noise
+                    'median_ms': math.ceil(result.median_ms * 2 + 10),
+                }
+            with open(options['budgets'], 'w') as handle:
+                json.dump(budgets, handle, indent=2, sort_keys=True)
+                handle.write('\n')
+            self.stdout.write(self.style.SUCCESS(
+                f"Budgets written to {options['budgets']}."
+            ))
+            return
+
+        problems = regressions(results, budgets)
+        if problems:
+            raise CommandError('Budget exceeded:\n  ' + '\n  '.join(problems))
+        self.stdout.write(self.style.SUCCESS('All views are within budget.'))
@@ -0,0 +1,53 @@
+"""Management command to decay book popularity scores."""
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from library.models import Book, PopularityDecay
+from library.recommendations import (
+    TRENDING_CACHE_KEY,
+    decay_factor,
+    popularity_buffer,
+)
+
+
+class Command(BaseCommand):
+    help = ('Apply exponential decay to every book popularity score in one '
+            'UPDATE (run from cron)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--minutes', type=float, default=None,
+                            help='Elapsed time to decay for (default: time '
+                                 'since the last run)')
+
+    def handle(self, *args, **options):
+        """Scale scores by the decay for the time since the previous run.
+
+        The first run, with no previous one recorded, decays one
+        TRENDING_DECAY_INTERVAL_MINUTES. Late or skipped cron runs are caught
+        up on the next one, and early runs decay less.
+        """
+        # This process's pending events; each web process flushes its own
+        popularity_buffer.flush()
+        now = timezone.now()
+        with transaction.atomic():
+            last = PopularityDecay.objects.select_for_update().first()
+            minutes = options['minutes']
+            if minutes is None and last:
+                minutes = max((now - last.decayed_at).total_seconds() / 60, 0)
+            elif minutes is None:
+                minutes = settings.TRENDING_DECAY_INTERVAL_MINUTES
+            factor = decay_factor(minutes)
+            updated = Book.decay_popularity(factor)
+            if last:
+                last.decayed_at = now
+                last.save(update_fields=['decayed_at'])
+            else:
+                PopularityDecay.objects.create(decayed_at=now)
+        cache.delete(TRENDING_CACHE_KEY)
+        self.stdout.write(self.style.SUCCESS(
+            f'Decayed popularity of {updated} books by {factor:.4f} '
+            f'({minutes:g} minutes).'
+        ))
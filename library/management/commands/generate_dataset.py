@@ -0,0 +1,446 @@
+"""Management command to generate a large synthetic load-testing dataset."""
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, time as dt_time, timedelta
+from io import StringIO
+from itertools import accumulate, islice
+import random
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from library.models import (
+    ActivityLog, Book, BookStatus, Borrowing, Notification,
+    NotificationDelivery, Reservation, Review, User, UserRole,
+)
+from library.utils import STALE_SERVER_WARNING, cache_is_shared
+
+GENRES = [
+    'Fiction', 'Science', 'History', 'Technology', 'Biography', 'Mystery',
+    'Fantasy', 'Philosophy', 'Poetry', 'Economics', 'Art', 'Travel',
+    'Children', 'Romance', 'Psychology', 'Mathematics',
+]
+WORDS = [
+    'shadow', 'river', 'empire', 'garden', 'silent', 'code', 'theory',
+    'journey', 'winter', 'light', 'machine', 'ocean', 'secret', 'history',
+    'mind', 'city', 'fire', 'stone', 'northern', 'glass', 'hidden', 'last',
+    'first', 'modern', 'ancient', 'quantum', 'little', 'broken', 'golden',
+    'wild',
+]
+SURNAMES = [
+    'Smith', 'Khan', 'Garcia', 'Chen', 'Okafor', 'Novak', 'Sato', 'Patel',
+    'Silva', 'Müller',
+]
+# 1..5 stars, skewed positive like most review sites
+RATING_WEIGHTS = [4, 7, 17, 37, 35]
+ACTIVITY_WEIGHTS = {
+    'view_book': 70, 'search': 15, 'borrow': 6, 'return': 5, 'reserve': 2,
+    'login': 2,
+}
+# Books per UPDATE when scoring popularity (three parameters each)
+POPULARITY_BATCH = 200
+NOTIFICATION_TYPES = [
+    'reminder', 'overdue', 'available', 'borrow', 'reservation', 'info',
+]
+
+
+def zipf_cum_weights(n, exponent):
+    """Cumulative Zipf weights for ranks 1..n, for ``random.choices``."""
+    return list(accumulate(1.0 / rank ** exponent for rank in range(1, n + 1)))
+
+
+@contextmanager
+def historic_timestamps(*models):
+    """Let bulk_create keep the generated auto_now/auto_now_add values."""
+    flags = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if (getattr(field, 'auto_now', False)
+                    or getattr(field, 'auto_now_add', False)):
+                flags.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in flags:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _copy_value(value):
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return (
+        str(value).replace('\\', '\\\\').replace('\t', '\\t')
+        .replace('\n', '\\n').replace('\r', '\\r')
+    )
+
+
+def copy_objects(model, objs):
+    """Write unsaved model instances with PostgreSQL COPY."""
+    fields = [
+        field for field in model._meta.concrete_fields
+        if not field.primary_key
+    ]
+    buffer = StringIO()
+    for obj in objs:
+        buffer.write('\t'.join(
+            _copy_value(field.get_db_prep_save(
+                getattr(obj, field.attname), connection
+            ))
+            for field in fields
+        ))
+        buffer.write('\n')
+    buffer.seek(0)
+    quote = connection.ops.quote_name
+    columns = ', '.join(quote(field.column) for field in fields)
+    sql = f'COPY {quote(model._meta.db_table)} ({columns}) FROM STDIN'
+    with connection.cursor() as cursor:
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2
+            raw.copy_expert(sql, buffer)
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(buffer.getvalue())
+
+
+class Command(BaseCommand):
+    help = ('Generate a large, deterministic synthetic dataset '
+            '(users, books, history) for load testing')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0,
+                            help='Multiplier applied to every count below')
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--borrowings', type=int, default=50000)
+        parser.add_argument('--reservations', type=int, default=5000)
+        parser.add_argument('--reviews', type=int, default=20000)
+        parser.add_argument('--notifications', type=int, default=20000)
+        parser.add_argument('--activity', type=int, default=200000)
+        parser.add_argument('--days', type=int, default=365,
+                            help='History window in days')
+        parser.add_argument('--overdue-rate', type=float, default=0.08,
+                            help='Share of past borrowings never returned')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Zipf exponent of book popularity')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='gen',
+                            help='Prefix for usernames, ISBNs and barcodes')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--no-copy', action='store_true',
+                            help='Use bulk_create even on PostgreSQL')
+
+    def handle(self, *args, **options):
+        """Generate each table in dependency order."""
+        self.options = options
+        self.seed = options['seed']
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        self.use_copy = (
+            connection.vendor == 'postgresql' and not options['no_copy']
+        )
+        # Anchor timestamps to midnight so a seed gives the same data all day
+        self.now = timezone.make_aware(
+            datetime.combine(timezone.localdate(), dt_time.min)
+        )
+        self.window = timedelta(days=options['days'])
+        counts = {
+            name: int(options[name] * options['scale'])
+            for name in ('users', 'books', 'borrowings', 'reservations',
+                         'reviews', 'notifications', 'activity')
+        }
+        if not counts['users'] or not counts['books']:
+            raise CommandError('At least one user and one book are needed.')
+        prefix = f'{self.prefix}-'
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(
+                f'Data with prefix "{self.prefix}" already exists; '
+                'pick another --prefix.'
+            )
+
+        started = time.perf_counter()
+        with historic_timestamps(User, Book, Borrowing, Reservation, Review,
+                                 Notification, ActivityLog):
+            self.write(User, self.users(counts['users']), counts['users'])
+            self.user_ids = list(
+                User.objects.filter(username__startswith=prefix)
+                .order_by('id').values_list('id', flat=True)
+            )
+            self.write(Book, self.books(counts['books']), counts['books'])
+            self.book_ids = list(
+                Book.objects.filter(isbn__startswith=prefix)
+                .order_by('id').values_list('id', flat=True)
+            )
+            # Books are popular by Zipf rank, users by a flatter Zipf
+            self.book_weights = zipf_cum_weights(
+                len(self.book_ids), options['zipf']
+            )
+            self.user_weights = zipf_cum_weights(len(self.user_ids), 0.6)
+
+            self.write(Borrowing, self.borrowings(counts['borrowings']),
+                       counts['borrowings'])
+            self.write(Reservation, self.reservations(counts['reservations']),
+                       counts['reservations'])
+            self.write(Review, self.reviews(counts['reviews']),
+                       counts['reviews'])
+            self.write(Notification,
+                       self.notifications(counts['notifications']),
+                       counts['notifications'])
+            self.write(ActivityLog, self.activity(counts['activity']),
+                       counts['activity'])
+
+        self.finish()
+        elapsed = time.perf_counter() - started
+        method = 'COPY' if self.use_copy else 'bulk_create'
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {sum(counts.values())} rows in {elapsed:.1f}s '
+            f'({method}, seed {self.seed}).'
+        ))
+        if not cache_is_shared():
+            self.stdout.write(self.style.WARNING(STALE_SERVER_WARNING))
+
+    # ----- writing -----
+
+    def write(self, model, objs, total):
+        written = 0
+        label = model._meta.verbose_name_plural
+        while True:
+            batch = list(islice(objs, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                if self.use_copy:
+                    copy_objects(model, batch)
+                else:
+                    model.objects.bulk_create(batch)
+            written += len(batch)
+            self.stdout.write(f'{label}: {written}/{total}', ending='\r')
+        self.stdout.write(f'{label}: {written}/{total}')
+
+    def finish(self):
+        """Derive aggregates that bulk writes bypass."""
+        from library.management.commands.rebuild_rating_aggregates import (
+            rebuild,
+        )
+        from library.rack_index import rack_index
+        from library.recommendations import genre_pools
+
+        self.stdout.write(
+            'Reconciling availability, rating and popularity aggregates...'
+        )
+        active = (
+            Borrowing.objects.filter(
+                book=OuterRef('pk'), returned_at__isnull=True
+            ).order_by().values('book').annotate(n=Count('id')).values('n')
+        )
+        with transaction.atomic():
+            books = Book.objects.filter(isbn__startswith=f'{self.prefix}-')
+            borrowed = Coalesce(
+                Subquery(active, output_field=IntegerField()), Value(0)
+            )
+            books.update(available_copies=Greatest(
+                F('total_copies') - borrowed, Value(0)
+            ))
+            books.filter(available_copies=0).update(status=BookStatus.BORROWED)
+            rebuild(Book, Review, self.batch_size)
+            self.reconcile_popularity(books)
+        rack_index.invalidate()
+        genre_pools.invalidate()
+
+    def reconcile_popularity(self, books):
+        """Score the new books from their logged events, decayed to now."""
+        from library.recommendations import TRENDING_CACHE_KEY, decay_factor
+
+        # Bring every other score up to now first, so the next cron decay
+        # only covers the time after this run
+        call_command('decay_popularity', stdout=StringIO())
+        now = timezone.now()
+        weights = settings.TRENDING_WEIGHTS
+        scores = defaultdict(float)
+        events = ActivityLog.objects.filter(
+            book__in=books, action__in=list(weights)
+        ).values_list('book_id', 'action', 'timestamp')
+        for book_id, action, timestamp in events.iterator(
+            chunk_size=self.batch_size
+        ):
+            minutes = max((now - timestamp).total_seconds() / 60, 0)
+            scores[book_id] += weights[action] * decay_factor(minutes)
+
+        books.update(popularity=0.0)
+        scored = [(pk, score) for pk, score in scores.items() if score >= 0.01]
+        for start in range(0, len(scored), POPULARITY_BATCH):
+            Book.bump_popularity(dict(scored[start:start + POPULARITY_BATCH]))
+        cache.delete(TRENDING_CACHE_KEY)
+
+    # ----- generators -----
+
+    def rng(self, table):
+        # One stream per table, so changing one count leaves the others'
+        # data alone
+        return random.Random(f'{self.seed}:{table}')
+
+    def moment(self, rng):
+        return self.now - self.window * rng.random()
+
+    def pick_books(self, rng, k):
+        return rng.choices(self.book_ids, cum_weights=self.book_weights, k=k)
+
+    def pick_users(self, rng, k):
+        return rng.choices(self.user_ids, cum_weights=self.user_weights, k=k)
+
+    def pick_pairs(self, rng, k):
+        return zip(self.pick_users(rng, k), self.pick_books(rng, k))
+
+    def users(self, count):
+        rng = self.rng('users')
+        password = make_password('password', salt=f'{self.prefix}{self.seed}')
+        for n in range(count):
+            joined = self.moment(rng)
+            yield User(
+                username=f'{self.prefix}-{n:07d}',
+                email=f'{self.prefix}-{n:07d}@example.com',
+                password=password,
+                first_name=rng.choice(WORDS).title(),
+                last_name=rng.choice(SURNAMES),
+                role=(UserRole.LIBRARIAN if rng.random() < 0.01
+                      else UserRole.STUDENT),
+                roll_number=f'{2020 + n % 5}{n:06d}',
+                notification_delivery=(
+                    NotificationDelivery.DAILY if rng.random() < 0.2
+                    else NotificationDelivery.INSTANT
+                ),
+                date_joined=joined,
+                created_at=joined,
+                updated_at=joined,
+            )
+
+    def books(self, count):
+        rng = self.rng('books')
+        genre_weights = zipf_cum_weights(len(GENRES), 0.8)
+        for n in range(count):
+            genre = rng.choices(GENRES, cum_weights=genre_weights)[0]
+            copies = rng.choice([1, 1, 1, 2, 2, 3, 5])
+            added = self.now - self.window * 3 * rng.random()
+            yield Book(
+                title=' '.join(rng.sample(WORDS, rng.randint(2, 4))).title(),
+                author=f'{rng.choice(WORDS).title()} {rng.choice(SURNAMES)}',
+                isbn=f'{self.prefix}-{n:09d}',
+                barcode=f'{self.prefix}-BC{n:09d}',
+                genre=genre,
+                rack_no=f'{genre[0]}{n % 40 + 1}',
+                shelf_no=str(n % 6 + 1),
+                publication_year=rng.randint(1900, self.now.year),
+                pages=rng.randint(80, 900),
+                total_copies=copies,
+                available_copies=copies,
+                added_at=added,
+                updated_at=added,
+            )
+
+    def borrowings(self, count):
+        rng = self.rng('borrowings')
+        overdue_rate = self.options['overdue_rate']
+        while count > 0:
+            k = min(count, self.batch_size)
+            for user_id, book_id in self.pick_pairs(rng, k):
+                borrowed = self.moment(rng)
+                due = borrowed + timedelta(days=14)
+                returned = borrowed + timedelta(
+                    days=rng.triangular(1, 28, 10)
+                )
+                overdue = due < self.now and rng.random() < overdue_rate
+                if returned > self.now or overdue:
+                    returned = None
+                yield Borrowing(
+                    user_id=user_id, book_id=book_id, borrowed_at=borrowed,
+                    due_date=due, returned_at=returned,
+                    fine_paid=(
+                        max((returned - due).days, 0) * 10 if returned
+                        else 0.0
+                    ),
+                )
+            count -= k
+
+    def reservations(self, count):
+        rng = self.rng('reservations')
+        while count > 0:
+            k = min(count, self.batch_size)
+            for user_id, book_id in self.pick_pairs(rng, k):
+                reserved = self.moment(rng)
+                outcome = rng.random()
+                settled = reserved + timedelta(days=rng.uniform(1, 20))
+                settled = settled if settled < self.now else None
+                yield Reservation(
+                    user_id=user_id, book_id=book_id, reserved_at=reserved,
+                    is_fulfilled=bool(settled) and outcome < 0.7,
+                    fulfilled_at=settled if outcome < 0.7 else None,
+                    canceled_at=settled if outcome >= 0.9 else None,
+                )
+            count -= k
+
+    def reviews(self, count):
+        rng = self.rng('reviews')
+        pairs = set()
+        attempts = 0
+        while len(pairs) < count and attempts < count * 5:
+            k = min(count - len(pairs), self.batch_size)
+            attempts += k
+            for user_id, book_id in self.pick_pairs(rng, k):
+                if (user_id, book_id) in pairs:
+                    continue
+                pairs.add((user_id, book_id))
+                created = self.moment(rng)
+                yield Review(
+                    user_id=user_id, book_id=book_id,
+                    rating=rng.choices(range(1, 6), weights=RATING_WEIGHTS)[0],
+                    review_text=' '.join(
+                        rng.choices(WORDS, k=rng.randint(0, 30))
+                    ),
+                    helpful_count=int(rng.paretovariate(1.5)) - 1,
+                    created_at=created, updated_at=created,
+                )
+
+    def notifications(self, count):
+        rng = self.rng('notifications')
+        for user_id in self.pick_users(rng, count):
+            created = self.now - timedelta(days=45) * rng.random()
+            kind = rng.choice(NOTIFICATION_TYPES)
+            yield Notification(
+                user_id=user_id, title=f'{kind.title()} notice',
+                message=' '.join(rng.choices(WORDS, k=12)),
+                type=kind, is_read=rng.random() < 0.6, created_at=created,
+                expires_at=created + timedelta(days=30),
+            )
+
+    def activity(self, count):
+        rng = self.rng('activity')
+        actions, weights = zip(*ACTIVITY_WEIGHTS.items())
+        while count > 0:
+            k = min(count, self.batch_size)
+            picks = zip(
+                self.pick_users(rng, k), self.pick_books(rng, k),
+                rng.choices(actions, weights=weights, k=k),
+            )
+            for user_id, book_id, action in picks:
+                yield ActivityLog(
+                    user_id=user_id,
+                    book_id=None if action in ('search', 'login') else book_id,
+                    action=action, timestamp=self.moment(rng),
+                    ip_address=(
+                        f'10.{rng.randrange(256)}.{rng.randrange(256)}.'
+                        f'{rng.randrange(1, 255)}'
+                    ),
+                )
+            count -= k
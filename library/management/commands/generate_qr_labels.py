@@ -0,0 +1,89 @@
+"""Management command to print QR label sheets for many books at once."""
+from io import BytesIO
+import os
+import time
+
+from PIL import Image
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from library.labels import DPI, iter_label_sheets
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = ('Generate printable QR label sheets (PNG pages or one PDF) for a '
+            'filtered set of books')
+
+    def add_arguments(self, parser):
+        parser.add_argument('output',
+                            help='Directory for PNG pages, or a .pdf file')
+        parser.add_argument('--genre', help='Only books of this genre')
+        parser.add_argument('--rack', help='Only books on this rack')
+        parser.add_argument('--status', help='Only books with this status')
+        parser.add_argument('--columns', type=int, default=3)
+        parser.add_argument('--rows', type=int, default=8)
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Rendering processes (default: '
+                                 'QR_LABEL_WORKERS or CPU count)')
+        parser.add_argument('--base-url', default=settings.SITE_URL,
+                            help='Prefix for the book URLs encoded in the '
+                                 'codes')
+
+    def handle(self, *args, **options):
+        """Render the pages and write them out as they finish."""
+        books = Book.objects.order_by('rack_no', 'shelf_no', 'id')
+        filters = (
+            ('genre', 'genre'), ('rack_no', 'rack'), ('status', 'status')
+        )
+        for field, option in filters:
+            if options[option]:
+                books = books.filter(**{field: options[option]})
+
+        total = books.count()
+        if not total:
+            raise CommandError('No books match the given filters.')
+
+        base_url = options['base_url'].rstrip('/')
+        rows = books.values_list('id', 'title', 'barcode')
+        labels = (
+            (f"{base_url}{reverse('view_book_detail', args=[book_id])}",
+             f'{barcode} {title}')
+            for book_id, title, barcode in rows.iterator(chunk_size=2000)
+        )
+
+        output = options['output']
+        as_pdf = output.lower().endswith('.pdf')
+        if not as_pdf:
+            os.makedirs(output, exist_ok=True)
+
+        per_page = options['columns'] * options['rows']
+        pages_total = -(-total // per_page)
+        started = time.perf_counter()
+        workers = options['workers'] or settings.QR_LABEL_WORKERS or None
+        sheets = iter_label_sheets(
+            labels, options['columns'], options['rows'], workers
+        )
+
+        pages_written = 0
+        for pages_written, png in enumerate(sheets, start=1):
+            if as_pdf:
+                # Pillow appends each page as an incremental update, so the
+                # document never has to be held in memory.
+                Image.open(BytesIO(png)).save(
+                    output, 'PDF', resolution=DPI, append=pages_written > 1
+                )
+            else:
+                name = f'labels-{pages_written:04d}.png'
+                with open(os.path.join(output, name), 'wb') as page:
+                    page.write(png)
+            self.stdout.write(
+                f'Page {pages_written}/{pages_total}', ending='\r'
+            )
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'\nWrote {total} labels on {pages_written} pages to {output} '
+            f'in {elapsed:.1f}s.'
+        ))
@@ -0,0 +1,81 @@
+"""Management command to bulk import a catalogue from CSV or MARC21."""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library.catalog import (
+    CatalogError, Checkpoint, import_rows, read_catalog,
+)
+from library.utils import STALE_SERVER_WARNING, cache_is_shared
+
+
+class Command(BaseCommand):
+    help = ('Import books from a CSV or MARC21 file in batches, deduplicating '
+            'by ISBN and barcode')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path',
+                            help='CSV file (Book field names as headers) or '
+                                 'MARC21 .mrc file')
+        parser.add_argument('--format', choices=['csv', 'marc'], default=None,
+                            help='Input format (default: from the file '
+                                 'extension)')
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Records looked up and written per '
+                                 'transaction')
+        parser.add_argument('--update', action='store_true',
+                            help='Update books whose ISBN already exists '
+                                 'instead of skipping them')
+        parser.add_argument('--resume', action='store_true',
+                            help='Continue after the last committed batch of '
+                                 'an interrupted import')
+        parser.add_argument('--checkpoint', default=None,
+                            help='Checkpoint file (default: '
+                                 '<path>.import-state)')
+
+    def handle(self, *args, **options):
+        """Stream the file into the catalogue, checkpointing every batch."""
+        try:
+            checkpoint = Checkpoint(options['path'], options['checkpoint'])
+        except OSError as exc:
+            raise CommandError(str(exc))
+
+        skip = checkpoint.load() if options['resume'] else 0
+        if skip:
+            self.stdout.write(f'Resuming after record {skip}.')
+
+        started = time.perf_counter()
+
+        def progress(records, stats):
+            checkpoint.save(records)
+            rate = (records - skip) / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(
+                f"{records} records, {stats['created']} created, "
+                f"{stats['updated']} updated ({rate:,.0f} records/s)",
+                ending='\r',
+            )
+
+        try:
+            stats = import_rows(
+                read_catalog(options['path'], options['format']),
+                batch_size=options['batch_size'], update=options['update'],
+                skip=skip, on_batch=progress,
+            )
+        except CatalogError as exc:
+            raise CommandError(
+                f'{exc} (rerun with --resume to continue after the last '
+                'committed batch)'
+            )
+
+        checkpoint.clear()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"\nImported {stats['records'] - skip} records in {elapsed:.1f}s: "
+            f"{stats['created']} created, {stats['updated']} updated, "
+            f"{stats['unchanged']} unchanged, "
+            f"{stats['duplicate']} duplicates, "
+            f"{stats['conflict']} barcode conflicts, "
+            f"{stats['invalid']} invalid."
+        ))
+        if (stats['created'] or stats['updated']) and not cache_is_shared():
+            self.stdout.write(self.style.WARNING(STALE_SERVER_WARNING))
@@ -0,0 +1,130 @@
+"""Management command to run the load-test scenarios and report latency."""
+from io import StringIO
+import json
+import os
+import tempfile
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment,
+)
+
+from library.loadtest import (
+    ClientTransport, HTTPTransport, LocalOnlyError, check_local,
+    load_workload, run_load,
+)
+from library.models import User, UserRole
+
+
+class Command(BaseCommand):
+    help = ('Drive the app with weighted student/librarian scenarios and '
+            'report throughput and latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url',
+                            help='Local server to load '
+                                 '(e.g. http://127.0.0.1:8000); by default '
+                                 'requests run in-process on a temporary '
+                                 'database')
+        parser.add_argument('--users', type=int, default=10,
+                            help='Concurrent virtual users')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='Seconds to run')
+        parser.add_argument('--think-time', type=float, default=0.5,
+                            help='Maximum random pause between tasks, '
+                                 'in seconds')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--scale', type=float, default=0.05,
+                            help='generate_dataset scale for the in-process '
+                                 'database')
+        parser.add_argument('--prefix', default='load',
+                            help='Username/ISBN prefix of the accounts and '
+                                 'books to use (with --url)')
+        parser.add_argument('--password', default='password',
+                            help='Password of those accounts '
+                                 '(generate_dataset uses "password")')
+        parser.add_argument('--json', dest='json_path',
+                            help='Also write the report to this file')
+
+    def handle(self, *args, **options):
+        """Run against a local server, or in-process on a throwaway DB."""
+        prefix = options['prefix']
+        if options['url']:
+            try:
+                check_local(options['url'])
+            except LocalOnlyError as exc:
+                raise CommandError(str(exc))
+            workload = load_workload(prefix, options['password'])
+            if not workload.students:
+                raise CommandError(
+                    f'No users with prefix "{prefix}"; create them with '
+                    f'`manage.py generate_dataset --prefix {prefix}`.'
+                )
+            stats = self.run(
+                lambda: HTTPTransport(options['url']), workload, options
+            )
+        else:
+            stats = self.run_in_process(options)
+
+        rows = stats.rows()
+        self.stdout.write(
+            f"{'endpoint':<22} {'requests':>9} {'fail %':>7} {'req/s':>8} "
+            f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for row in rows:
+            self.stdout.write(
+                f"{row['name']:<22} {row['requests']:>9} "
+                f"{row['error_rate']:>7.1%} {row['rps']:>8.1f} "
+                f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} "
+                f"{row['p99_ms']:>8.1f}"
+            )
+        if stats.errors:
+            self.stdout.write(self.style.WARNING(
+                f'{len(stats.errors)} virtual users stopped early; '
+                f'first error: {stats.errors[0]!r}'
+            ))
+        if options['json_path']:
+            with open(options['json_path'], 'w') as handle:
+                json.dump(rows, handle, indent=2)
+
+    def run(self, transport_factory, workload, options):
+        self.stdout.write(
+            f"{options['users']} users for {options['duration']:g}s "
+            f"({len(workload.students)} students, "
+            f"{len(workload.librarians)} librarians available)"
+        )
+        return run_load(
+            transport_factory, workload, users=options['users'],
+            duration=options['duration'], think_time=options['think_time'],
+            seed=options['seed'],
+        )
+
+    def run_in_process(self, options):
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        directory = None
+        if connection.vendor == 'sqlite':
+            # A file rather than shared-cache memory, so concurrent users
+            # get normal SQLite locking
+            directory = tempfile.mkdtemp()
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = (
+                os.path.join(directory, 'load_test.sqlite3')
+            )
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False
+        )
+        try:
+            cache.clear()
+            call_command('generate_dataset', scale=options['scale'],
+                         seed=options['seed'], prefix='load',
+                         stdout=StringIO())
+            User.objects.create_user('load-librarian', role=UserRole.LIBRARIAN)
+            return self.run(ClientTransport, load_workload('load'), options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if directory:
+                os.rmdir(directory)
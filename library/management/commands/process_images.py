@@ -0,0 +1,89 @@
+"""Management command to backfill resized variants for existing images."""
+from concurrent.futures import ProcessPoolExecutor
+import os
+import time
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from library.images import render_variants, store_variants
+from library.models import Book, User
+
+TARGETS = {
+    'books': (Book, 'cover_image', 'cover_variants_source'),
+    'users': (User, 'profile_image', 'profile_image_variants_source'),
+}
+
+
+def _read(name):
+    with default_storage.open(name, 'rb') as handle:
+        return handle.read()
+
+
+class Command(BaseCommand):
+    help = ('Render WebP/JPEG variants for cover and profile images that '
+            'do not have them yet')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=sorted(TARGETS),
+                            help='Process only books or only users')
+        parser.add_argument('--all', action='store_true',
+                            help='Re-render images that already have variants')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Rendering processes (default: CPU count)')
+
+    def handle(self, *args, **options):
+        """Render in a process pool and store results as they complete."""
+        workers = options['workers'] or os.cpu_count() or 1
+        variants, quality = settings.IMAGE_VARIANTS, settings.IMAGE_QUALITY
+        started = time.perf_counter()
+        done = failed = 0
+
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for label, (model, field, source_field) in TARGETS.items():
+                if options['only'] and options['only'] != label:
+                    continue
+                rows = model.objects.exclude(**{field: ''}).exclude(
+                    **{f'{field}__isnull': True}
+                )
+                if not options['all']:
+                    rows = rows.exclude(**{source_field: F(field)})
+                pending = list(rows.values_list('pk', field))
+
+                # Keep at most 2 images per worker in flight so memory stays
+                # bounded
+                window = 2 * workers
+                for start in range(0, len(pending), window):
+                    chunk = pending[start:start + window]
+                    futures = []
+                    for pk, name in chunk:
+                        try:
+                            future = pool.submit(render_variants, _read(name),
+                                                 variants, quality)
+                            futures.append((pk, name, future))
+                        except OSError as exc:
+                            failed += 1
+                            self.stderr.write(f'{name}: {exc}')
+                    for pk, name, future in futures:
+                        try:
+                            store_variants(name, future.result())
+                        except Exception as exc:
+                            failed += 1
+                            self.stderr.write(f'{name}: {exc}')
+                            continue
+                        model.objects.filter(pk=pk, **{field: name}).update(
+                            **{source_field: name}
+                        )
+                        done += 1
+                    progress = min(start + window, len(pending))
+                    self.stdout.write(f'{label}: {progress}/{len(pending)}',
+                                      ending='\r')
+                self.stdout.write('')
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Rendered variants for {done} images ({failed} failed) '
+            f'in {elapsed:.1f}s.'
+        ))
@@ -0,0 +1,50 @@
+"""Management command to delete expired notifications in bounded batches."""
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from library.models import Notification
+
+
+class Command(BaseCommand):
+    help = ('Delete expired notifications in small batches to avoid long '
+            'table locks')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows deleted per transaction')
+        parser.add_argument('--sleep', type=float, default=0.0,
+                            help='Seconds to pause between batches')
+
+    def handle(self, *args, **options):
+        """Delete expired notifications one batch at a time."""
+        batch_size = options['batch_size']
+        pause = options['sleep']
+        cutoff = timezone.now()
+        total = 0
+
+        while True:
+            # Select a bounded set of ids through the expires_at index, then
+            # delete by primary key so each transaction stays short.
+            with transaction.atomic():
+                ids = list(
+                    Notification.objects.filter(expires_at__lt=cutoff)
+                    .order_by('expires_at')
+                    .values_list('pk', flat=True)[:batch_size]
+                )
+                if not ids:
+                    break
+                deleted, _ = Notification.objects.filter(pk__in=ids).delete()
+
+            total += deleted
+            self.stdout.write(
+                f'Deleted {deleted} expired notifications ({total} total)'
+            )
+            if pause:
+                time.sleep(pause)
+
+        self.stdout.write(
+            self.style.SUCCESS(f'Purged {total} expired notifications.')
+        )
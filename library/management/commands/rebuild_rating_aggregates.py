@@ -0,0 +1,82 @@
+"""Management command to recompute book rating aggregates from reviews."""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+STARS = range(1, 6)
+AGGREGATE_FIELDS = ['rating_sum', 'rating_count', 'average_rating'] + [
+    f'rating_{star}_count' for star in STARS
+]
+
+
+def rebuild(book_model, review_model, batch_size=1000):
+    """Recompute every book's rating aggregates; return how many were fixed.
+
+    Takes the models as arguments so data migrations can pass historical ones.
+    """
+    totals = {
+        row['book_id']: row
+        for row in review_model.objects.order_by().values('book_id').annotate(
+            rating_sum=Sum('rating'),
+            rating_count=Count('id'),
+            **{
+                f'rating_{star}_count': Count('id', filter=Q(rating=star))
+                for star in STARS
+            }
+        )
+    }
+
+    changed = []
+    fixed = 0
+    books = book_model.objects.filter(
+        Q(pk__in=totals) | Q(rating_count__gt=0) | Q(average_rating__gt=0)
+    ).only('pk', *AGGREGATE_FIELDS)
+    for book in books.iterator(chunk_size=batch_size):
+        row = totals.get(book.pk, {})
+        values = {
+            field: row.get(field, 0)
+            for field in AGGREGATE_FIELDS if field != 'average_rating'
+        }
+        count = values['rating_count']
+        values['average_rating'] = (
+            round(values['rating_sum'] / count, 2) if count else 0.0
+        )
+        if any(
+            getattr(book, field) != value for field, value in values.items()
+        ):
+            for field, value in values.items():
+                setattr(book, field, value)
+            changed.append(book)
+
+        if len(changed) >= batch_size:
+            book_model.objects.bulk_update(changed, AGGREGATE_FIELDS)
+            fixed += len(changed)
+            changed = []
+
+    if changed:
+        book_model.objects.bulk_update(changed, AGGREGATE_FIELDS)
+        fixed += len(changed)
+    return fixed
+
+
+class Command(BaseCommand):
+    help = ('Recompute rating sums, counts and histograms from reviews to '
+            'fix drift')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of books written per bulk update')
+
+    def handle(self, *args, **options):
+        """Rebuild aggregates inside one transaction."""
+        from library.models import Book, Review
+        from library.recommendations import genre_pools
+
+        with transaction.atomic():
+            fixed = rebuild(Book, Review, options['batch_size'])
+        if fixed:
+            # bulk_update bypasses the signals that refresh the pools
+            genre_pools.invalidate()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt rating aggregates for {fixed} books.'
+        ))
@@ -0,0 +1,34 @@
+"""Management command to rebuild "readers also borrowed" neighbours."""
+import time
+
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ('Recompute item-item book neighbours from borrowing and review '
+            'history')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Recompute every book instead of only those '
+                                 'affected since the last build')
+        parser.add_argument('--neighbors', type=int, default=None,
+                            help='Neighbours kept per book (default: '
+                                 'RECOMMENDATION_NEIGHBORS)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of rows written per bulk insert')
+
+    def handle(self, *args, **options):
+        from library.recommendations import SCIPY_AVAILABLE, rebuild_neighbors
+
+        started = time.perf_counter()
+        refreshed = rebuild_neighbors(
+            full=options['full'], k=options['neighbors'],
+            batch_size=options['batch_size'],
+        )
+        elapsed = time.perf_counter() - started
+        engine = 'scipy' if SCIPY_AVAILABLE else 'python'
+        self.stdout.write(self.style.SUCCESS(
+            f'Refreshed neighbours for {refreshed} books in {elapsed:.2f}s '
+            f'({engine}).'
+        ))
@@ -0,0 +1,71 @@
+"""Management command to fold pending notifications into daily digests."""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max, Sum
+from django.utils import timezone
+
+from library.models import Notification, NotificationDelivery
+from library.utils import push_notification
+
+
+class Command(BaseCommand):
+    help = 'Render one digest notification per user on daily digest delivery'
+
+    def handle(self, *args, **options):
+        """Build digest rows for all opted-in users in a few bulk queries."""
+        pending = Notification.objects.filter(
+            user__notification_delivery=NotificationDelivery.DAILY,
+            is_read=False,
+        ).exclude(type='digest')
+
+        with transaction.atomic():
+            # Freeze the batch so rows arriving mid-run go into tomorrow's
+            # digest.
+            last_id = pending.aggregate(last_id=Max('id'))['last_id']
+            if last_id is None:
+                self.stdout.write(
+                    self.style.SUCCESS('No pending notifications.')
+                )
+                return
+            pending = pending.filter(id__lte=last_id)
+
+            summary = defaultdict(list)
+            totals = defaultdict(int)
+            type_labels = dict(Notification.TYPE_CHOICES)
+            rows = (
+                pending.values('user_id', 'type')
+                .annotate(total=Sum('count'))
+                .order_by('user_id', 'type')
+            )
+            for row in rows:
+                label = type_labels.get(row['type'], row['type'])
+                summary[row['user_id']].append(f"{row['total']} × {label}")
+                totals[row['user_id']] += row['total']
+
+            now = timezone.now()
+            digests = Notification.objects.bulk_create([
+                Notification(
+                    user_id=user_id,
+                    title='Your daily library digest',
+                    message='\n'.join(lines),
+                    type='digest',
+                    count=totals[user_id],
+                    expires_at=now + timedelta(days=7),
+                )
+                for user_id, lines in summary.items()
+            ])
+
+            # The originals are now represented by the digest rows.
+            folded = pending.update(is_read=True)
+
+            for digest in digests:
+                transaction.on_commit(
+                    lambda digest=digest: push_notification(digest)
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {len(digests)} digests covering {folded} notifications.'
+        ))
@@ -0,0 +1,281 @@
+"""Per-view request metrics in Prometheus text format.
+
+``RequestMetricsMiddleware`` records each request's latency and status under
+its URL name. One request in ``1 / METRICS_SAMPLE_RATE`` also runs with a
+database execute wrapper, which counts its queries and the time spent in
+them. Only those sampled requests pay the wrapper's overhead. Cache hits and
+misses are counted for every ``get`` on the configured caches.
+
+The middleware is sync- and async-capable, so under ASGI it does not force
+Django to run the chain, and async views such as the event stream, in
+threads. Async requests record latency and status only: their database work
+runs in ``sync_to_async`` threads that this coroutine cannot wrap.
+Streaming responses are counted but not timed, as the middleware only sees
+the time to their headers.
+
+Counters live in the process, like the WebSocket counters in ``consumers``.
+Scrape every worker, or run one worker per target. ``/metrics`` is open to
+staff users and to addresses in ``METRICS_ALLOWED_IPS``. The address check
+uses ``REMOTE_ADDR`` and never ``X-Forwarded-For``. Behind a proxy, list only
+the scraper's own address.
+"""
+from bisect import bisect_left
+from contextlib import ExitStack
+import ipaddress
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_MISSING = object()
+
+
+class Histogram:
+    """Cumulative-bucket histogram.
+
+    ``counts[i]`` holds observations <= ``buckets[i]``.
+    """
+
+    __slots__ = ('buckets', 'counts', 'total', 'count')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class Registry:
+    """All metrics of this process, keyed by label tuples."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}  # (view, method, status) -> count
+            self.latency = {}  # (view, method) -> Histogram
+            # view -> Histogram of queries per sampled request
+            self.queries = {}
+            # view -> seconds in the database over sampled requests
+            self.db_seconds = {}
+            self.cache = {}  # (alias, 'hit' | 'miss') -> count
+
+    def observe_request(self, view, method, status, seconds, queries=None,
+                        db_seconds=0.0):
+        with self.lock:
+            key = (view, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if seconds is not None:
+                histogram = self.latency.get((view, method))
+                if histogram is None:
+                    histogram = self.latency[view, method] = Histogram(
+                        LATENCY_BUCKETS
+                    )
+                histogram.observe(seconds)
+            if queries is not None:
+                histogram = self.queries.get(view)
+                if histogram is None:
+                    histogram = self.queries[view] = Histogram(QUERY_BUCKETS)
+                histogram.observe(queries)
+                self.db_seconds[view] = (
+                    self.db_seconds.get(view, 0.0) + db_seconds
+                )
+
+    def observe_cache(self, alias, outcome):
+        with self.lock:
+            key = (alias, outcome)
+            self.cache[key] = self.cache.get(key, 0) + 1
+
+    def render(self):
+        """Render every metric in the Prometheus text format (0.0.4)."""
+        with self.lock:
+            lines = [
+                '# HELP smartlib_requests_total '
+                'HTTP requests by view, method and status.',
+                '# TYPE smartlib_requests_total counter',
+            ]
+            for (view, method, status), count in sorted(self.requests.items()):
+                labels = _labels(view=view, method=method, status=status)
+                lines.append(f'smartlib_requests_total{labels} {count}')
+            lines += [
+                '# HELP smartlib_request_duration_seconds '
+                'Time spent handling requests.',
+                '# TYPE smartlib_request_duration_seconds histogram',
+            ]
+            for (view, method), histogram in sorted(self.latency.items()):
+                lines += _histogram_lines(
+                    'smartlib_request_duration_seconds', histogram,
+                    view=view, method=method,
+                )
+            lines += [
+                '# HELP smartlib_request_queries '
+                'Database queries per sampled request.',
+                '# TYPE smartlib_request_queries histogram',
+            ]
+            for view, histogram in sorted(self.queries.items()):
+                lines += _histogram_lines(
+                    'smartlib_request_queries', histogram, view=view
+                )
+            lines += [
+                '# HELP smartlib_db_seconds_total '
+                'Time spent in database queries by sampled requests.',
+                '# TYPE smartlib_db_seconds_total counter',
+            ]
+            for view, seconds in sorted(self.db_seconds.items()):
+                lines.append(
+                    f'smartlib_db_seconds_total{_labels(view=view)} '
+                    f'{seconds:.6f}'
+                )
+            lines += [
+                '# HELP smartlib_cache_requests_total '
+                'Cache lookups by result.',
+                '# TYPE smartlib_cache_requests_total counter',
+            ]
+            for (alias, outcome), count in sorted(self.cache.items()):
+                labels = _labels(cache=alias, result=outcome)
+                lines.append(f'smartlib_cache_requests_total{labels} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return (
+        str(value).replace('\\', '\\\\').replace('\n', '\\n')
+        .replace('"', '\\"')
+    )
+
+
+def _labels(**labels):
+    return '{' + ','.join(
+        f'{name}="{_escape(value)}"' for name, value in labels.items()
+    ) + '}'
+
+
+def _histogram_lines(name, histogram, **labels):
+    lines = []
+    cumulative = 0
+    for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+        cumulative += count
+        lines.append(
+            f'{name}_bucket{_labels(**labels, le=bound)} {cumulative}'
+        )
+    lines.append(f'{name}_sum{_labels(**labels)} {histogram.total}')
+    lines.append(f'{name}_count{_labels(**labels)} {histogram.count}')
+    return lines
+
+
+registry = Registry()
+
+
+class QueryTimer:
+    """Database execute wrapper that counts queries and their total time."""
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def instrument_cache(alias, backend):
+    """Count hits and misses of ``backend.get`` (and anything built on it)."""
+    if getattr(backend, '_metrics_alias', None):
+        return
+    get = backend.get
+
+    def counted_get(key, default=None, version=None):
+        value = get(key, _MISSING, version=version)
+        if value is _MISSING:
+            registry.observe_cache(alias, 'miss')
+            return default
+        registry.observe_cache(alias, 'hit')
+        return value
+
+    backend.get = counted_get
+    backend._metrics_alias = alias
+
+
+def instrument_caches():
+    """Count lookups on every configured cache of the current thread."""
+    # Cache backends are created per thread, so wrap whichever this one has
+    for alias in settings.CACHES:
+        instrument_cache(alias, caches[alias])
+
+
+class RequestMetricsMiddleware:
+    """Record latency, status, sampled query counts and DB time per request."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        instrument_caches()
+        sampled = random.random() < settings.METRICS_SAMPLE_RATE
+        timer = QueryTimer() if sampled else None
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            if timer is not None:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        self.record(request, response, started, timer)
+        return response
+
+    async def __acall__(self, request):
+        instrument_caches()
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.record(request, response, started)
+        return response
+
+    def record(self, request, response, started, timer=None):
+        elapsed = None if response.streaming else time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unmatched'
+        registry.observe_request(
+            view, request.method, response.status_code, elapsed,
+            queries=timer.queries if timer else None,
+            db_seconds=timer.seconds if timer else 0.0,
+        )
+
+
+def is_metrics_client(request):
+    """Staff users and allow-listed addresses may read ``/metrics``."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(
+        address in ipaddress.ip_network(network, strict=False)
+        for network in settings.METRICS_ALLOWED_IPS
+    )
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.12 on 2026-10-19 02:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0002_alter_user_managers_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='count',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='notification_delivery',
+            field=models.CharField(choices=[('instant', 'Instant'), ('daily', 'Daily digest')], default='instant', max_length=20),
+        ),
+        migrations.AlterField(
+            model_name='notification',
+            name='type',
+            field=models.CharField(choices=[('overdue', 'Overdue'), ('available', 'Available'), ('reminder', 'Reminder'), ('borrow', 'Borrow'), ('reservation', 'Reservation'), ('info', 'Info'), ('digest', 'Digest')], default='info', max_length=50),
+        ),
+    ]
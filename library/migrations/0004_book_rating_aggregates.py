@@ -0,0 +1,54 @@
+# Generated by Django 4.2.12 on 2026-10-19 02:23
+
+from django.db import migrations, models
+
+
+def populate_rating_aggregates(apps, schema_editor):
+    from library.management.commands.rebuild_rating_aggregates import rebuild
+    rebuild(apps.get_model('library', 'Book'), apps.get_model('library', 'Review'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0003_notification_coalescing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='rating_1_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_2_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_3_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_4_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_5_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.12 on 2026-10-19 02:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0004_book_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='review',
+            name='library_rev_book_id_5fdd06_idx',
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', '-helpful_count', '-created_at'], name='library_rev_book_id_91a330_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', '-created_at'], name='library_rev_book_id_2a2ee6_idx'),
+        ),
+    ]
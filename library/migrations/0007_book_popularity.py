@@ -0,0 +1,18 @@
+# Generated by Django 4.2.12 on 2026-10-19 02:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0006_book_neighbors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='popularity',
+            field=models.FloatField(db_index=True, default=0.0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.12 on 2026-10-19 02:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0007_book_popularity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_variants_source',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='profile_image_variants_source',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.12 on 2026-10-19 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PopularityDecay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('decayed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
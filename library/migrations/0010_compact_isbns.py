@@ -0,0 +1,31 @@
+# Generated by Django 4.2.12 on 2026-10-19 03:50
+
+import re
+
+from django.db import migrations
+
+ISBN_PATTERN = re.compile(r'\d{9}[\dX]|\d{13}')
+
+
+def compact_isbns(apps, schema_editor):
+    """Store hyphenated ISBNs without punctuation, as imports look them up.
+
+    A book whose compact ISBN already belongs to another book keeps its
+    hyphenated ISBN so the duplicate can be merged by hand.
+    """
+    Book = apps.get_model('library', 'Book')
+    for pk, isbn in Book.objects.filter(isbn__regex=r'[\s-]').values_list('pk', 'isbn'):
+        compact = re.sub(r'[\s-]', '', isbn.strip()).upper()
+        if ISBN_PATTERN.fullmatch(compact) and not Book.objects.filter(isbn=compact).exists():
+            Book.objects.filter(pk=pk).update(isbn=compact)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0009_popularity_decay'),
+    ]
+
+    operations = [
+        migrations.RunPython(compact_isbns, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.12 on 2026-10-19 03:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library', '0010_compact_isbns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='coalesce_key',
+            field=models.CharField(
+                blank=True, editable=False, max_length=20, null=True
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(
+                condition=models.Q(('is_read', False)),
+                fields=('user', 'type', 'coalesce_key'),
+                name='unique_unread_notification_window',
+            ),
+        ),
+    ]
@@ -3,11 +3,17 @@ Models for the smart library management system.
 """
 
 from django.db import models
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast, Coalesce, NullIf, Round
+from django.db.models.lookups import LessThan
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 from datetime import datetime, timedelta
 from django.utils import timezone
 import enum
+import re
+
+ISBN_PATTERN = re.compile(r'\d{9}[\dX]|\d{13}')
 
 
 class UserRole(models.TextChoices):
@@ -24,8 +30,68 @@ class BookStatus(models.TextChoices):
     MAINTENANCE = 'maintenance', 'Maintenance'
 
 
-class User(AbstractUser):
+class NotificationDelivery(models.TextChoices):
+    INSTANT = 'instant', 'Instant'
+    DAILY = 'daily', 'Daily digest'
+
+
+def compact_isbn(value):
+    """Compact an ISBN: "978-0-14-044913-6 (pbk.)" -> "9780140449136".
+
+    Hyphens, spaces and a trailing qualifier in parentheses are dropped.
+    Values that are not ISBN-10 or ISBN-13 numbers are only trimmed.
+    """
+    value = (value or '').strip()
+    compact = re.sub(r'[\s-]', '', re.sub(r'\(.*\)$', '', value)).upper()
+    return compact if ISBN_PATTERN.fullmatch(compact) else value
+
+
+class TrackedFieldsMixin:
+    """Remember the stored values of ``tracked_fields``.
+
+    Signal handlers use ``has_changed`` to skip work when a save did not
+    touch the fields they care about, such as a borrow updating a book's
+    copies.
+    """
+    tracked_fields = ()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = instance._tracked_values()
+        return instance
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._loaded_values = self._tracked_values()
+
+    def _tracked_values(self):
+        values = {}
+        for name in self.tracked_fields:
+            value = self.__dict__.get(name)
+            values[name] = getattr(value, 'name', value)  # files by name
+        return values
+
+    def loaded_value(self, name):
+        """The stored value of a tracked field, or None for new instances."""
+        return getattr(self, '_loaded_values', {}).get(name)
+
+    def has_changed(self, *names):
+        """True if any of ``names`` differs from the stored value.
+
+        Instances that were not loaded from the database count as changed.
+        """
+        loaded = getattr(self, '_loaded_values', None)
+        if loaded is None:
+            return True
+        current = self._tracked_values()
+        return any(loaded.get(name) != current.get(name) for name in names)
+
+
+class User(TrackedFieldsMixin, AbstractUser):
     """Extended User model for library members and staff"""
+    tracked_fields = ('profile_image',)  # image variants
+
     role = models.CharField(
         max_length=20,
         choices=UserRole.choices,
@@ -34,6 +100,15 @@ class User(AbstractUser):
     roll_number = models.CharField(max_length=50, blank=True, null=True)  # For students
     phone = models.CharField(max_length=15, blank=True, null=True)
     profile_image = models.ImageField(upload_to='profiles/', blank=True, null=True)
+    # See library.images
+    profile_image_variants_source = models.CharField(
+        max_length=255, blank=True
+    )
+    notification_delivery = models.CharField(
+        max_length=20,
+        choices=NotificationDelivery.choices,
+        default=NotificationDelivery.INSTANT
+    )
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -63,8 +138,14 @@ class User(AbstractUser):
         return any(b.is_overdue() for b in active)
 
 
-class Book(models.Model):
+class Book(TrackedFieldsMixin, models.Model):
     """Enhanced Book model"""
+    tracked_fields = (
+        'barcode', 'rack_no', 'shelf_no',  # rack index
+        'title', 'author', 'genre', 'status', 'average_rating',  # genre pools
+        'cover_image',  # image variants
+    )
+
     title = models.CharField(max_length=200, db_index=True)
     author = models.CharField(max_length=200)
     isbn = models.CharField(max_length=20, unique=True)
@@ -81,6 +162,8 @@ class Book(models.Model):
 
     # Book cover
     cover_image = models.ImageField(upload_to='book_covers/', blank=True, null=True)
+    # See library.images
+    cover_variants_source = models.CharField(max_length=255, blank=True)
 
     # Status tracking
     status = models.CharField(
@@ -91,11 +174,23 @@ class Book(models.Model):
     total_copies = models.IntegerField(default=1, validators=[MinValueValidator(1)])
     available_copies = models.IntegerField(default=1, validators=[MinValueValidator(0)])
 
-    # Ratings and reviews
+    # Ratings and reviews (maintained incrementally, see
+    # adjust_rating_aggregates)
     average_rating = models.FloatField(
         default=0.0,
         validators=[MinValueValidator(0.0), MaxValueValidator(5.0)]
     )
+    rating_sum = models.IntegerField(default=0)
+    rating_count = models.IntegerField(default=0)
+    rating_1_count = models.IntegerField(default=0)
+    rating_2_count = models.IntegerField(default=0)
+    rating_3_count = models.IntegerField(default=0)
+    rating_4_count = models.IntegerField(default=0)
+    rating_5_count = models.IntegerField(default=0)
+
+    # Exponentially decayed borrow/view/reserve score (see bump_popularity,
+    # decay_popularity)
+    popularity = models.FloatField(default=0.0, db_index=True)
 
     # Metadata
     added_at = models.DateTimeField(auto_now_add=True)
@@ -114,6 +209,10 @@ class Book(models.Model):
     def __str__(self):
         return self.title
 
+    def clean(self):
+        # Store ISBNs in one form so imports and forms find the same book
+        self.isbn = compact_isbn(self.isbn)
+
     def is_available(self):
         """Check if book has available copies"""
         return self.available_copies > 0
@@ -127,6 +226,74 @@ class Book(models.Model):
         """Get borrowing history"""
         return self.borrowings.order_by('-borrowed_at')[:limit]
 
+    def rating_histogram(self):
+        """Get the number of reviews for each star rating"""
+        return {
+            star: getattr(self, f'rating_{star}_count') for star in range(1, 6)
+        }
+
+    @classmethod
+    def adjust_rating_aggregates(cls, book_id, added=None, removed=None):
+        """Apply a review rating change with a single UPDATE.
+
+        ``added`` and ``removed`` are the star ratings entering and leaving the
+        book's aggregates (both set when a review's rating is edited).
+        """
+        sum_delta = (added or 0) - (removed or 0)
+        count_delta = (added is not None) - (removed is not None)
+        updates = {}
+        if added is not None:
+            updates[f'rating_{added}_count'] = F(f'rating_{added}_count') + 1
+        if removed is not None:
+            field = f'rating_{removed}_count'
+            updates[field] = updates.get(field, F(field)) - 1
+
+        new_sum = F('rating_sum') + sum_delta
+        new_count = F('rating_count') + count_delta
+        updates.update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            average_rating=Coalesce(
+                Round(Cast(new_sum, FloatField()) / NullIf(new_count, 0), 2),
+                Value(0.0)
+            ),
+        )
+        return cls.objects.filter(pk=book_id).update(**updates)
+
+    @classmethod
+    def bump_popularity(cls, weights):
+        """Add ``{book_id: weight}`` to popularity scores in one UPDATE."""
+        if not weights:
+            return 0
+        return cls.objects.filter(pk__in=weights).update(
+            popularity=F('popularity') + Case(
+                *(When(pk=book_id, then=Value(weight))
+                  for book_id, weight in weights.items()),
+                default=Value(0.0),
+            )
+        )
+
+    @classmethod
+    def decay_popularity(cls, factor, floor=0.01):
+        """Scale every popularity score by ``factor`` in one UPDATE.
+
+        Scores that would drop below ``floor`` are reset to zero so idle books
+        stop being rewritten on every decay.
+        """
+        decayed = F('popularity') * factor
+        return cls.objects.filter(popularity__gt=0).update(popularity=Case(
+            When(LessThan(decayed, floor), then=Value(0.0)),
+            default=decayed,
+        ))
+
+
+class PopularityDecay(models.Model):
+    """When ``decay_popularity`` last ran (a single row)"""
+    decayed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Popularity decayed at {self.decayed_at}"
+
 
 class Borrowing(models.Model):
     """Track book borrowing and returns"""
@@ -204,13 +371,42 @@ class Review(models.Model):
         ordering = ['-created_at']
         unique_together = ('user', 'book')
         indexes = [
-            models.Index(fields=['book']),
+            models.Index(fields=['book', '-helpful_count', '-created_at']),
+            models.Index(fields=['book', '-created_at']),
             models.Index(fields=['user']),
         ]
 
     def __str__(self):
         return f"{self.user.username} - {self.book.title} ({self.rating}⭐)"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rating so edits can adjust the book aggregates
+        instance._loaded_rating = instance.__dict__.get('rating')
+        return instance
+
+
+class BookNeighbor(models.Model):
+    """Precomputed "readers also borrowed" neighbours (see recommendations)"""
+    book = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name='neighbors'
+    )
+    neighbor = models.ForeignKey(
+        Book, on_delete=models.CASCADE, related_name='+'
+    )
+    rank = models.PositiveSmallIntegerField()
+    # Cosine similarity of the two books' reader sets
+    score = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['book', 'rank']
+        unique_together = ('book', 'rank')
+
+    def __str__(self):
+        return f"{self.book_id} -> {self.neighbor_id} ({self.score:.3f})"
+
 
 class ActivityLog(models.Model):
     """Track all library activities for analytics"""
@@ -256,6 +452,7 @@ class Notification(models.Model):
         ('borrow', 'Borrow'),
         ('reservation', 'Reservation'),
         ('info', 'Info'),
+        ('digest', 'Digest'),
     ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -263,6 +460,12 @@ class Notification(models.Model):
     message = models.TextField()
     type = models.CharField(max_length=50, choices=TYPE_CHOICES, default='info')
     is_read = models.BooleanField(default=False)
+    # Number of events coalesced into this row
+    count = models.PositiveIntegerField(default=1)
+    # Coalescing window the row belongs to; unread rows are unique per window
+    coalesce_key = models.CharField(
+        max_length=20, null=True, blank=True, editable=False
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
 
@@ -272,6 +475,13 @@ class Notification(models.Model):
             models.Index(fields=['user', 'is_read']),
             models.Index(fields=['expires_at']),
         ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'type', 'coalesce_key'],
+                condition=models.Q(is_read=False),
+                name='unique_unread_notification_window',
+            ),
+        ]
 
     def __str__(self):
         return self.title
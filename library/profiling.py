@@ -0,0 +1,196 @@
+"""cProfile profiles of sampled production requests.
+
+``ProfilingMiddleware`` runs a ``PROFILING_SAMPLE_RATE`` share of requests
+under cProfile. It also profiles any request from a librarian, admin or staff
+user that sends ``X-Profile: 1``. The profile covers the view, template
+rendering done inside it and database calls, but not other middleware.
+Each profile is written to ``PROFILING_DIR`` as a ``.prof`` file in pstats
+format, which snakeviz, flameprof and gprof2dot can read. A ``.json`` file
+next to it holds the request details. When the directory grows past
+``PROFILING_MAX_BYTES``, the oldest profiles are deleted.
+
+cProfile can only trace one request per process at a time. A sampled request
+that arrives while another is being profiled runs normally.
+
+cProfile also only sees the thread it runs in. The middleware is sync- and
+async-capable and profiles sync views from ``process_view``, which runs in
+the view's thread under WSGI and ASGI alike. It skips async views, such as
+the event stream, and streaming responses, whose bodies are produced after
+the view returns. Work handed to thread or process pools (barcode scans,
+rack audits, label sheets, image variants) shows up only as time spent
+waiting on the pool.
+"""
+import cProfile
+from contextlib import ExitStack
+from io import StringIO
+import json
+from pathlib import Path
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+from .metrics import QueryTimer
+from .models import UserRole
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+NAME_PATTERN = re.compile(r'^\d+-[0-9a-f]{8}$')
+
+_profiling = threading.Lock()
+
+
+def can_request_profile(user):
+    """Users who may ask for a profile with the ``X-Profile`` header."""
+    return user.is_authenticated and (
+        user.is_staff or user.role != UserRole.STUDENT
+    )
+
+
+def profile_dir():
+    return Path(settings.PROFILING_DIR)
+
+
+def save_profile(profiler, details):
+    """Write a profile and its details, then trim the directory to size."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    name = f'{time.time_ns() // 1_000_000}-{uuid.uuid4().hex[:8]}'
+    profiler.dump_stats(directory / f'{name}.prof')
+    with open(directory / f'{name}.json', 'w') as handle:
+        json.dump({'name': name, **details}, handle)
+    rotate(directory, settings.PROFILING_MAX_BYTES)
+    return name
+
+
+def rotate(directory, max_bytes):
+    """Delete the oldest profiles until the directory fits in ``max_bytes``."""
+    profiles = []
+    for path in directory.glob('*.prof'):
+        sidecar = path.with_suffix('.json')
+        try:
+            size = path.stat().st_size
+            if sidecar.exists():
+                size += sidecar.stat().st_size
+        except FileNotFoundError:
+            continue  # removed by another worker
+        profiles.append((path.name, size, path, sidecar))
+    profiles.sort()  # names start with a millisecond timestamp
+    total = sum(size for _, size, _, _ in profiles)
+    for _, size, path, sidecar in profiles:
+        if total <= max_bytes:
+            break
+        for victim in (path, sidecar):
+            try:
+                victim.unlink()
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+def slowest_profiles(limit=50):
+    """Details of the stored profiles, slowest first."""
+    profiles = []
+    for path in profile_dir().glob('*.json'):
+        try:
+            with open(path) as handle:
+                profiles.append(json.load(handle))
+        except (OSError, ValueError):
+            continue
+    profiles.sort(key=lambda details: details['duration_ms'], reverse=True)
+    return profiles[:limit]
+
+
+def profile_path(name):
+    """Path of a stored profile, or None for unknown or malformed names."""
+    if not NAME_PATTERN.match(name):
+        return None
+    path = profile_dir() / f'{name}.prof'
+    return path if path.exists() else None
+
+
+def profile_report(path, sort='cumulative', limit=40):
+    """The top ``limit`` functions of a profile as pstats text."""
+    output = StringIO()
+    stats = pstats.Stats(str(path), stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+class ProfilingMiddleware:
+    """Profile the view of sampled or explicitly requested requests."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        return await self.get_response(request)
+
+    def should_profile(self, request):
+        if (request.META.get(PROFILE_HEADER) == '1'
+                and can_request_profile(request.user)):
+            return True
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        """Call a sync view under cProfile, in the thread that runs it.
+
+        Django calls this hook through ``sync_to_async`` when the chain is
+        async, so the profiler sees the view's thread under ASGI as well.
+        Returning None lets Django call the view as usual.
+        """
+        if iscoroutinefunction(view_func):
+            return None
+        if not self.should_profile(request):
+            return None
+        if not _profiling.acquire(blocking=False):
+            return None
+
+        try:
+            profiler = cProfile.Profile()
+            timer = QueryTimer()
+            started = time.perf_counter()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timer))
+                profiler.enable()
+                try:
+                    response = view_func(request, *view_args, **view_kwargs)
+                finally:
+                    profiler.disable()
+            elapsed = time.perf_counter() - started
+        finally:
+            _profiling.release()
+
+        if response.streaming:
+            return response  # the body is produced after the profile ends
+        match = getattr(request, 'resolver_match', None)
+        save_profile(profiler, {
+            'path': request.path,
+            'method': request.method,
+            'view': match.view_name if match else 'unmatched',
+            'status': response.status_code,
+            'duration_ms': round(elapsed * 1000, 2),
+            'queries': timer.queries,
+            'db_ms': round(timer.seconds * 1000, 2),
+            'user': (request.user.get_username()
+                     if request.user.is_authenticated else ''),
+            'requested': request.META.get(PROFILE_HEADER) == '1',
+            'created_at': time.time(),
+        })
+        return response
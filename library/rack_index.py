@@ -0,0 +1,162 @@
+"""In-memory index of where every book belongs.
+
+Scan classification and rack coverage only need to know which rack each
+barcode belongs to. This module keeps that in two dictionaries per process:
+
+* ``rack_no -> set(barcode)``
+* ``barcode -> RackEntry(book_id, rack_no, shelf_no)``
+
+Saves that change a book's barcode, rack or shelf, and deletes, update the
+index in place once their transaction commits. A version number in the cache
+tells other processes to rebuild on their next lookup. Code that changes books
+without signals, such as ``bulk_create`` or ``QuerySet.update``, must call
+``rack_index.invalidate()``.
+
+The version only crosses processes through a shared cache (``REDIS_URL``).
+With the default local-memory cache, run a single server process and restart
+it after bulk imports; the commands that bulk-change books say so.
+"""
+from collections import defaultdict, namedtuple
+import threading
+
+from .utils import SharedVersion
+
+RackEntry = namedtuple('RackEntry', ['book_id', 'rack_no', 'shelf_no'])
+
+CORRECT = 'correct'
+MISPLACED = 'misplaced'
+UNKNOWN = 'unknown'
+
+
+class RackIndex:
+    """Process-local rack index.
+
+    It is rebuilt lazily when another process changes books.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._shared = SharedVersion('rack_index:version')
+        self._by_rack = None
+        self._by_barcode = None
+        self._barcode_by_id = None
+        self._version = None
+
+    # ----- loading -----
+
+    def _ensure_loaded(self):
+        # Callers hold self._lock
+        version = self._shared.current()
+        if self._by_barcode is None or version != self._version:
+            self._rebuild(version)
+
+    def _rebuild(self, version):
+        from .models import Book
+
+        by_rack = defaultdict(set)
+        by_barcode = {}
+        barcode_by_id = {}
+        rows = Book.objects.order_by().values_list(
+            'id', 'barcode', 'rack_no', 'shelf_no'
+        ).iterator(chunk_size=5000)
+        for book_id, barcode, rack_no, shelf_no in rows:
+            by_barcode[barcode] = RackEntry(book_id, rack_no, shelf_no)
+            by_rack[rack_no].add(barcode)
+            barcode_by_id[book_id] = barcode
+        self._by_rack, self._barcode_by_id = by_rack, barcode_by_id
+        self._by_barcode, self._version = by_barcode, version
+
+    def invalidate(self):
+        """Force every process, this one included, to rebuild on next use."""
+        with self._lock:
+            self._shared.bump()
+            self._by_barcode = None
+
+    # ----- incremental updates from signals -----
+
+    def _advance(self):
+        """Bump the shared version; True if this index can be patched in place.
+
+        If some other process changed books since our last load, the bump
+        skips past their version and the index is dropped to be rebuilt.
+        """
+        version = self._shared.bump()
+        if self._by_barcode is not None and version == self._version + 1:
+            self._version = version
+            return True
+        self._by_barcode = None
+        return False
+
+    def book_saved(self, book):
+        """Record a book's current location after it was saved."""
+        with self._lock:
+            if not self._advance():
+                return
+            self._discard(self._barcode_by_id.get(book.id))
+            self._discard(book.barcode)
+            self._by_barcode[book.barcode] = RackEntry(
+                book.id, book.rack_no, book.shelf_no
+            )
+            self._by_rack[book.rack_no].add(book.barcode)
+            self._barcode_by_id[book.id] = book.barcode
+
+    def book_deleted(self, book):
+        """Forget a deleted book."""
+        with self._lock:
+            if not self._advance():
+                return
+            self._discard(book.barcode)
+
+    def _discard(self, barcode):
+        entry = self._by_barcode.pop(barcode, None)
+        if entry:
+            self._barcode_by_id.pop(entry.book_id, None)
+            self._by_rack[entry.rack_no].discard(barcode)
+            if not self._by_rack[entry.rack_no]:
+                del self._by_rack[entry.rack_no]
+
+    # ----- lookups -----
+
+    def lookup(self, barcode):
+        """Get the RackEntry for a barcode, or None."""
+        with self._lock:
+            self._ensure_loaded()
+            return self._by_barcode.get(barcode)
+
+    def classify(self, barcode, rack_no):
+        """Classify a scan as CORRECT, MISPLACED or UNKNOWN, with its entry."""
+        entry = self.lookup(barcode)
+        if entry is None:
+            return UNKNOWN, None
+        return (CORRECT if entry.rack_no == rack_no else MISPLACED), entry
+
+    def rack_barcodes(self, rack_no):
+        """Get the set of barcodes that belong on a rack."""
+        with self._lock:
+            self._ensure_loaded()
+            return set(self._by_rack.get(rack_no, ()))
+
+    def rack_sizes(self):
+        """Get the number of books recorded for every rack."""
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                rack_no: len(barcodes)
+                for rack_no, barcodes in sorted(self._by_rack.items())
+            }
+
+    def coverage(self, rack_no, seen):
+        """Summarise how much of a rack a set of scanned barcodes covers."""
+        expected = self.rack_barcodes(rack_no)
+        found = expected & set(seen)
+        return {
+            'rack_no': rack_no,
+            'expected': len(expected),
+            'found': len(found),
+            'coverage': (
+                round(len(found) / len(expected), 4) if expected else None
+            ),
+        }
+
+
+rack_index = RackIndex()
@@ -0,0 +1,343 @@
+"""Book recommendations.
+
+Three sources feed the recommendation blocks:
+
+* Per-genre pools, kept in memory, for "you might like" suggestions.
+* Item-item neighbours from co-borrowing history, precomputed offline into
+  ``BookNeighbor`` rows for "readers also borrowed".
+* Decayed popularity scores on ``Book`` for the "trending this week" shelf,
+  buffered per process and written in batches.
+
+Scan results and the book detail page suggest available books from the same
+genre. Rather than filtering by genre and status on every request, each
+process keeps the top ``GENRE_POOL_SIZE`` available books per genre, ranked
+by average rating and then by how often they have been borrowed.
+
+A genre's pool is loaded on first use and dropped when one of its books is
+deleted, changes genre, status, title, author or rating, or gets a review,
+so only that genre is reloaded. Borrows that leave the book available do not
+reload anything. Changes made by other processes are picked up through a
+version number in the cache, which needs a shared cache (see ``rack_index``).
+
+Neighbours treat each reader's borrowings and reviews as a binary user x book
+matrix. A book's neighbours are the ``RECOMMENDATION_NEIGHBORS`` books whose
+reader sets have the highest cosine similarity with its own. With SciPy this
+is computed as one sparse matrix product per chunk of books. Without SciPy a
+pure-Python fallback counts co-readers, which is fine for small catalogues.
+"""
+from collections import Counter, defaultdict, namedtuple
+import heapq
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Book, BookNeighbor, BookStatus, Borrowing, Review
+from .utils import SharedVersion
+
+# Optional: NumPy/SciPy make neighbour builds fast on large catalogues
+try:
+    import numpy as np
+    from scipy import sparse
+    SCIPY_AVAILABLE = True
+except ImportError:
+    np = sparse = None
+    SCIPY_AVAILABLE = False
+
+PooledBook = namedtuple('PooledBook', [
+    'id', 'title', 'author', 'genre', 'average_rating', 'borrow_count',
+])
+
+
+class GenrePools:
+    """Process-local recommendation pools, one ranked list per genre."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._shared = SharedVersion('genre_pools:version')
+        self._pools = {}
+        self._genre_by_id = {}
+        self._version = None
+
+    def _load(self, genre):
+        rows = (
+            Book.objects.filter(genre=genre, status=BookStatus.AVAILABLE)
+            .annotate(borrow_count=Count('borrowings'))
+            .order_by('-average_rating', '-borrow_count', 'id')
+            .values_list(
+                'id', 'title', 'author', 'genre', 'average_rating',
+                'borrow_count',
+            )
+        )
+        return [PooledBook(*row) for row in rows[:settings.GENRE_POOL_SIZE]]
+
+    def pool(self, genre):
+        """Get the ranked pool for a genre, loading it if needed."""
+        with self._lock:
+            version = self._shared.current()
+            if version != self._version:
+                self._pools, self._genre_by_id, self._version = {}, {}, version
+            pool = self._pools.get(genre)
+            if pool is None:
+                pool = self._pools[genre] = self._load(genre)
+                self._genre_by_id.update((book.id, genre) for book in pool)
+            return pool
+
+    def recommend(self, genre, exclude=None, limit=3):
+        """Get up to ``limit`` pooled books of a genre, except ``exclude``."""
+        books = [book for book in self.pool(genre) if book.id != exclude]
+        return books[:limit]
+
+    def book_changed(self, book_id, genre):
+        """Drop the pools a saved or deleted book belongs, or belonged, to."""
+        with self._lock:
+            version = self._shared.bump()
+            if version != (self._version or 0) + 1:
+                self._pools, self._genre_by_id = {}, {}
+            else:
+                self._pools.pop(self._genre_by_id.pop(book_id, None), None)
+                self._pools.pop(genre, None)
+            self._version = version
+
+    def invalidate(self):
+        """Drop every pool in every process."""
+        with self._lock:
+            self._shared.bump()
+            self._pools, self._genre_by_id, self._version = {}, {}, None
+
+
+genre_pools = GenrePools()
+
+
+# ----- item-item neighbours -----
+
+def readers_also_borrowed(book, limit=None):
+    """Get a book's precomputed neighbours, best first, in one query."""
+    limit = limit or settings.RECOMMENDATION_NEIGHBORS
+    rows = BookNeighbor.objects.filter(book=book).select_related('neighbor')
+    return [row.neighbor for row in rows.order_by('rank')[:limit]]
+
+
+def load_interactions():
+    """Get the distinct (user_id, book_id) pairs of borrowings and reviews."""
+    borrowings = Borrowing.objects.order_by().values_list('user_id', 'book_id')
+    reviews = Review.objects.order_by().values_list('user_id', 'book_id')
+    pairs = set(borrowings.distinct().iterator())
+    pairs.update(reviews.iterator())
+    return pairs
+
+
+def changed_books(since):
+    """Get the ids of books borrowed or reviewed at or after ``since``."""
+    changed = set(Borrowing.objects.filter(
+        borrowed_at__gte=since
+    ).values_list('book_id', flat=True))
+    changed.update(Review.objects.filter(
+        updated_at__gte=since
+    ).values_list('book_id', flat=True))
+    return changed
+
+
+def affected_books(pairs, changed):
+    """Expand changed books to every book sharing a reader with one of them.
+
+    A new interaction with book B changes B's norm and its overlap with every
+    book its readers read, so all of those rows must be recomputed.
+    """
+    shelves = defaultdict(set)
+    for user_id, book_id in pairs:
+        shelves[user_id].add(book_id)
+    affected = set(changed)
+    for books in shelves.values():
+        if not books.isdisjoint(changed):
+            affected |= books
+    return affected
+
+
+def _top(candidates, k):
+    """Best ``k`` of (neighbor_id, score) pairs, ties broken by lower id."""
+    return heapq.nsmallest(k, candidates, key=lambda item: (-item[1], item[0]))
+
+
+def similar_books_python(pairs, targets, k):
+    """Top-``k`` cosine neighbours of each target book, counting co-readers."""
+    readers = defaultdict(set)
+    shelves = defaultdict(set)
+    for user_id, book_id in pairs:
+        readers[book_id].add(user_id)
+        shelves[user_id].add(book_id)
+
+    neighbours = {}
+    for book_id in targets:
+        overlap = Counter()
+        for user_id in readers.get(book_id, ()):
+            overlap.update(shelves[user_id])
+        overlap.pop(book_id, None)
+        norm = len(readers.get(book_id, ()))
+        neighbours[book_id] = _top(
+            ((other, count / math.sqrt(norm * len(readers[other])))
+             for other, count in overlap.items()),
+            k,
+        )
+    return neighbours
+
+
+def similar_books_scipy(pairs, targets, k, chunk_size=1024):
+    """Top-``k`` cosine neighbours of each target book, via sparse matrices."""
+    if not pairs:
+        return {book_id: [] for book_id in targets}
+    users, books = zip(*pairs)
+    user_ids, user_index = np.unique(np.array(users), return_inverse=True)
+    book_ids, book_index = np.unique(np.array(books), return_inverse=True)
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs)), (user_index, book_index)),
+        shape=(len(user_ids), len(book_ids)),
+    )
+    norms = np.sqrt(np.asarray(matrix.sum(axis=0)).ravel())
+    normalized = (matrix @ sparse.diags(1.0 / norms)).tocsc()
+    transposed = normalized.T.tocsr()
+
+    neighbours = {book_id: [] for book_id in targets}
+    columns = {
+        book_id: column for column, book_id in enumerate(book_ids.tolist())
+    }
+    wanted = [columns[book_id] for book_id in targets if book_id in columns]
+    for start in range(0, len(wanted), chunk_size):
+        chunk = wanted[start:start + chunk_size]
+        scores = (transposed[chunk] @ normalized).tocsr()
+        for row, column in enumerate(chunk):
+            cells = slice(scores.indptr[row], scores.indptr[row + 1])
+            others, values = scores.indices[cells], scores.data[cells]
+            keep = others != column
+            others, values = book_ids[others[keep]], values[keep]
+            best = np.lexsort((others, -values))[:k]
+            neighbours[book_ids[column].item()] = list(
+                zip(others[best].tolist(), values[best].tolist())
+            )
+    return neighbours
+
+
+def rebuild_neighbors(full=False, k=None, batch_size=1000):
+    """Recompute ``BookNeighbor`` rows; return the number of books refreshed.
+
+    Without ``full`` only books affected by borrowings and reviews since the
+    previous build are recomputed. Deleted history is only reflected by a full
+    rebuild.
+    """
+    k = k or settings.RECOMMENDATION_NEIGHBORS
+    started = timezone.now()
+    since = None
+    if not full:
+        since = BookNeighbor.objects.aggregate(
+            last=Max('computed_at')
+        )['last']
+
+    pairs = load_interactions()
+    if since is None:
+        targets = set(Book.objects.values_list('id', flat=True))
+    else:
+        targets = affected_books(pairs, changed_books(since))
+    if not targets:
+        return 0
+
+    similar = similar_books_scipy if SCIPY_AVAILABLE else similar_books_python
+    neighbours = similar(pairs, sorted(targets), k)
+
+    rows = [
+        BookNeighbor(book_id=book_id, neighbor_id=other, rank=rank,
+                     score=score, computed_at=started)
+        for book_id, ranked in neighbours.items()
+        for rank, (other, score) in enumerate(ranked, start=1)
+    ]
+    with transaction.atomic():
+        if since is None:
+            BookNeighbor.objects.all().delete()
+        else:
+            BookNeighbor.objects.filter(book_id__in=targets).delete()
+        BookNeighbor.objects.bulk_create(rows, batch_size=batch_size)
+    return len(targets)
+
+
+# ----- trending -----
+
+TRENDING_CACHE_KEY = 'trending_books'
+
+
+class PopularityBuffer:
+    """Process-local popularity increments, written to ``Book`` in batches.
+
+    Writing each view to ``Book`` would turn every detail page into a write
+    transaction. Events are summed per book instead and flushed in one UPDATE
+    once the oldest is ``TRENDING_FLUSH_SECONDS`` old or
+    ``TRENDING_FLUSH_BOOKS`` books are pending. A process that exits with
+    events pending loses at most that much.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._since = None
+
+    def add(self, book_id, weight):
+        """Count ``weight`` for a book, flushing if the buffer is due."""
+        now = time.monotonic()
+        with self._lock:
+            self._pending[book_id] += weight
+            if self._since is None:
+                self._since = now
+            due = (
+                now - self._since >= settings.TRENDING_FLUSH_SECONDS
+                or len(self._pending) >= settings.TRENDING_FLUSH_BOOKS
+            )
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Write the pending increments; return how many books were bumped."""
+        with self._lock:
+            pending = self._pending
+            self._pending, self._since = Counter(), None
+        return Book.bump_popularity(dict(pending))
+
+
+popularity_buffer = PopularityBuffer()
+
+
+def record_event(book_id, action):
+    """Add a borrow, view or reserve event to a book's popularity.
+
+    The event is buffered once the surrounding transaction commits, so
+    rolled-back borrows are not counted.
+    """
+    weight = settings.TRENDING_WEIGHTS.get(action)
+    if weight and book_id:
+        transaction.on_commit(lambda: popularity_buffer.add(book_id, weight))
+
+
+def decay_factor(minutes):
+    """Get the multiplier that decays scores over ``minutes`` elapsed."""
+    return 0.5 ** (minutes / 60 / settings.TRENDING_HALF_LIFE_HOURS)
+
+
+def trending_books(limit=None):
+    """Get the most popular books now, cached for TRENDING_CACHE_SECONDS."""
+    limit = limit or settings.TRENDING_SIZE
+
+    def load():
+        books = (
+            Book.objects.filter(popularity__gt=0)
+            .order_by('-popularity', 'id')
+            .values('id', 'title', 'author', 'genre', 'popularity')
+        )
+        return list(books[:settings.TRENDING_SIZE])
+
+    books = cache.get_or_set(
+        TRENDING_CACHE_KEY, load, settings.TRENDING_CACHE_SECONDS
+    )
+    return books[:limit]
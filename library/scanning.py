@@ -0,0 +1,124 @@
+"""Barcode decoding for images uploaded by scanning clients.
+
+Decoding runs in a small bounded thread pool (zbar releases the GIL while it
+works) so a burst of uploads cannot tie up every request worker, and each
+request waits at most ``BARCODE_DECODE_TIMEOUT`` seconds for its result.
+"""
+from concurrent.futures import (
+    ThreadPoolExecutor, TimeoutError as FutureTimeout,
+)
+from io import BytesIO
+import threading
+
+from django.conf import settings
+from PIL import Image, UnidentifiedImageError
+
+from .preprocessing import FramePreprocessor
+
+# Optional: pyzbar needs the zbar shared library, which is not available
+# everywhere
+try:
+    from pyzbar.pyzbar import decode as zbar_decode
+    BARCODE_SCANNING_AVAILABLE = True
+except ImportError:
+    BARCODE_SCANNING_AVAILABLE = False
+    zbar_decode = None
+
+
+class ScannerBusy(Exception):
+    """Raised when every decoding slot is taken."""
+
+
+class DecodeTimeout(Exception):
+    """Raised when decoding does not finish within the configured timeout."""
+
+
+class InvalidImage(ValueError):
+    """Raised when an upload is not a readable image."""
+
+
+_executor = None
+_slots = None
+_lock = threading.Lock()
+
+
+def _get_executor():
+    """Create the shared pool and its admission semaphore on first use."""
+    global _executor, _slots
+    with _lock:
+        if _executor is None:
+            workers = settings.BARCODE_DECODE_WORKERS
+            _executor = ThreadPoolExecutor(
+                max_workers=workers, thread_name_prefix='barcode'
+            )
+            _slots = threading.BoundedSemaphore(
+                workers + settings.BARCODE_DECODE_QUEUE
+            )
+    return _executor, _slots
+
+
+def open_image(data, preprocessor=None):
+    """Open encoded image bytes and prepare them for decoding.
+
+    Returns ``None`` if the preprocessor decides to skip the frame.
+    """
+    preprocessor = preprocessor or FramePreprocessor.from_settings()
+    try:
+        return preprocessor.process(Image.open(BytesIO(data)))
+    except (UnidentifiedImageError, OSError) as exc:
+        raise InvalidImage(str(exc)) from exc
+
+
+def decode_pil(image):
+    """Decode every barcode in a PIL image, without duplicates."""
+    results = {}
+    for symbol in zbar_decode(image):
+        value = symbol.data.decode('utf-8', errors='replace')
+        results.setdefault(value, {'data': value, 'type': symbol.type})
+    return list(results.values())
+
+
+def decode_image(data, preprocessor=None):
+    """Decode every barcode in one encoded image, without duplicates."""
+    image = open_image(data, preprocessor)
+    return decode_pil(image) if image is not None else []
+
+
+def _decode_all(images):
+    """Decode a batch of frames, merging barcodes in order of appearance."""
+    preprocessor = FramePreprocessor.from_settings()
+    results = {}
+    for data in images:
+        for barcode in decode_image(data, preprocessor):
+            results.setdefault(barcode['data'], barcode)
+    return list(results.values())
+
+
+def run_decoder(func, *args, timeout=None):
+    """Run ``func(*args)`` in the shared decoding pool and wait for the result.
+
+    Raises ``ScannerBusy`` when the pool and its queue are full instead of
+    letting requests pile up, and ``DecodeTimeout`` if the work overruns.
+    """
+    executor, slots = _get_executor()
+    if not slots.acquire(blocking=False):
+        raise ScannerBusy()
+
+    try:
+        future = executor.submit(func, *args)
+    except Exception:
+        slots.release()
+        raise
+    future.add_done_callback(lambda _: slots.release())
+
+    timeout = timeout or settings.BARCODE_DECODE_TIMEOUT
+    try:
+        return future.result(timeout=timeout)
+    except FutureTimeout:
+        future.cancel()
+        raise DecodeTimeout()
+
+
+def decode_uploads(images, timeout=None):
+    """Decode uploaded image bytes in the worker pool."""
+    return run_decoder(_decode_all, images, timeout=timeout)
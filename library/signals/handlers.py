@@ -1,10 +1,14 @@
 """Signal handlers for the library app."""
-from django.db.models.signals import post_save, pre_delete
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from datetime import timedelta
 
-from library.models import Borrowing, Book, Reservation
+from library.models import (
+    ActivityLog, Borrowing, Book, Reservation, Review, User,
+)
 
 
 @receiver(post_save, sender=Borrowing)
@@ -30,14 +34,107 @@ def handle_borrowing_returned(sender, instance, **kwargs):
 
         if reservation:
             # Notify the user who reserved it
-            from library.models import Notification
-            Notification.objects.create(
-                user=reservation.user,
-                title='Reserved Book Available',
-                message=f'The book "{instance.book.title}" you reserved is now available!',
-                type='available',
-                expires_at=timezone.now() + timedelta(days=7)
+            from library.utils import create_notification
+            create_notification(
+                reservation.user,
+                'Reserved Book Available',
+                f'The book "{instance.book.title}" you reserved is now '
+                'available!',
+                'available',
+                expires_in=timedelta(days=7)
             )
             reservation.is_fulfilled = True
             reservation.fulfilled_at = timezone.now()
             reservation.save()
+
+
+@receiver(post_save, sender=Review)
+def handle_review_saved(sender, instance, created, **kwargs):
+    """Keep the book's rating aggregates in step with a saved review."""
+    if created:
+        Book.adjust_rating_aggregates(instance.book_id, added=instance.rating)
+        _rating_changed(instance)
+    else:
+        previous = getattr(instance, '_loaded_rating', None)
+        if previous is not None and previous != instance.rating:
+            Book.adjust_rating_aggregates(
+                instance.book_id, added=instance.rating, removed=previous
+            )
+            _rating_changed(instance)
+    instance._loaded_rating = instance.rating
+
+
+@receiver(post_delete, sender=Review)
+def handle_review_deleted(sender, instance, **kwargs):
+    """Remove a deleted review from the book's rating aggregates."""
+    removed = getattr(instance, '_loaded_rating', instance.rating)
+    Book.adjust_rating_aggregates(instance.book_id, removed=removed)
+    _rating_changed(instance)
+
+
+def _rating_changed(review):
+    """Refresh the genre pool of a book whose rating was updated in SQL."""
+    from library.recommendations import genre_pools
+    book_id, genre = review.book_id, review.book.genre
+    transaction.on_commit(lambda: genre_pools.book_changed(book_id, genre))
+
+
+@receiver(post_save, sender=Book)
+def handle_book_saved(sender, instance, **kwargs):
+    """Keep the rack index and recommendation pools in step with a book."""
+    from library.rack_index import rack_index
+    from library.recommendations import genre_pools
+    # Borrows and returns save the book too; only moves touch the index
+    if instance.has_changed('barcode', 'rack_no', 'shelf_no'):
+        transaction.on_commit(lambda: rack_index.book_saved(instance))
+    if instance.has_changed(
+        'title', 'author', 'genre', 'status', 'average_rating'
+    ):
+        transaction.on_commit(
+            lambda: genre_pools.book_changed(instance.pk, instance.genre)
+        )
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_save, sender=User)
+def handle_image_saved(sender, instance, **kwargs):
+    """Render variants of a new cover or profile image off the request path.
+
+    Saves that keep the image do nothing. A replaced or cleared image has
+    its old variants deleted.
+    """
+    from library.images import IMAGE_FIELDS, delete_variants, schedule_variants
+    field = IMAGE_FIELDS[instance._meta.label_lower][0]
+    if not instance.has_changed(field):
+        return
+    old_name = instance.loaded_value(field)
+    if old_name:
+        transaction.on_commit(lambda: delete_variants(old_name))
+    transaction.on_commit(lambda: schedule_variants(instance))
+
+
+@receiver(post_delete, sender=Book)
+def handle_book_deleted(sender, instance, **kwargs):
+    """Drop a deleted book from the rack index and recommendation pools."""
+    from library.rack_index import rack_index
+    from library.recommendations import genre_pools
+    book_id = instance.pk
+    transaction.on_commit(lambda: rack_index.book_deleted(instance))
+    transaction.on_commit(
+        lambda: genre_pools.book_changed(book_id, instance.genre)
+    )
+
+
+@receiver(post_save, sender=ActivityLog)
+def handle_activity_logged(sender, instance, created, **kwargs):
+    """Count borrows, views and reservations towards the book's popularity."""
+    if created:
+        from library.recommendations import record_event
+        record_event(instance.book_id, instance.action)
+
+
+@receiver(connection_created)
+def handle_connection_created(sender, connection, **kwargs):
+    """Apply SQLite pragmas and transaction mode to new connections."""
+    from library.db import configure_sqlite
+    configure_sqlite(connection)
@@ -0,0 +1,39 @@
+"""Template tags for responsive cover and profile images."""
+from django import template
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils.html import format_html
+
+from library.images import image_srcset, variant_name
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(field_file, variants_source, alt='', sizes='100vw',
+                     css_class=''):
+    """Render a <picture> with WebP and JPEG srcsets.
+
+    Falls back to a plain <img> until the variants exist.
+    """
+    if not field_file:
+        return ''
+    webp = image_srcset(field_file, variants_source, 'webp')
+    if not webp:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy">',
+            field_file.url, alt, css_class,
+        )
+
+    fallback = next(iter(settings.IMAGE_VARIANTS))
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" '
+        'loading="lazy">'
+        '</picture>',
+        webp, sizes,
+        default_storage.url(variant_name(field_file.name, fallback, 'jpg')),
+        image_srcset(field_file, variants_source, 'jpg'), sizes, alt,
+        css_class,
+    )
@@ -1,9 +1,74 @@
 """Tests for the library app."""
-from django.test import TestCase
+import asyncio
+import importlib.util
+import json
+import multiprocessing
+import os
+import pstats
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from collections import namedtuple
+from unittest import skipIf
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Count, QuerySet, Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
-from .models import Book, BookStatus, UserRole, Borrowing, Review
+from django.core.management import call_command
+from django.urls import reverse
+from .models import (
+    Book, BookNeighbor, BookStatus, UserRole, Borrowing, Review, Notification,
+    NotificationDelivery, PopularityDecay, compact_isbn,
+)
+from .audit import audit_rack, decode_frames, unique_frames
+from .preprocessing import FramePreprocessor, frame_signature
+from .benchmarks import load_budgets, regressions, run_scenarios
+from .catalog import Checkpoint, import_rows
+from .forms import BookForm
+from .db import NATIVE_TRANSACTION_MODE, pragma_statements
+from .images import schedule_variants, variant_name
+from .loadtest import (
+    USER_CLASSES, ClientTransport, LocalOnlyError, Stats, check_local,
+    load_workload,
+)
+from .metrics import RequestMetricsMiddleware, registry as metrics_registry
+from .profiling import ProfilingMiddleware, rotate, slowest_profiles
+from .rack_index import rack_index
+from .scanning import DecodeTimeout, ScannerBusy, run_decoder
+from .recommendations import (
+    SCIPY_AVAILABLE, decay_factor, genre_pools, load_interactions,
+    popularity_buffer, readers_also_borrowed, rebuild_neighbors,
+    similar_books_python, similar_books_scipy, trending_books,
+)
+from .consumers import (
+    RESYNC_CLOSE_CODE,
+    NotificationConsumer,
+    TokenBucket,
+    get_connection_metrics,
+    get_realtime_counts,
+)
+from .utils import create_notification, get_qr_code, render_qr_png
 from datetime import timedelta
+from io import BytesIO, StringIO
+from pathlib import Path
 from django.utils import timezone
+from PIL import Image
 
 User = get_user_model()
 
@@ -111,3 +176,1986 @@ class BorrowingModelTests(TestCase):
         self.borrowing.save()
         fine = self.borrowing.calculate_fine(rate_per_day=10)
         self.assertEqual(fine, 30)
+
+
+class NotificationMaintenanceTests(TestCase):
+    """Tests for bulk notification read and purge."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'pass123'
+        )
+        self.other = User.objects.create_user(
+            'other', 'other@example.com', 'pass123'
+        )
+        self.client.force_login(self.user)
+
+    def _notify(self, user, expires_in=timedelta(days=30)):
+        return Notification.objects.create(
+            user=user, title='Title', message='Message',
+            expires_at=timezone.now() + expires_in
+        )
+
+    def test_mark_selected_read(self):
+        """Only the selected notifications of the current user are updated."""
+        first = self._notify(self.user)
+        second = self._notify(self.user)
+        foreign = self._notify(self.other)
+
+        response = self.client.post(
+            reverse('mark_notifications_read'), {'ids': [first.id, foreign.id]}
+        )
+
+        self.assertEqual(response.json()['updated'], 1)
+        first.refresh_from_db()
+        second.refresh_from_db()
+        foreign.refresh_from_db()
+        self.assertTrue(first.is_read)
+        self.assertFalse(second.is_read)
+        self.assertFalse(foreign.is_read)
+
+    def test_mark_all_read(self):
+        """Without ids every unread notification is updated in one query."""
+        for _ in range(3):
+            self._notify(self.user)
+
+        with self.assertNumQueries(3):  # session, user, update
+            response = self.client.post(reverse('mark_notifications_read'))
+
+        self.assertEqual(response.json()['updated'], 3)
+        self.assertFalse(
+            Notification.objects.filter(user=self.user, is_read=False).exists()
+        )
+
+    def test_mark_all_read_from_page(self):
+        """A form post with ``next`` is redirected back, not sent JSON."""
+        self._notify(self.user)
+        page = reverse('get_notifications')
+
+        response = self.client.post(
+            reverse('mark_notifications_read'), {'next': page}
+        )
+        self.assertRedirects(response, page, fetch_redirect_response=False)
+        self.assertFalse(
+            Notification.objects.filter(user=self.user, is_read=False).exists()
+        )
+
+        response = self.client.post(
+            reverse('mark_notifications_read'),
+            {'next': 'https://evil.example/'},
+        )
+        self.assertEqual(response.json()['updated'], 0)
+
+    def test_purge_expired(self):
+        """Expired notifications are deleted across several batches."""
+        for _ in range(5):
+            self._notify(self.user, expires_in=timedelta(days=-1))
+        kept = self._notify(self.user)
+
+        call_command('purge_notifications', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(list(Notification.objects.all()), [kept])
+
+
+class NotificationCoalescingTests(TestCase):
+    """Tests for notification coalescing and daily digests."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'testuser', 'test@example.com', 'pass123'
+        )
+
+    def test_burst_is_coalesced(self):
+        """Same-type notifications inside the window share one row."""
+        for i in range(5):
+            create_notification(self.user, 'Borrowed', f'Book {i}', 'borrow')
+        create_notification(self.user, 'Reserved', 'Reserved', 'reservation')
+
+        borrow = Notification.objects.get(user=self.user, type='borrow')
+        self.assertEqual(borrow.count, 5)
+        self.assertEqual(borrow.message.count('\n'), 4)
+        self.assertEqual(borrow.title, '5 Borrow notifications')
+        self.assertEqual(
+            Notification.objects.filter(user=self.user).count(), 2
+        )
+
+    def test_merged_row_is_pushed(self):
+        """Each merge pushes the updated row, not just the first event."""
+        with patch('library.utils.push_notification') as push:
+            with self.captureOnCommitCallbacks(execute=True):
+                create_notification(self.user, 'Borrowed', 'One', 'borrow')
+            with self.captureOnCommitCallbacks(execute=True):
+                create_notification(self.user, 'Borrowed', 'Two', 'borrow')
+
+        self.assertEqual(push.call_count, 2)
+        pushed = push.call_args[0][0]
+        self.assertEqual(pushed.count, 2)
+        self.assertEqual(pushed.message, 'One\nTwo')
+
+    def test_concurrent_insert_is_merged(self):
+        """A burst that loses the insert race merges into the winner's row."""
+        create_notification(self.user, 'Borrowed', 'One', 'borrow')
+        update = QuerySet.update
+        calls = []
+
+        def stale_first(queryset, **kwargs):
+            # The first merge misses the row, as if it were not yet committed
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else update(queryset, **kwargs)
+
+        with patch.object(
+            QuerySet, 'update', autospec=True, side_effect=stale_first
+        ):
+            create_notification(self.user, 'Borrowed', 'Two', 'borrow')
+
+        borrow = Notification.objects.get(user=self.user, type='borrow')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(borrow.count, 2)
+        self.assertEqual(borrow.message, 'One\nTwo')
+
+    def test_read_notification_is_not_reused(self):
+        """A read notification starts a new row."""
+        first = create_notification(self.user, 'Borrowed', 'One', 'borrow')
+        first.is_read = True
+        first.save()
+        second = create_notification(self.user, 'Borrowed', 'Two', 'borrow')
+        self.assertNotEqual(first.pk, second.pk)
+
+    def test_daily_digest(self):
+        """Pending rows of digest users are folded into one digest row."""
+        self.user.notification_delivery = NotificationDelivery.DAILY
+        self.user.save()
+        create_notification(self.user, 'Borrowed', 'One', 'borrow')
+        create_notification(self.user, 'Borrowed', 'Two', 'borrow')
+        create_notification(self.user, 'Reserved', 'Reserved', 'reservation')
+
+        call_command('send_notification_digests', stdout=StringIO())
+
+        unread = Notification.objects.filter(user=self.user, is_read=False)
+        self.assertEqual(unread.count(), 1)
+        digest = unread.get()
+        self.assertEqual(digest.type, 'digest')
+        self.assertIn('2 × Borrow', digest.message)
+        self.assertIn('1 × Reservation', digest.message)
+        self.assertEqual(digest.count, 3)
+
+
+class RealtimeCountsTests(TestCase):
+    """Tests for the aggregated WebSocket counts."""
+
+    def test_counts_in_one_query(self):
+        """Active, overdue and unread counts come from a single query."""
+        user = User.objects.create_user(
+            'testuser', 'test@example.com', 'pass123'
+        )
+        for i, days in enumerate([5, -2, -3]):
+            book = Book.objects.create(
+                title=f'Book {i}', author='Author', isbn=f'ISBN{i}',
+                barcode=f'BAR{i}', genre='Fiction', rack_no='A1'
+            )
+            Borrowing.objects.create(
+                user=user, book=book,
+                due_date=timezone.now() + timedelta(days=days),
+            )
+        Notification.objects.create(
+            user=user, title='Title', message='Message',
+            expires_at=timezone.now() + timedelta(days=1)
+        )
+
+        with self.assertNumQueries(1):
+            counts = get_realtime_counts(user.id)
+
+        self.assertEqual(counts, {
+            'active_borrowings': 3,
+            'overdue_count': 2,
+            'unread_notifications': 1,
+        })
+
+
+RECEIVER_SCRIPT = """
+import asyncio, json, django
+django.setup()
+from channels.layers import get_channel_layer
+
+async def main():
+    layer = get_channel_layer()
+    channel = await layer.new_channel()
+    await layer.group_add('multiprocess_test', channel)
+    # Receiving our own message proves the subscription is live
+    await layer.group_send('multiprocess_test', {'type': 'ready'})
+    await asyncio.wait_for(layer.receive(channel), timeout=10)
+    print('ready', flush=True)
+    message = await asyncio.wait_for(layer.receive(channel), timeout=10)
+    print(json.dumps(message), flush=True)
+
+asyncio.run(main())
+"""
+
+# Just enough of the Redis protocol for RedisPubSubChannelLayer: SUBSCRIBE,
+# UNSUBSCRIBE and PUBLISH; any other command is answered with +OK.
+FAKE_REDIS_SCRIPT = """
+import asyncio
+
+subscribers = {}
+
+def encode(items):
+    out = b'*%d\\r\\n' % len(items)
+    for item in items:
+        if isinstance(item, int):
+            out += b':%d\\r\\n' % item
+        else:
+            out += b'$%d\\r\\n%s\\r\\n' % (len(item), item)
+    return out
+
+async def handle(reader, writer):
+    channels = set()
+    try:
+        while line := await reader.readline():
+            args = []
+            for _ in range(int(line[1:])):
+                size = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(size + 2))[:-2])
+            command = args[0].upper()
+            if command == b'SUBSCRIBE':
+                for channel in args[1:]:
+                    channels.add(channel)
+                    subscribers.setdefault(channel, set()).add(writer)
+                    writer.write(
+                        encode([b'subscribe', channel, len(channels)])
+                    )
+            elif command == b'UNSUBSCRIBE':
+                for channel in args[1:] or list(channels):
+                    channels.discard(channel)
+                    subscribers.get(channel, set()).discard(writer)
+                    writer.write(
+                        encode([b'unsubscribe', channel, len(channels)])
+                    )
+            elif command == b'PUBLISH':
+                receivers = subscribers.get(args[1], set())
+                for receiver in receivers:
+                    receiver.write(encode([b'message', args[1], args[2]]))
+                writer.write(b':%d\\r\\n' % len(receivers))
+            elif command == b'PING':
+                writer.write(b'+PONG\\r\\n')
+            else:
+                writer.write(b'+OK\\r\\n')
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        for channel in channels:
+            subscribers[channel].discard(writer)
+        writer.close()
+
+async def main():
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    print(server.sockets[0].getsockname()[1], flush=True)
+    await server.serve_forever()
+
+asyncio.run(main())
+"""
+
+
+@skipIf(importlib.util.find_spec('channels_redis') is None,
+        'channels-redis is not installed')
+class MultiProcessChannelLayerTests(TestCase):
+    """Integration test for group messages crossing process boundaries.
+
+    Runs against ``REDIS_URL`` when it is set, and otherwise against a
+    minimal Redis stand-in started for the test.
+    """
+
+    def setUp(self):
+        self.redis_url = os.environ.get('REDIS_URL')
+        if not self.redis_url:
+            server = subprocess.Popen(
+                [sys.executable, '-c', FAKE_REDIS_SCRIPT],
+                stdout=subprocess.PIPE,
+                text=True,
+            )
+            self.addCleanup(server.wait)
+            self.addCleanup(server.kill)
+            port = int(server.stdout.readline())
+            self.redis_url = f'redis://127.0.0.1:{port}/0'
+
+    def test_group_send_reaches_other_process(self):
+        """A group_send in this process reaches a socket held by another."""
+        receiver = subprocess.Popen(
+            [sys.executable, '-c', RECEIVER_SCRIPT],
+            cwd=settings.BASE_DIR,
+            env={
+                **os.environ,
+                'DJANGO_SETTINGS_MODULE': 'smart_library.settings',
+                'CHANNEL_LAYER_BACKEND': 'redis-pubsub',
+                'CACHE_BACKEND': 'locmem',
+                'REDIS_URL': self.redis_url,
+            },
+            stdout=subprocess.PIPE,
+            text=True,
+        )
+        layers = {'default': {
+            'BACKEND': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+            'CONFIG': {'hosts': [self.redis_url]},
+        }}
+        try:
+            self.assertEqual(receiver.stdout.readline().strip(), 'ready')
+            with override_settings(CHANNEL_LAYERS=layers):
+                async_to_sync(get_channel_layer().group_send)(
+                    'multiprocess_test',
+                    {'type': 'notification.message', 'title': 'Hello'},
+                )
+            message = json.loads(receiver.stdout.readline())
+            self.assertEqual(message['title'], 'Hello')
+        finally:
+            receiver.kill()
+            receiver.wait()
+
+
+class WebSocketLimitTests(TestCase):
+    """Tests for WebSocket rate limiting and connection caps."""
+
+    def test_token_bucket(self):
+        """The bucket allows a burst and then refuses until refilled."""
+        bucket = TokenBucket(rate=1, capacity=3)
+        self.assertEqual(
+            [bucket.consume() for _ in range(4)], [True, True, True, False]
+        )
+        bucket.updated_at -= 2
+        self.assertTrue(bucket.consume())
+
+    @override_settings(WEBSOCKET_MAX_CONNECTIONS=1)
+    def test_connection_cap(self):
+        """Connections beyond the cap are rejected and counted."""
+        user = User.objects.create_user(
+            'testuser', 'test@example.com', 'pass123'
+        )
+
+        async def connect_twice():
+            first = WebsocketCommunicator(
+                NotificationConsumer.as_asgi(), '/ws/notifications/'
+            )
+            first.scope['user'] = user
+            second = WebsocketCommunicator(
+                NotificationConsumer.as_asgi(), '/ws/notifications/'
+            )
+            second.scope['user'] = user
+            accepted, _ = await first.connect()
+            rejected, _ = await second.connect()
+            metrics = get_connection_metrics()
+            await first.disconnect()
+            return accepted, rejected, metrics
+
+        before = get_connection_metrics()
+        accepted, rejected, metrics = async_to_sync(connect_twice)()
+
+        self.assertTrue(accepted)
+        self.assertFalse(rejected)
+        self.assertEqual(
+            metrics['active_connections'], before['active_connections'] + 1
+        )
+        self.assertEqual(
+            metrics['rejected_connections'],
+            before['rejected_connections'] + 1,
+        )
+        self.assertEqual(
+            get_connection_metrics()['active_connections'],
+            before['active_connections'],
+        )
+
+    @override_settings(
+        WEBSOCKET_OUTBOUND_QUEUE_SIZE=20,
+        CHANNEL_LAYERS={'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {'capacity': 10000},
+        }},
+    )
+    def test_outbound_queue_under_flood(self):
+        """Flooded group messages arrive in order or are counted as dropped."""
+        user = User.objects.create_user(
+            'testuser', 'test@example.com', 'pass123'
+        )
+        sent = 2000
+
+        async def flood():
+            socket = WebsocketCommunicator(
+                NotificationConsumer.as_asgi(), '/ws/notifications/'
+            )
+            socket.scope['user'] = user
+            await socket.connect()
+            await socket.receive_json_from()  # connection_established
+            layer = get_channel_layer()
+            await asyncio.gather(*(
+                layer.group_send(f'user_{user.id}', {
+                    'type': 'notification.message', 'title': str(i),
+                    'message': '', 'notification_type': 'info',
+                })
+                for i in range(sent)
+            ))
+            received = []
+            while not await socket.receive_nothing(timeout=0.2):
+                output = await socket.receive_output()
+                if output['type'] == 'websocket.close':
+                    self.assertEqual(output['code'], RESYNC_CLOSE_CODE)
+                    break
+                received.append(int(json.loads(output['text'])['title']))
+            await socket.disconnect()
+            return received
+
+        before = get_connection_metrics()['dropped_messages']
+        received = async_to_sync(flood)()
+        dropped = get_connection_metrics()['dropped_messages'] - before
+
+        self.assertEqual(received, sorted(received))
+        self.assertEqual(len(received) + dropped, sent)
+
+    def test_overflow_closes_for_resync(self):
+        """After a drop the queued messages are sent, then a resync close."""
+        consumer = NotificationConsumer()
+        frames = []
+
+        async def send(text_data):
+            frames.append(json.loads(text_data))
+
+        async def close(code=None):
+            frames.append(code)
+
+        consumer.send, consumer.close = send, close
+
+        async def overflow():
+            consumer.outbound = asyncio.Queue(maxsize=2)
+            consumer.overflowed = False
+            for i in range(4):
+                await consumer.enqueue({'n': i})
+            await consumer.write_outbound()
+
+        before = get_connection_metrics()
+        async_to_sync(overflow)()
+        after = get_connection_metrics()
+
+        self.assertEqual(frames, [{'n': 0}, {'n': 1}, RESYNC_CLOSE_CODE])
+        self.assertEqual(
+            after['dropped_messages'] - before['dropped_messages'], 2
+        )
+        self.assertEqual(
+            after['overflow_disconnects'] - before['overflow_disconnects'], 1
+        )
+
+
+@override_settings(SSE_HEARTBEAT_SECONDS=0.05, SSE_MAX_STREAM_SECONDS=0.3)
+class EventStreamTests(TestCase):
+    """Tests for the Server-Sent Events fallback."""
+
+    def test_requires_login(self):
+        """Anonymous clients are refused."""
+        response = self.client.get(reverse('event_stream'))
+        self.assertEqual(response.status_code, 401)
+
+    async def test_stream_sends_counts_notifications_and_heartbeats(self):
+        """The stream relays counts, group notifications and heartbeats."""
+        user = await sync_to_async(User.objects.create_user)(
+            'testuser', 'test@example.com', 'pass123'
+        )
+        await sync_to_async(self.async_client.force_login)(user)
+
+        response = await self.async_client.get(reverse('event_stream'))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+
+        chunks = []
+        async for chunk in response.streaming_content:
+            if isinstance(chunk, bytes):
+                chunk = chunk.decode()
+            chunks.append(chunk)
+            if len(chunks) == 2:
+                await get_channel_layer().group_send(f'user_{user.id}', {
+                    'type': 'notification.message', 'title': 'Hello',
+                    'message': 'World', 'notification_type': 'info',
+                })
+        body = ''.join(chunks)
+
+        self.assertIn('event: updates', body)
+        self.assertIn('event: notification', body)
+        self.assertIn('"title": "Hello"', body)
+        self.assertIn(': heartbeat', body)
+
+
+    async def test_heartbeats_do_not_query_counts(self):
+        """Counts are read once on connect, not again on every heartbeat."""
+        user = await sync_to_async(User.objects.create_user)(
+            'testuser', 'test@example.com', 'pass123'
+        )
+        await sync_to_async(self.async_client.force_login)(user)
+
+        with patch('library.views.get_cached_realtime_counts',
+                   return_value={'active_borrowings': 0}) as counts:
+            response = await self.async_client.get(reverse('event_stream'))
+            body = ''.join([
+                chunk.decode() if isinstance(chunk, bytes) else chunk
+                async for chunk in response.streaming_content
+            ])
+
+        self.assertGreater(body.count(': heartbeat'), 1)
+        self.assertEqual(counts.call_count, 1)
+
+
+class RatingAggregateTests(TestCase):
+    """Tests for incremental book rating aggregates."""
+
+    def setUp(self):
+        self.book = Book.objects.create(
+            title='Test Book', author='Test Author', isbn='123456',
+            barcode='BAR123', genre='Fiction', rack_no='A1'
+        )
+        self.users = [
+            User.objects.create_user(
+                f'user{i}', f'user{i}@example.com', 'pass123'
+            )
+            for i in range(3)
+        ]
+
+    def test_create_update_delete(self):
+        """Aggregates follow review creation, edits and deletion."""
+        reviews = [
+            Review.objects.create(user=user, book=self.book, rating=rating)
+            for user, rating in zip(self.users, [5, 4, 4])
+        ]
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (self.book.rating_sum, self.book.rating_count), (13, 3)
+        )
+        self.assertEqual(self.book.average_rating, 4.33)
+        self.assertEqual(
+            self.book.rating_histogram(), {1: 0, 2: 0, 3: 0, 4: 2, 5: 1}
+        )
+
+        edited = Review.objects.get(pk=reviews[0].pk)
+        edited.rating = 1
+        edited.save()
+        reviews[1].delete()
+
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (self.book.rating_sum, self.book.rating_count), (5, 2)
+        )
+        self.assertEqual(self.book.average_rating, 2.5)
+        self.assertEqual(
+            self.book.rating_histogram(), {1: 1, 2: 0, 3: 0, 4: 1, 5: 0}
+        )
+
+    def test_add_review_view_updates_aggregates(self):
+        """Posting a review twice replaces the earlier rating."""
+        self.client.force_login(self.users[0])
+        url = reverse('add_review', args=[self.book.id])
+        self.client.post(url, {'rating': 2, 'review_text': 'Meh'})
+        self.client.post(url, {'rating': 4, 'review_text': 'Better on reread'})
+
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (self.book.rating_sum, self.book.rating_count), (4, 1)
+        )
+        self.assertEqual(self.book.average_rating, 4.0)
+
+    def test_rebuild_fixes_drift(self):
+        """The rebuild command recomputes aggregates from reviews."""
+        Review.objects.create(user=self.users[0], book=self.book, rating=3)
+        Book.objects.filter(pk=self.book.pk).update(
+            rating_sum=99, rating_count=7, rating_3_count=0
+        )
+
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+
+        self.book.refresh_from_db()
+        self.assertEqual(
+            (self.book.rating_sum, self.book.rating_count), (3, 1)
+        )
+        self.assertEqual(self.book.rating_histogram()[3], 1)
+        self.assertEqual(self.book.average_rating, 3.0)
+
+
+class ReviewListingTests(TestCase):
+    """Tests for paginated review listing."""
+
+    def setUp(self):
+        self.book = Book.objects.create(
+            title='Test Book', author='Test Author', isbn='123456',
+            barcode='BAR123', genre='Fiction', rack_no='A1'
+        )
+        users = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@example.com')
+            for i in range(25)
+        )
+        for i, user in enumerate(users):
+            Review.objects.create(
+                user=user, book=self.book, rating=1 + i % 5, helpful_count=i
+            )
+        self.client.force_login(users[0])
+
+    def test_detail_page_queries_do_not_grow_with_reviews(self):
+        """Only the first page is loaded, with reviewers joined in."""
+        url = reverse('view_book_detail', args=[self.book.id])
+        # session, user, book, own review, review page, activity log,
+        # genre recommendations, neighbours, unread count
+        with self.assertNumQueries(9):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['reviews']), 10)
+        self.assertTrue(response.context['reviews_has_next'])
+        self.assertEqual(response.context['reviews'][0].helpful_count, 24)
+
+    def test_json_pages(self):
+        """Further pages are served lazily until exhausted."""
+        url = reverse('get_book_reviews', args=[self.book.id])
+        second = self.client.get(url, {'sort': 'newest', 'page': 2}).json()
+        third = self.client.get(url, {'sort': 'newest', 'page': 3}).json()
+
+        self.assertTrue(second['has_next'])
+        self.assertFalse(third['has_next'])
+        self.assertEqual(len(third['reviews']), 5)
+        self.assertEqual(
+            set(third['reviews'][0]),
+            {'id', 'user', 'rating', 'comment', 'helpful_count', 'created_at'},
+        )
+
+
+class QRCodeCacheTests(TestCase):
+    """Tests for the content-addressed QR code cache."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.book = Book.objects.create(
+            title='Test Book', author='Test Author', isbn='123456',
+            barcode='BAR123', genre='Fiction', rack_no='A1'
+        )
+        user = User.objects.create_user(
+            'testuser', 'test@example.com', 'pass123'
+        )
+        self.client.force_login(user)
+
+    def test_png_is_rendered_once(self):
+        """Repeated requests reuse the same cached file."""
+        url = reverse('book_qr_png', args=[self.book.id])
+        with patch(
+            'library.utils.render_qr_png', wraps=render_qr_png
+        ) as render:
+            first = self.client.get(url)
+            second = self.client.get(url)
+
+        self.assertEqual(render.call_count, 1)
+        self.assertEqual(first.status_code, 302)
+        self.assertEqual(first['Location'], second['Location'])
+        self.assertRegex(first['Location'], r'/media/qr/[0-9a-f]{64}\.png$')
+        files = os.listdir(os.path.join(self.media_root, 'qr'))
+        self.assertEqual(len(files), 1)
+
+    @override_settings(SITE_URL='https://library.example.org/')
+    def test_png_encodes_site_url(self):
+        """The encoded link uses SITE_URL, and no temporary files are left."""
+        with patch('library.views.get_qr_code', wraps=get_qr_code) as qr:
+            self.client.get(reverse('book_qr_png', args=[self.book.id]))
+
+        self.assertEqual(
+            qr.call_args[0][0],
+            f'https://library.example.org/book/{self.book.id}/',
+        )
+        files = os.listdir(os.path.join(self.media_root, 'qr'))
+        self.assertEqual([name[-4:] for name in files], ['.png'])
+
+    def test_json_form_is_kept(self):
+        """The JSON endpoint still returns a base64 data URI."""
+        url = reverse('generate_qr', args=[self.book.id])
+        data = self.client.get(url).json()
+        self.assertTrue(data['qr_code'].startswith('data:image/png;base64,'))
+        self.assertTrue(data['url'].startswith('/media/qr/'))
+
+
+class QRLabelSheetTests(TestCase):
+    """Tests for bulk QR label sheets."""
+
+    def setUp(self):
+        Book.objects.bulk_create(
+            Book(title=f'Book {i}', author='Author', isbn=f'ISBN{i}',
+                 barcode=f'BAR{i}', genre='Fiction' if i % 2 else 'Science',
+                 rack_no='A1')
+            for i in range(30)
+        )
+
+    def test_command_writes_pdf(self):
+        """The command renders the filtered books into one PDF."""
+        output = os.path.join(tempfile.mkdtemp(), 'labels.pdf')
+        self.addCleanup(shutil.rmtree, os.path.dirname(output))
+
+        call_command(
+            'generate_qr_labels', output, genre='Fiction', workers=2,
+            stdout=StringIO(),
+        )
+
+        with open(output, 'rb') as pdf:
+            self.assertEqual(pdf.read().count(b'/Type /Page\n'), 1)
+
+    async def test_endpoint_streams_zip(self):
+        """Librarians get a ZIP of PNG pages, rendered without a pool."""
+        librarian = await sync_to_async(User.objects.create_user)(
+            'librarian', 'lib@example.com', 'pass123', role=UserRole.LIBRARIAN
+        )
+        await sync_to_async(self.async_client.force_login)(librarian)
+
+        with patch('library.labels.ProcessPoolExecutor') as pool:
+            response = await self.async_client.get(reverse('qr_label_sheets'))
+            self.assertTrue(response.is_async)
+            body = b''.join(
+                [chunk async for chunk in response.streaming_content]
+            )
+
+        pool.assert_not_called()
+        archive = zipfile.ZipFile(BytesIO(body))
+        self.assertEqual(
+            archive.namelist(), ['labels-0001.png', 'labels-0002.png']
+        )
+
+    @override_settings(QR_LABEL_MAX_BOOKS=20)
+    def test_endpoint_caps_books(self):
+        """Downloads over the cap are refused before anything is rendered."""
+        librarian = User.objects.create_user(
+            'librarian', 'lib@example.com', 'pass123', role=UserRole.LIBRARIAN
+        )
+        self.client.force_login(librarian)
+
+        with patch('library.views.iter_label_sheets') as sheets:
+            response = self.client.get(reverse('qr_label_sheets'))
+            filtered = self.client.get(
+                reverse('qr_label_sheets'), {'genre': 'Fiction'}
+            )
+
+        self.assertRedirects(
+            response, reverse('dashboard'), fetch_redirect_response=False
+        )
+        self.assertEqual(filtered.status_code, 200)
+        self.assertEqual(sheets.call_count, 1)
+
+
+FakeSymbol = namedtuple('FakeSymbol', ['data', 'type'])
+
+
+def png_upload(name='frame.png', image=None):
+    """A small PNG upload standing in for a camera frame."""
+    buffer = BytesIO()
+    (image or Image.new('RGB', (40, 40), 'white')).save(buffer, format='PNG')
+    return SimpleUploadedFile(
+        name, buffer.getvalue(), content_type='image/png'
+    )
+
+
+@patch('library.views.BARCODE_SCANNING_AVAILABLE', True)
+class BarcodeDecodeTests(TestCase):
+    """Tests for decoding uploaded barcode images."""
+
+    def setUp(self):
+        self.book = Book.objects.create(
+            title='Test Book', author='Test Author', isbn='123456',
+            barcode='BAR123', genre='Fiction', rack_no='A1'
+        )
+        rack_index.invalidate()
+        self.client.force_login(User.objects.create_user(
+            'testuser', 'test@example.com', 'pass123'
+        ))
+
+    def test_decode_endpoint_looks_books_up(self):
+        """Decoded barcodes are deduplicated and matched to books."""
+        symbols = [
+            FakeSymbol(b'BAR123', 'CODE128'), FakeSymbol(b'UNKNOWN', 'EAN13')
+        ]
+        with patch('library.scanning.zbar_decode', return_value=symbols):
+            response = self.client.post(reverse('decode_barcodes'), {
+                'image': [png_upload('a.png'), png_upload('b.png')],
+                'rack_no': 'B2',
+            })
+
+        barcodes = response.json()['barcodes']
+        self.assertEqual([b['data'] for b in barcodes], ['BAR123', 'UNKNOWN'])
+        self.assertEqual(barcodes[0]['book']['id'], self.book.id)
+        self.assertFalse(barcodes[0]['correct_rack'])
+        self.assertIsNone(barcodes[1]['book'])
+
+    def test_rejects_non_images(self):
+        """Uploads that are not images are a client error."""
+        upload = SimpleUploadedFile('notes.txt', b'not an image')
+        with patch('library.scanning.zbar_decode', return_value=[]):
+            response = self.client.post(
+                reverse('decode_barcodes'), {'image': upload}
+            )
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(BARCODE_DECODE_TIMEOUT=0.05)
+    def test_timeout(self):
+        """A decode that overruns the timeout returns 504."""
+        def slow_decode(image):
+            time.sleep(0.3)
+            return []
+
+        with patch('library.scanning.zbar_decode', side_effect=slow_decode):
+            response = self.client.post(
+                reverse('decode_barcodes'), {'image': png_upload()}
+            )
+        self.assertEqual(response.status_code, 504)
+
+    def test_scan_page_checks_rack(self):
+        """The scan page classifies an uploaded photo against the rack."""
+        symbols = [FakeSymbol(b'BAR123', 'CODE128')]
+        with patch('library.scanning.zbar_decode', return_value=symbols):
+            response = self.client.post(
+                reverse('scan_book'), {'rack_no': 'A1', 'image': png_upload()}
+            )
+        self.assertTrue(response.context['success'])
+
+    def test_scan_page_with_stale_index(self):
+        """A book deleted behind the index is reported as not found."""
+        rack_index.invalidate()
+        rack_index.rack_sizes()
+        Book.objects.filter(barcode='BAR123').delete()  # on_commit never runs
+        with patch('library.scanning.zbar_decode',
+                   return_value=[FakeSymbol(b'BAR123', 'CODE128')]):
+            response = self.client.post(
+                reverse('scan_book'), {'rack_no': 'A1', 'image': png_upload()}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context['success'])
+
+
+def split_frame(vertical):
+    """A grayscale frame that is half black, split either way."""
+    image = Image.new('L', (64, 64), 255)
+    image.paste(0, (0, 0, 32, 64) if vertical else (0, 0, 64, 32))
+    return image
+
+
+class RackAuditTests(TestCase):
+    """Tests for batch shelf audits."""
+
+    def setUp(self):
+        for barcode, rack in [('BAR1', 'A1'), ('BAR2', 'B1'), ('BAR3', 'A1')]:
+            Book.objects.create(
+                title=f'Book {barcode}', author='Author',
+                isbn=f'ISBN-{barcode}', barcode=barcode, genre='Fiction',
+                rack_no=rack
+            )
+        rack_index.invalidate()
+
+    def fake_decode(self, image):
+        if image.getpixel((0, 63)) == 0:  # vertical split
+            return [
+                {'data': 'BAR1', 'type': 'CODE128'},
+                {'data': 'GHOST', 'type': 'CODE128'},
+            ]
+        return [{'data': 'BAR2', 'type': 'CODE128'}]
+
+    def test_duplicate_frames_are_skipped(self):
+        """Repeated frames are decoded once."""
+        frames = [split_frame(True), split_frame(True), split_frame(False)]
+        self.assertEqual(len(list(unique_frames(frames))), 2)
+
+    def test_similar_earlier_frame_is_kept(self):
+        """Only exact repeats of non-adjacent frames are skipped."""
+        first, other = split_frame(True), split_frame(False)
+        similar = first.copy()
+        similar.paste(200, (0, 0, 4, 4))
+        self.assertEqual(frame_signature(similar), frame_signature(first))
+
+        kept = list(unique_frames([first, other, similar]))
+        self.assertEqual(kept, [first, other, similar])
+        self.assertEqual(len(list(unique_frames([first, other, first]))), 2)
+
+    def test_audit_report_and_bulk_verification(self):
+        """The report diffs the decoded set against the rack's books."""
+        frames = [split_frame(True), split_frame(True), split_frame(False)]
+        rack_index.rack_sizes()  # warm the index
+        with patch('library.audit.decode_pil', side_effect=self.fake_decode):
+            with self.assertNumQueries(2):
+                report = audit_rack('A1', frames, workers=0)
+
+        self.assertEqual(report['frames_decoded'], 2)
+        self.assertEqual([b['barcode'] for b in report['verified']], ['BAR1'])
+        self.assertEqual([b['barcode'] for b in report['misplaced']], ['BAR2'])
+        self.assertEqual([b['barcode'] for b in report['missing']], ['BAR3'])
+        self.assertEqual(report['unknown'], ['GHOST'])
+        self.assertEqual(report['coverage']['found'], 1)
+        self.assertEqual(report['coverage']['expected'], 2)
+        verified = dict(
+            Book.objects.values_list('barcode', 'last_location_verified')
+        )
+        self.assertIsNotNone(verified['BAR1'])
+        self.assertIsNone(verified['BAR3'])
+
+
+    def test_process_pool_decoding(self):
+        """The command's process pool decodes every distinct frame."""
+        if multiprocessing.get_start_method() != 'fork':
+            self.skipTest('Workers only see the patched decoder when forked')
+        frames = [split_frame(True), split_frame(False), split_frame(True)]
+        with patch('library.audit.decode_pil', side_effect=self.fake_decode):
+            report = audit_rack('A1', frames, workers=2)
+
+        self.assertEqual(report['frames_decoded'], 2)
+        self.assertEqual([b['barcode'] for b in report['verified']], ['BAR1'])
+        self.assertEqual(report['unknown'], ['GHOST'])
+
+    def test_frame_limit_and_deadline(self):
+        """Decoding stops after max_frames and fails once past the deadline."""
+        frames = [split_frame(True), split_frame(False)]
+        with patch('library.audit.decode_pil', side_effect=self.fake_decode):
+            seen, decoded = decode_frames(frames, workers=0, max_frames=1)
+            self.assertEqual((seen, decoded), ({'BAR1', 'GHOST'}, 1))
+            with self.assertRaises(DecodeTimeout):
+                decode_frames(frames, workers=0, deadline=time.monotonic() - 1)
+
+    @patch('library.views.BARCODE_SCANNING_AVAILABLE', True)
+    def test_endpoint_uses_scanner_pool(self):
+        """Web audits are decoded in the bounded pool with their limits."""
+        librarian = User.objects.create_user(
+            'librarian', 'lib@example.com', 'pass123', role=UserRole.LIBRARIAN
+        )
+        self.client.force_login(librarian)
+        uploads = [
+            png_upload(f'{i}.png', split_frame(vertical))
+            for i, vertical in enumerate([True, False])
+        ]
+
+        with patch('library.audit.decode_pil', side_effect=self.fake_decode), \
+                patch('library.views.run_decoder', wraps=run_decoder) as pool:
+            response = self.client.post(
+                reverse('rack_audit'), {'rack_no': 'A1', 'image': uploads}
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['frames_decoded'], 2)
+        self.assertEqual(
+            pool.call_args.kwargs['timeout'], settings.AUDIT_TIMEOUT
+        )
+
+        with override_settings(AUDIT_MAX_FRAMES=1):
+            response = self.client.post(reverse('rack_audit'), {
+                'rack_no': 'A1', 'image': [png_upload(), png_upload()],
+            })
+        self.assertEqual(response.status_code, 400)
+
+        with patch('library.views.run_decoder', side_effect=ScannerBusy):
+            response = self.client.post(
+                reverse('rack_audit'), {'rack_no': 'A1', 'image': png_upload()}
+            )
+        self.assertEqual(response.status_code, 503)
+
+
+class RackIndexTests(TestCase):
+    """Tests for the in-memory rack index."""
+
+    def setUp(self):
+        self.book = Book.objects.create(
+            title='Indexed', author='Author', isbn='IDX-1',
+            barcode='IDX1', genre='Fiction', rack_no='A1', shelf_no='2'
+        )
+        rack_index.invalidate()
+
+    def test_classification_needs_no_queries_once_warm(self):
+        """Scans are classified from memory after the first lookup."""
+        rack_index.rack_sizes()
+        with self.assertNumQueries(0):
+            self.assertEqual(rack_index.classify('IDX1', 'A1')[0], 'correct')
+            self.assertEqual(rack_index.classify('IDX1', 'B1')[0], 'misplaced')
+            self.assertEqual(
+                rack_index.classify('NOPE', 'A1'), ('unknown', None)
+            )
+
+    def test_edits_update_index_on_commit(self):
+        """Moving, adding and deleting books is reflected without a rebuild."""
+        rack_index.rack_sizes()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.rack_no = 'B1'
+            self.book.barcode = 'IDX1-NEW'
+            self.book.save()
+            Book.objects.create(
+                title='Other', author='Author', isbn='IDX-2',
+                barcode='IDX2', genre='Fiction', rack_no='B1'
+            )
+        with self.assertNumQueries(0):
+            self.assertIsNone(rack_index.lookup('IDX1'))
+            self.assertEqual(rack_index.lookup('IDX1-NEW').rack_no, 'B1')
+            self.assertEqual(rack_index.rack_sizes(), {'B1': 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.get(barcode='IDX2').delete()
+        self.assertEqual(rack_index.rack_barcodes('B1'), {'IDX1-NEW'})
+
+    def test_only_location_changes_bump_version(self):
+        """Borrows and returns leave the index and its version alone."""
+        version = rack_index._shared.current()
+        book = Book.objects.get(pk=self.book.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            book.available_copies = 0
+            book.status = BookStatus.BORROWED
+            book.save()
+        self.assertEqual(rack_index._shared.current(), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            book.shelf_no = '3'
+            book.save()
+        self.assertNotEqual(rack_index._shared.current(), version)
+        self.assertEqual(rack_index.lookup('IDX1').shelf_no, '3')
+
+    def test_rack_summary_endpoint(self):
+        """Librarians get per-rack counts from the index."""
+        User.objects.bulk_create(
+            [User(username='librarian', role='librarian')]
+        )
+        self.client.force_login(User.objects.get(username='librarian'))
+        response = self.client.get(reverse('rack_summary'))
+        self.assertEqual(
+            response.json(), {'racks': {'A1': 1}, 'total_books': 1}
+        )
+        response = self.client.get(reverse('rack_summary'), {'rack_no': 'A1'})
+        self.assertEqual(response.json()['barcodes'], ['IDX1'])
+
+
+class GenrePoolTests(TestCase):
+    """Tests for the per-genre recommendation pools."""
+
+    def setUp(self):
+        self.books = {
+            rating: Book.objects.create(
+                title=f'Rated {rating}', author='Author',
+                isbn=f'POOL-{rating}', barcode=f'POOL{rating}',
+                genre='Poetry', rack_no='P1', average_rating=rating
+            )
+            for rating in (3.0, 4.5, 4.0)
+        }
+        genre_pools.invalidate()
+
+    def test_pool_is_ranked_and_served_from_memory(self):
+        """Pools rank by rating and need no queries once loaded."""
+        with self.assertNumQueries(1):
+            genre_pools.pool('Poetry')
+        with self.assertNumQueries(0):
+            recommended = genre_pools.recommend(
+                'Poetry', exclude=self.books[4.5].id
+            )
+        self.assertEqual(
+            [book.title for book in recommended], ['Rated 4.0', 'Rated 3.0']
+        )
+
+    def test_availability_change_reloads_only_that_genre(self):
+        """A book going out of stock drops out of its genre's pool."""
+        genre_pools.pool('Poetry')
+        genre_pools.pool('Other')
+        with self.captureOnCommitCallbacks(execute=True):
+            book = self.books[4.5]
+            book.status = BookStatus.BORROWED
+            book.save()
+        with self.assertNumQueries(0):
+            genre_pools.pool('Other')
+        with self.assertNumQueries(1):
+            titles = [book.title for book in genre_pools.pool('Poetry')]
+        self.assertEqual(titles, ['Rated 4.0', 'Rated 3.0'])
+
+    def test_copy_count_change_keeps_pools(self):
+        """Borrowing one of several copies leaves the pools loaded."""
+        genre_pools.pool('Poetry')
+        version = genre_pools._shared.current()
+        book = Book.objects.get(pk=self.books[4.5].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            book.available_copies = 0
+            book.save()
+        self.assertEqual(genre_pools._shared.current(), version)
+        with self.assertNumQueries(0):
+            genre_pools.pool('Poetry')
+
+    def test_rating_updates_refresh_pool(self):
+        """Ratings written with QuerySet.update still reorder the pool."""
+        reader = User.objects.create_user('reader', 'r@example.com', 'pass123')
+        genre_pools.pool('Poetry')
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(user=reader, book=self.books[3.0], rating=5)
+        titles = [book.title for book in genre_pools.pool('Poetry')]
+        self.assertEqual(titles, ['Rated 3.0', 'Rated 4.5', 'Rated 4.0'])
+
+        Book.objects.filter(pk=self.books[3.0].pk).update(average_rating=0)
+        genre_pools.invalidate()
+        self.assertEqual(genre_pools.pool('Poetry')[0].title, 'Rated 4.5')
+        call_command('rebuild_rating_aggregates', stdout=StringIO())
+        self.assertEqual(genre_pools.pool('Poetry')[0].title, 'Rated 3.0')
+
+    def test_book_detail_shows_more_like_this(self):
+        """The detail page lists other pooled books from the genre."""
+        User.objects.bulk_create([User(username='reader')])
+        self.client.force_login(User.objects.get(username='reader'))
+        response = self.client.get(
+            reverse('view_book_detail', args=[self.books[3.0].id])
+        )
+        self.assertEqual(
+            [book.title for book in response.context['more_like_this']],
+            ['Rated 4.5', 'Rated 4.0'],
+        )
+
+
+class BookNeighborTests(TestCase):
+    """Tests for the co-borrowing item-item recommender."""
+
+    def setUp(self):
+        self.books = [
+            Book.objects.create(
+                title=f'Book {n}', author='Author', isbn=f'NB-{n}',
+                barcode=f'NB{n}', genre='Fiction', rack_no='A1'
+            )
+            for n in range(6)
+        ]
+        User.objects.bulk_create([
+            User(username=f'reader{n}', email=f'r{n}@example.com')
+            for n in range(4)
+        ])
+        self.users = list(User.objects.order_by('username'))
+        shelves = {0: [0, 1], 1: [0, 1, 2], 2: [2, 3], 3: [4, 5]}
+        for user, books in shelves.items():
+            for book in books:
+                self.borrow(user, book)
+
+    def borrow(self, user, book):
+        Borrowing.objects.create(
+            user=self.users[user], book=self.books[book],
+            due_date=timezone.now() + timedelta(days=14),
+        )
+
+    def neighbours(self, book):
+        rows = BookNeighbor.objects.filter(book=self.books[book])
+        return [
+            (row.neighbor_id, round(row.score, 3))
+            for row in rows.order_by('rank')
+        ]
+
+    def test_full_build_ranks_by_cosine_similarity(self):
+        """Neighbours are ranked by the overlap of their reader sets."""
+        self.assertEqual(rebuild_neighbors(full=True), 6)
+        self.assertEqual(
+            self.neighbours(0),
+            [(self.books[1].id, 1.0), (self.books[2].id, 0.5)],
+        )
+        self.assertEqual(self.neighbours(3), [(self.books[2].id, 0.707)])
+
+        with self.assertNumQueries(1):
+            also = readers_also_borrowed(self.books[0])
+        self.assertEqual([book.title for book in also], ['Book 1', 'Book 2'])
+
+    def test_incremental_build_only_touches_affected_books(self):
+        """A new borrowing refreshes only the books sharing its readers."""
+        rebuild_neighbors(full=True)
+        untouched = BookNeighbor.objects.get(book=self.books[4]).computed_at
+        self.borrow(0, 3)
+
+        self.assertEqual(rebuild_neighbors(), 4)
+        self.assertIn(
+            self.books[3].id, [other for other, _ in self.neighbours(0)]
+        )
+        self.assertEqual(
+            BookNeighbor.objects.get(book=self.books[4]).computed_at,
+            untouched,
+        )
+
+    @skipIf(not SCIPY_AVAILABLE, 'SciPy is not installed')
+    def test_scipy_matches_python(self):
+        """Both engines produce the same neighbours."""
+        pairs = load_interactions()
+        targets = [book.id for book in self.books]
+        expected = similar_books_python(pairs, targets, 3)
+        actual = similar_books_scipy(pairs, targets, 3)
+        for book_id in targets:
+            self.assertEqual(
+                [other for other, _ in actual[book_id]],
+                [other for other, _ in expected[book_id]],
+            )
+
+
+class TrendingTests(TestCase):
+    """Tests for decayed popularity and the trending shelf."""
+
+    def setUp(self):
+        cache.clear()
+        popularity_buffer.flush()
+        self.book = Book.objects.create(
+            title='Hot Book', author='Author', isbn='HOT-1', barcode='HOT1',
+            genre='Fiction', rack_no='A1'
+        )
+        self.other = Book.objects.create(
+            title='Quiet Book', author='Author', isbn='HOT-2', barcode='HOT2',
+            genre='Fiction', rack_no='A1'
+        )
+        User.objects.bulk_create([
+            User(username='reader', email='reader@example.com'),
+            User(username='librarian', email='lib@example.com',
+                 role=UserRole.LIBRARIAN),
+        ])
+        self.reader = User.objects.get(username='reader')
+
+    def test_views_and_borrows_raise_popularity(self):
+        """Logged views and borrows add their weights to the score."""
+        self.client.force_login(self.reader)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('view_book_detail', args=[self.book.id]))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('borrow_book', args=[self.book.id]))
+        popularity_buffer.flush()
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.popularity, 4.0)
+
+    def test_events_are_written_in_batches(self):
+        """Views are summed in memory and written in one UPDATE when due."""
+        self.client.force_login(self.reader)
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            for book in (self.book, self.other, self.book):
+                self.client.get(reverse('view_book_detail', args=[book.id]))
+        self.assertEqual(len(callbacks), 3)
+        self.assertFalse(Book.objects.filter(popularity__gt=0).exists())
+
+        with self.assertNumQueries(1):
+            self.assertEqual(popularity_buffer.flush(), 2)
+        scores = Book.objects.order_by('pk').values_list(
+            'popularity', flat=True
+        )
+        self.assertEqual(list(scores), [2.0, 1.0])
+        with self.assertNumQueries(0):
+            popularity_buffer.flush()
+
+        with override_settings(TRENDING_FLUSH_BOOKS=1):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.get(
+                    reverse('view_book_detail', args=[self.other.id])
+                )
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.popularity, 2.0)
+
+    def test_decay_is_one_update(self):
+        """Decay halves scores per half-life and zeroes negligible ones."""
+        Book.objects.filter(pk=self.book.pk).update(popularity=8.0)
+        Book.objects.filter(pk=self.other.pk).update(popularity=0.015)
+        half_life = settings.TRENDING_HALF_LIFE_HOURS * 60
+        with self.assertNumQueries(1):
+            Book.decay_popularity(decay_factor(half_life))
+        scores = Book.objects.order_by('pk').values_list(
+            'popularity', flat=True
+        )
+        self.assertEqual(list(scores), [4.0, 0.0])
+
+    def test_decay_uses_time_since_last_run(self):
+        """The command decays by the real elapsed time and records its run."""
+        Book.objects.filter(pk=self.book.pk).update(popularity=8.0)
+        half_life = timedelta(hours=settings.TRENDING_HALF_LIFE_HOURS)
+        PopularityDecay.objects.create(decayed_at=timezone.now() - half_life)
+        call_command('decay_popularity', stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertAlmostEqual(self.book.popularity, 4.0, places=3)
+        decayed_at = PopularityDecay.objects.get().decayed_at
+        self.assertLess(timezone.now() - decayed_at, timedelta(minutes=1))
+
+        call_command('decay_popularity', stdout=StringIO())
+        self.book.refresh_from_db()
+        self.assertAlmostEqual(self.book.popularity, 4.0, places=3)
+        self.assertEqual(PopularityDecay.objects.count(), 1)
+
+    def test_decay_after_a_long_gap(self):
+        """A factor that underflows to zero resets scores without failing."""
+        Book.objects.filter(pk=self.book.pk).update(popularity=8.0)
+        self.assertEqual(decay_factor(10 ** 7), 0.0)
+        self.assertEqual(Book.decay_popularity(decay_factor(10 ** 7)), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.popularity, 0.0)
+
+    def test_trending_is_cached_and_shown(self):
+        """The cached top-N list is shown on the home page and dashboards."""
+        Book.bump_popularity({self.book.id: 3.0})
+        self.assertEqual([b['title'] for b in trending_books()], ['Hot Book'])
+        with self.assertNumQueries(0):
+            trending_books()
+
+        self.assertContains(
+            self.client.get(reverse('index')), 'Trending This Week'
+        )
+        for username in ('reader', 'librarian'):
+            self.client.force_login(User.objects.get(username=username))
+            self.assertContains(
+                self.client.get(reverse('dashboard')), 'Hot Book'
+            )
+
+
+def marc_record(control_number, fields):
+    """Encode one UTF-8 MARC21 record from ``{tag: {code: value}}``."""
+    entries = [('001', control_number)] + [
+        (tag, '  ' + ''.join(
+            f'\x1f{code}{value}' for code, value in subfields.items()
+        ))
+        for tag, subfields in fields.items()
+    ]
+    directory, data = b'', b''
+    for tag, text in entries:
+        encoded = text.encode() + b'\x1e'
+        directory += f'{tag}{len(encoded):04d}{len(data):05d}'.encode()
+        data += encoded
+    base = 24 + len(directory) + 1
+    length = base + len(data) + 1
+    leader = f'{length:05d}nam a22{base:05d} a 4500'.encode()
+    return leader + directory + b'\x1e' + data + b'\x1d'
+
+
+class CatalogImportTests(TestCase):
+    """Tests for bulk catalogue import."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        Book.objects.create(
+            title='Existing', author='Author', isbn='9780000000001',
+            barcode='EX1', genre='Fiction', rack_no='A1'
+        )
+        Book.objects.create(
+            title='Other', author='Author', isbn='9780000000002',
+            barcode='EX2', genre='Fiction', rack_no='A1'
+        )
+
+    def write_csv(self, rows):
+        path = os.path.join(self.directory, 'catalog.csv')
+        with open(path, 'w') as handle:
+            handle.write(
+                'title,author,isbn,barcode,genre,rack_no,total_copies\n'
+            )
+            handle.writelines(','.join(row) + '\n' for row in rows)
+        return path
+
+    def test_csv_import_dedupes_in_batches(self):
+        """Existing, repeated, conflicting and invalid rows are skipped."""
+        rows = [
+            [f'Book {n}', 'Author', f'978-1-{n:06d}', f'NEW{n}', 'Science',
+             'B1', '2']
+            for n in range(40)
+        ]
+        rows += [
+            ['Existing again', 'Author', '9780000000001', 'EX1', 'Fiction',
+             'A1', '1'],
+            ['Repeat', 'Author', '978-1-000000', 'OTHER', 'Science', 'B1',
+             '1'],
+            ['Conflict', 'Author', '9789999999999', 'EX2', 'Fiction', 'A1',
+             '1'],
+            ['No rack', 'Author', '9788888888888', 'NR1', 'Fiction', '', '1'],
+        ]
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries:
+            call_command(
+                'import_catalog', self.write_csv(rows), '--batch-size', '20',
+                stdout=out,
+            )
+
+        self.assertLess(len(queries), 30)
+        self.assertEqual(Book.objects.filter(genre='Science').count(), 40)
+        self.assertEqual(Book.objects.get(barcode='NEW3').available_copies, 2)
+        self.assertIn('40 created', out.getvalue())
+        self.assertIn(
+            '1 duplicates, 1 barcode conflicts, 1 invalid', out.getvalue()
+        )
+        state = self.write_csv(rows) + '.import-state'
+        self.assertFalse(os.path.exists(state))
+
+    def test_update_and_resume(self):
+        """--resume skips committed rows and --update rewrites books."""
+        rows = [
+            ['Skipped', 'Author', '9781111111111', 'S1', 'Fiction', 'A1', '1'],
+            ['Renamed', 'Author', '9780000000001', 'EX1', 'Fiction', 'C3',
+             '1'],
+        ]
+        path = self.write_csv(rows)
+        Checkpoint(path).save(1)
+        call_command(
+            'import_catalog', path, '--resume', '--update', stdout=StringIO()
+        )
+
+        self.assertFalse(Book.objects.filter(isbn='9781111111111').exists())
+        book = Book.objects.get(isbn='9780000000001')
+        self.assertEqual((book.title, book.rack_no), ('Renamed', 'C3'))
+
+    def test_marc_import(self):
+        """MARC21 records are mapped onto book fields."""
+        path = os.path.join(self.directory, 'catalog.mrc')
+        with open(path, 'wb') as handle:
+            handle.write(marc_record('ctl-1', {
+                '020': {'a': '978-0-14-044913-6 (pbk.)'},
+                '100': {'a': 'Dostoyevsky, Fyodor,'},
+                '245': {'a': 'Crime and punishment /'},
+                '260': {'b': 'Penguin,', 'c': 'c2003.'},
+                '300': {'a': '656 p.'},
+                '650': {'a': 'Russian fiction.'},
+                '852': {'c': 'D4', 'j': '2', 'p': 'BC-913'},
+            }))
+            handle.write(marc_record('ctl-2', {
+                '020': {'a': '9780199536368'},
+                '100': {'a': 'Austen, Jane.'},
+                '245': {'a': 'Émma'},
+                '650': {'a': 'Fiction'},
+                '852': {'c': 'D5'},
+            }))
+        call_command('import_catalog', path, stdout=StringIO())
+
+        book = Book.objects.get(barcode='BC-913')
+        self.assertEqual(
+            (book.isbn, book.title, book.author, book.publisher,
+             book.publication_year, book.pages, book.genre, book.rack_no,
+             book.shelf_no),
+            ('9780140449136', 'Crime and punishment', 'Dostoyevsky, Fyodor',
+             'Penguin', 2003, 656, 'Russian fiction', 'D4', '2'),
+        )
+        self.assertEqual(Book.objects.get(barcode='ctl-2').title, 'Émma')
+
+    def test_form_and_import_store_the_same_isbn(self):
+        """Hyphenated ISBNs from forms are stored compact for re-imports."""
+        data = {'title': 'Typed', 'author': 'Author',
+                'isbn': '978-3-16-148410-0', 'barcode': 'T1',
+                'genre': 'Fiction', 'rack_no': 'A1', 'total_copies': 1}
+        form = BookForm(data)
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().isbn, '9783161484100')
+        invalid = {**data, 'isbn': '978-0-00-000000-1', 'barcode': 'T2'}
+        self.assertFalse(BookForm(invalid).is_valid())
+        local = {**data, 'isbn': 'LOCAL-7', 'barcode': 'T3'}
+        self.assertEqual(BookForm(local).save().isbn, 'LOCAL-7')
+
+        stats = import_rows(iter([
+            {'title': 'Typed', 'author': 'Author',
+             'isbn': '978 3 16 148410 0', 'barcode': 'T1',
+             'genre': 'Fiction', 'rack_no': 'A1'},
+        ]))
+        self.assertEqual(
+            (stats['created'], stats['unchanged'], stats['conflict']),
+            (0, 1, 0),
+        )
+
+    def test_partial_isbn_is_invalid(self):
+        """Imports reject ISBNs that compact_isbn cannot make whole."""
+        row = {'title': 'Partial', 'author': 'Author', 'barcode': 'P1',
+               'genre': 'Fiction', 'rack_no': 'A1'}
+        stats = import_rows(iter([
+            {**row, 'isbn': '978-0-14 (pbk.)'},
+            {**row, 'isbn': '9780140449136 (pbk.)', 'barcode': 'P2'},
+        ]))
+
+        self.assertEqual((stats['created'], stats['invalid']), (1, 1))
+        self.assertEqual(Book.objects.get(barcode='P2').isbn, '9780140449136')
+        self.assertEqual(compact_isbn('978-0-14 (pbk.)'), '978-0-14 (pbk.)')
+
+    def test_batch_retried_row_by_row_on_integrity_error(self):
+        """Rows another writer inserted after the lookup count as conflicts."""
+        rows = [
+            {'title': 'Raced', 'author': 'Author', 'isbn': '9780000000001',
+             'barcode': 'RACE1', 'genre': 'Fiction', 'rack_no': 'A1'},
+            {'title': 'Fresh', 'author': 'Author', 'isbn': '9785555555555',
+             'barcode': 'FRESH1', 'genre': 'Fiction', 'rack_no': 'A1'},
+        ]
+        with patch.object(type(Book.objects), 'in_bulk', return_value={}):
+            stats = import_rows(iter(rows))
+        self.assertEqual((stats['created'], stats['conflict']), (1, 1))
+        self.assertTrue(Book.objects.filter(barcode='FRESH1').exists())
+        self.assertFalse(Book.objects.filter(barcode='RACE1').exists())
+
+
+class GenerateDatasetTests(TestCase):
+    """Tests for the synthetic dataset generator."""
+
+    def generate(self, prefix, seed=7):
+        call_command(
+            'generate_dataset', '--prefix', prefix, '--seed', str(seed),
+            '--users', '20', '--books', '50', '--borrowings', '400',
+            '--reservations', '20', '--reviews', '60',
+            '--notifications', '30', '--activity', '100',
+            '--batch-size', '64', stdout=StringIO(),
+        )
+        rows = Borrowing.objects.filter(
+            user__username__startswith=f'{prefix}-'
+        ).values_list(
+            'user__username', 'book__isbn', 'borrowed_at', 'returned_at'
+        )
+        return sorted(
+            (username.split('-', 1)[1], isbn.split('-', 1)[1], borrowed_at,
+             returned_at is None)
+            for username, isbn, borrowed_at, returned_at in rows
+        )
+
+    def test_same_seed_same_data(self):
+        """A seed reproduces the same history, independent of existing rows."""
+        self.assertEqual(self.generate('a'), self.generate('b'))
+        self.assertNotEqual(self.generate('c', seed=8), self.generate('d'))
+
+    def test_distributions_and_aggregates(self):
+        """Popularity is Zipfian and derived counters are reconciled."""
+        self.generate('z')
+        counts = list(
+            Borrowing.objects.values('book__isbn')
+            .annotate(n=Count('id')).order_by('-n')
+            .values_list('book__isbn', flat=True)[:1]
+        )
+        self.assertEqual(counts, ['z-000000000'])
+        self.assertTrue(Borrowing.objects.filter(
+            returned_at__isnull=True, due_date__lt=timezone.now()
+        ).exists())
+        self.assertEqual(
+            Book.objects.aggregate(n=Sum('rating_count'))['n'],
+            Review.objects.count(),
+        )
+        self.assertTrue(trending_books())
+        self.assertTrue(PopularityDecay.objects.exists())
+
+
+class ImageVariantTests(TestCase):
+    """Tests for resized cover image variants."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        override = override_settings(
+            MEDIA_ROOT=self.media_root, IMAGE_VARIANT_WORKERS=0
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.user = User.objects.create_user(
+            'reader', 'reader@example.com', 'pass123'
+        )
+        self.client.force_login(self.user)
+
+    def cover(self, name='cover.png'):
+        output = BytesIO()
+        Image.new('RGB', (1200, 1600), 'navy').save(output, 'PNG')
+        return SimpleUploadedFile(
+            name, output.getvalue(), content_type='image/png'
+        )
+
+    def make_book(self, isbn='IMG1'):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Book.objects.create(
+                title='Covered', author='Author', isbn=isbn,
+                barcode=f'B-{isbn}', genre='Art', rack_no='A1',
+                cover_image=self.cover(),
+            )
+
+    def variant_path(self, book, variant, ext):
+        return os.path.join(
+            self.media_root, variant_name(book.cover_image.name, variant, ext)
+        )
+
+    def test_variants_rendered_after_upload(self):
+        """Each size is stored as WebP and JPEG and the book is marked."""
+        book = self.make_book()
+        book.refresh_from_db()
+        self.assertEqual(book.cover_variants_source, book.cover_image.name)
+        for variant, width in settings.IMAGE_VARIANTS.items():
+            for ext in ('webp', 'jpg'):
+                path = self.variant_path(book, variant, ext)
+                with Image.open(path) as image:
+                    self.assertEqual(image.width, width)
+
+        html = self.client.get(reverse('view_books')).content.decode()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(f' {settings.IMAGE_VARIANTS["card"]}w', html)
+
+    def test_backfill_command(self):
+        """process_images renders variants for covers that lack them."""
+        with patch('library.images.schedule_variants'):
+            book = self.make_book()
+        book.refresh_from_db()
+        self.assertEqual(book.cover_variants_source, '')
+        html = self.client.get(reverse('view_books')).content.decode()
+        self.assertNotIn('srcset', html)
+
+        call_command('process_images', '--workers', '1', stdout=StringIO())
+        book.refresh_from_db()
+        self.assertEqual(book.cover_variants_source, book.cover_image.name)
+        self.assertTrue(
+            os.path.exists(self.variant_path(book, 'thumb', 'webp'))
+        )
+
+    def test_only_image_changes_schedule_and_replace_variants(self):
+        """Other saves do nothing; a new cover replaces the old variants."""
+        book = self.make_book()
+        variants = os.path.dirname(
+            self.variant_path(Book.objects.get(pk=book.pk), 'thumb', 'webp')
+        )
+        self.assertEqual(
+            len(os.listdir(variants)), 2 * len(settings.IMAGE_VARIANTS)
+        )
+
+        book = Book.objects.get(pk=book.pk)
+        book.available_copies = 0
+        with patch('library.images.schedule_variants') as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                book.save()
+        schedule.assert_not_called()
+
+        book.cover_image = self.cover('new.png')
+        with self.captureOnCommitCallbacks(execute=True):
+            book.save()
+        book.refresh_from_db()
+        self.assertEqual(book.cover_variants_source, book.cover_image.name)
+        self.assertEqual(
+            sorted(os.listdir(variants)),
+            sorted(os.path.basename(self.variant_path(book, variant, ext))
+                   for variant in settings.IMAGE_VARIANTS
+                   for ext in ('webp', 'jpg')),
+        )
+
+    @override_settings(IMAGE_VARIANT_WORKERS=1)
+    def test_image_in_flight_is_not_resubmitted(self):
+        """A second save while the image renders does not queue it again."""
+        with patch('library.images.schedule_variants'):
+            book = self.make_book()
+        started, release = threading.Event(), threading.Event()
+
+        def slow_process(model, pk, name):
+            started.set()
+            release.wait(5)
+            return 1
+
+        with patch('library.images.process_image',
+                   side_effect=slow_process) as process:
+            future = schedule_variants(book)
+            started.wait(5)
+            self.assertIsNone(schedule_variants(book))
+            release.set()
+            future.result(5)
+            schedule_variants(book).result(5)
+        self.assertEqual(process.call_count, 2)
+
+
+class QueryBudgetTests(TestCase):
+    """The hot views stay within their committed query budgets."""
+
+    def test_views_within_query_budget(self):
+        call_command(
+            'generate_dataset', '--prefix', 'budget', '--users', '30',
+            '--books', '80', '--borrowings', '600', '--reservations', '20',
+            '--reviews', '100', '--notifications', '40', '--activity', '100',
+            stdout=StringIO(),
+        )
+        results = run_scenarios(repeat=2)
+        budgets = load_budgets()
+        self.assertEqual(
+            sorted(result.name for result in results), sorted(budgets)
+        )
+        self.assertEqual(
+            regressions(results, budgets, check_time=False, exact=True), []
+        )
+
+
+class RequestMetricsTests(TestCase):
+    """Tests for the request metrics middleware and /metrics endpoint."""
+
+    def setUp(self):
+        metrics_registry.reset()
+        self.user = User.objects.create_user(
+            'reader', 'reader@example.com', 'pass123'
+        )
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_sampled_request_is_exported(self):
+        """Latency, status, queries, DB time and cache hits appear per view."""
+        self.client.get(reverse('index'))
+        self.client.get('/no-such-page/')
+        self.client.force_login(self.user)
+        self.client.get(reverse('view_books'))
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn(
+            'smartlib_requests_total'
+            '{view="view_books",method="GET",status="200"} 1',
+            body,
+        )
+        self.assertIn(
+            'smartlib_requests_total'
+            '{view="unmatched",method="GET",status="404"} 1',
+            body,
+        )
+        self.assertIn(
+            'smartlib_request_duration_seconds_count'
+            '{view="view_books",method="GET"} 1',
+            body,
+        )
+        self.assertIn(
+            'smartlib_request_duration_seconds_bucket'
+            '{view="view_books",method="GET",le="+Inf"} 1',
+            body,
+        )
+        self.assertRegex(
+            body, r'smartlib_request_queries_sum\{view="view_books"\} [1-9]'
+        )
+        self.assertIn('smartlib_db_seconds_total{view="view_books"}', body)
+        self.assertRegex(
+            body,
+            r'smartlib_cache_requests_total'
+            r'\{cache="default",result="(hit|miss)"\} [1-9]',
+        )
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_unsampled_requests_skip_queries(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('view_books'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('view="view_books"', body)
+        self.assertNotIn(
+            'smartlib_request_queries_count{view="view_books"}', body
+        )
+
+    def test_async_chain_and_streaming_responses(self):
+        """Under ASGI the middleware stays async; streams are counted only."""
+        async def stream(request):
+            return StreamingHttpResponse(iter(['data: 1\n\n']))
+
+        middleware = RequestMetricsMiddleware(stream)
+        self.assertTrue(iscoroutinefunction(middleware))
+        async_to_sync(middleware)(RequestFactory().get('/stream/'))
+
+        body = metrics_registry.render()
+        self.assertIn(
+            'smartlib_requests_total'
+            '{view="unmatched",method="GET",status="200"} 1',
+            body,
+        )
+        self.assertNotIn('smartlib_request_duration_seconds_count', body)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8'])
+    def test_access_is_restricted(self):
+        """Only staff and allow-listed addresses can read the metrics."""
+        url = reverse('metrics')
+
+        def status(address):
+            return self.client.get(url, REMOTE_ADDR=address).status_code
+
+        self.assertEqual(status('203.0.113.9'), 403)
+        self.assertEqual(status('10.2.3.4'), 200)
+        self.client.force_login(self.user)
+        self.assertEqual(status('203.0.113.9'), 403)
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(url, REMOTE_ADDR='203.0.113.9')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(
+            response['Content-Type'].startswith('text/plain; version=0.0.4')
+        )
+
+
+class ProfilingTests(TestCase):
+    """Tests for sampled request profiling."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        override = override_settings(
+            PROFILING_DIR=self.directory, PROFILING_SAMPLE_RATE=0
+        )
+        override.enable()
+        self.addCleanup(override.disable)
+        self.librarian = User.objects.create_user(
+            'librarian', 'lib@example.com', 'pass123',
+            role=UserRole.LIBRARIAN,
+        )
+        self.student = User.objects.create_user(
+            'student', 'student@example.com', 'pass123'
+        )
+
+    def test_header_profiles_for_librarians_only(self):
+        """X-Profile is ignored for students and honoured for librarians."""
+        self.client.force_login(self.student)
+        self.client.get(reverse('view_books'), HTTP_X_PROFILE='1')
+        self.assertEqual(slowest_profiles(), [])
+
+        self.client.force_login(self.librarian)
+        self.client.get(reverse('view_books'), HTTP_X_PROFILE='1')
+        [profile] = slowest_profiles()
+        self.assertEqual(
+            (profile['view'], profile['status'], profile['user']),
+            ('view_books', 200, 'librarian'),
+        )
+        self.assertGreater(profile['queries'], 0)
+
+        page = self.client.get(reverse('profile_list'))
+        detail_url = reverse('profile_detail', args=[profile['name']])
+        self.assertContains(page, detail_url)
+        self.assertContains(self.client.get(detail_url), 'view_books')
+        download = self.client.get(
+            reverse('profile_download', args=[profile['name']])
+        )
+        path = os.path.join(self.directory, f"{profile['name']}.prof")
+        with open(path, 'rb') as handle:
+            content = handle.read()
+        self.assertEqual(b''.join(download.streaming_content), content)
+        self.assertTrue(any(
+            function[2] == 'view_books'
+            for function in pstats.Stats(path).stats
+        ))
+
+    def test_async_chain_skips_streams_and_async_views(self):
+        """Under ASGI, streams and async views are skipped."""
+        self.client.force_login(self.librarian)
+        self.client.get(reverse('view_books'), HTTP_X_PROFILE='1')
+        [profile] = slowest_profiles()
+
+        async def fetch(url):
+            return await self.async_client.get(url, headers={'X-Profile': '1'})
+
+        self.async_client.force_login(self.librarian)
+        response = async_to_sync(fetch)(reverse('view_books'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(slowest_profiles()), 2)
+        download = reverse('profile_download', args=[profile['name']])
+        async_to_sync(fetch)(download)
+        self.assertEqual(len(slowest_profiles()), 2)
+
+        async def view(request):
+            return HttpResponse()
+
+        middleware = ProfilingMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/', HTTP_X_PROFILE='1')
+        request.user = self.librarian
+        self.assertIsNone(middleware.process_view(request, view, (), {}))
+
+        page = self.client.get(reverse('profile_list'))
+        self.assertContains(page, 'Async views')
+
+    def test_sampling_and_rotation(self):
+        """Sampled requests are profiled and old profiles are rotated out."""
+        self.client.force_login(self.student)
+        with override_settings(PROFILING_SAMPLE_RATE=1):
+            self.client.get(reverse('view_books'))
+        self.assertEqual(len(slowest_profiles()), 1)
+        response = self.client.get(reverse('profile_list'))
+        self.assertEqual(response.status_code, 302)
+
+        directory = Path(self.directory)
+        for name in os.listdir(directory):
+            os.remove(directory / name)
+        for stamp in (1000, 2000, 3000):
+            (directory / f'{stamp}-0000000a.prof').write_bytes(b'x' * 90)
+            (directory / f'{stamp}-0000000a.json').write_bytes(b'y' * 10)
+        rotate(directory, 250)
+        self.assertEqual(sorted(os.listdir(directory)), [
+            '2000-0000000a.json', '2000-0000000a.prof',
+            '3000-0000000a.json', '3000-0000000a.prof',
+        ])
+
+
+class LoadTestHarnessTests(TestCase):
+    """Tests for the load-test scenarios and report."""
+
+    def test_every_task_succeeds(self):
+        """Each student and librarian task issues requests the app accepts."""
+        call_command(
+            'generate_dataset', '--prefix', 'load', '--users', '20',
+            '--books', '30', '--borrowings', '100', '--reservations', '5',
+            '--reviews', '20', '--notifications', '10', '--activity', '10',
+            stdout=StringIO(),
+        )
+        User.objects.create_user('load-librarian', role=UserRole.LIBRARIAN)
+        workload = load_workload('load')
+        stats = Stats()
+        for user_class in USER_CLASSES:
+            user = user_class(
+                ClientTransport(), stats, workload, random.Random(1)
+            )
+            user.transport.login(user.user)
+            for task in user_class.tasks:
+                getattr(user, task)()
+        user.scan()
+
+        rows = {row['name']: row for row in stats.rows()}
+        self.assertTrue({
+            'view_books (search)', 'borrow_book', 'get_user_borrowings',
+            'dashboard',
+        } <= set(rows))
+        self.assertEqual(rows['total']['failures'], 0)
+        self.assertLessEqual(rows['total']['p50_ms'], rows['total']['p99_ms'])
+
+    def test_only_local_targets(self):
+        for url in ('http://localhost:8000', 'http://127.0.0.1:8000',
+                    'http://[::1]:8000'):
+            check_local(url)
+        for url in ('http://example.com', 'http://10.0.0.5:8000',
+                    'https://library.example.org'):
+            with self.assertRaises(LocalOnlyError):
+                check_local(url)
+
+
+class SQLiteTuningTests(TestCase):
+    """Tests for the SQLite connection tuning."""
+
+    def test_pragmas_and_immediate_transactions(self):
+        """New connections use WAL and take the write lock at BEGIN."""
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'tuned.sqlite3')
+        wrapper = DatabaseWrapper(
+            {**connection.settings_dict, 'NAME': path}, alias='tuning-test'
+        )
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(
+                cursor.fetchone()[0], settings.SQLITE_PRAGMAS['busy_timeout']
+            )
+            cursor.execute('CREATE TABLE item (id INTEGER PRIMARY KEY)')
+
+        wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(path, timeout=0, isolation_level=None)
+        self.addCleanup(other.close)
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute('BEGIN IMMEDIATE')
+        wrapper.cursor().execute('ROLLBACK')
+        other.execute('BEGIN IMMEDIATE')
+        other.execute('ROLLBACK')
+
+    def test_transaction_mode_follows_django_version(self):
+        """Django 5.1+ gets the option; older ones keep the hook we patch."""
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        options = settings.DATABASES['default'].get('OPTIONS', {})
+        if NATIVE_TRANSACTION_MODE:
+            self.assertEqual(options.get('transaction_mode'), 'IMMEDIATE')
+        else:
+            self.assertNotIn('transaction_mode', options)
+            self.assertTrue(callable(
+                getattr(DatabaseWrapper, '_start_transaction_under_autocommit')
+            ))
+
+    def test_pragma_values_are_checked(self):
+        self.assertEqual(
+            pragma_statements({'cache_size': -2000}),
+            ['PRAGMA cache_size = -2000'],
+        )
+        with self.assertRaises(ValueError):
+            pragma_statements({'journal_mode': 'wal; DROP TABLE library_book'})
+
+
+class FramePreprocessorTests(TestCase):
+    """Tests for frame preprocessing ahead of decoding."""
+
+    def test_grayscale_downscale_and_crop(self):
+        """Frames are cropped to the ROI, converted and downscaled."""
+        preprocessor = FramePreprocessor(
+            max_width=100, roi=(0.25, 0.0, 0.75, 1.0)
+        )
+        image = preprocessor.process(Image.new('RGB', (800, 400)))
+        self.assertEqual(image.mode, 'L')
+        self.assertEqual(image.size, (100, 100))
+
+    def test_near_identical_frames_are_skipped(self):
+        """Only frames that differ from the previous kept one survive."""
+        preprocessor = FramePreprocessor(skip_distance=2)
+        frames = [split_frame(True), split_frame(True), split_frame(False)]
+        kept = [preprocessor.process(frame) for frame in frames]
+        self.assertEqual(
+            [frame is not None for frame in kept], [True, False, True]
+        )
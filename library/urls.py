@@ -21,7 +21,12 @@ urlpatterns = [
 
     # Barcode & QR code
     path('scan/', views.scan_book, name='scan_book'),
+    path('api/scan/decode/', views.decode_barcodes, name='decode_barcodes'),
+    path('api/audit/', views.rack_audit, name='rack_audit'),
+    path('api/racks/', views.rack_summary, name='rack_summary'),
     path('book/<int:book_id>/qr/', views.generate_qr_code, name='generate_qr'),
+    path('book/<int:book_id>/qr.png', views.book_qr_png, name='book_qr_png'),
+    path('labels/qr/', views.qr_label_sheets, name='qr_label_sheets'),
 
     # Borrowing system
     path('borrow/<int:book_id>/', views.borrow_book, name='borrow_book'),
@@ -34,9 +39,24 @@ urlpatterns = [
     # Notifications
     path('notifications/', views.get_notifications, name='get_notifications'),
     path('notification/<int:notification_id>/read/', views.mark_notification_read, name='mark_notification_read'),
+    path('notifications/read/', views.mark_notifications_read,
+         name='mark_notifications_read'),
+    path('notifications/preferences/',
+         views.update_notification_preferences,
+         name='update_notification_preferences'),
 
     # API endpoints
     path('api/book/<int:book_id>/status/', views.get_book_status, name='get_book_status'),
+    path('api/book/<int:book_id>/reviews/', views.get_book_reviews,
+         name='get_book_reviews'),
     path('api/user/borrowings/', views.get_user_borrowings, name='get_user_borrowings'),
     path('api/stats/', views.get_stats, name='get_stats'),
+    path('api/stream/', views.event_stream, name='event_stream'),
+    path('api/realtime/metrics/', views.get_realtime_metrics,
+         name='get_realtime_metrics'),
+    path('metrics', views.metrics, name='metrics'),
+    path('profiles/', views.profile_list, name='profile_list'),
+    path('profiles/<str:name>/', views.profile_detail, name='profile_detail'),
+    path('profiles/<str:name>/download/', views.profile_download,
+         name='profile_download'),
 ]
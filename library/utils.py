@@ -1,7 +1,23 @@
 """Utility functions for the library app."""
-from .models import ActivityLog, Notification
+from .models import ActivityLog, Notification, NotificationDelivery
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Concat, Greatest
 from django.utils import timezone
 from datetime import timedelta
+from io import BytesIO
+import hashlib
+import os
+import qrcode
+import tempfile
+import time
 
 
 def log_activity(request, action, book=None, user=None, details=None):
@@ -10,24 +26,163 @@ def log_activity(request, action, book=None, user=None, details=None):
         user=user or (request.user if request.user.is_authenticated else None),
         book=book,
         action=action,
-        details=details,
-        ip_address=get_client_ip(request)
+        details=details or '',
+        ip_address=get_client_ip(request) or ''
     )
     return activity
 
 
-def create_notification(user, title, message, notification_type):
-    """Create a notification for a user."""
-    notification = Notification.objects.create(
-        user=user,
-        title=title,
-        message=message,
-        type=notification_type,
-        expires_at=timezone.now() + timedelta(days=30)
+def create_notification(user, title, message, notification_type,
+                        expires_in=timedelta(days=30)):
+    """Create a notification for a user.
+
+    Time is cut into ``NOTIFICATION_COALESCE_WINDOW``-second windows, and
+    same-type notifications in the window of an unread one are merged into
+    that row instead of creating a new one. The merge is a single UPDATE, and
+    a unique constraint allows one unread row per user, type and window, so a
+    concurrent burst that loses the race to insert retries as a merge. This
+    holds on SQLite, where ``select_for_update()`` does nothing. Merged rows
+    are pushed again so the live toast shows the whole burst. Users on daily
+    digests are never pushed to here; ``send_notification_digests`` folds
+    their rows later.
+    """
+    now = timezone.now()
+    window = getattr(settings, 'NOTIFICATION_COALESCE_WINDOW', 0)
+    instant = user.notification_delivery == NotificationDelivery.INSTANT
+    key = str(int(now.timestamp()) // window) if window else None
+
+    for attempt in range(2):
+        try:
+            with transaction.atomic():
+                notification = None
+                if key:
+                    notification = merge_notification(
+                        user, notification_type, key, message, now + expires_in
+                    )
+                if notification is None:
+                    notification = Notification.objects.create(
+                        user=user,
+                        title=title,
+                        message=message,
+                        type=notification_type,
+                        coalesce_key=key,
+                        expires_at=now + expires_in
+                    )
+            break
+        except IntegrityError:
+            # Another request inserted the window's row first; merge into it
+            if attempt:
+                raise
+
+    if instant:
+        transaction.on_commit(lambda: push_notification(notification))
+    return notification
+
+
+def merge_notification(user, notification_type, key, message, expires_at):
+    """Merge ``message`` into the unread row of a window, if there is one."""
+    rows = Notification.objects.filter(
+        user=user, type=notification_type, coalesce_key=key, is_read=False
+    )
+    merged = rows.update(
+        count=F('count') + 1,
+        message=Concat('message', Value(f'\n{message}')),
+        expires_at=Greatest('expires_at', Value(expires_at)),
     )
+    if not merged:
+        return None
+    # The UPDATE holds the row's write lock until commit, so count is current
+    notification = rows.get()
+    notification.title = coalesced_title(notification_type, notification.count)
+    notification.save(update_fields=['title'])
     return notification
 
 
+def coalesced_title(notification_type, count):
+    """Title used for a row that merges several notifications of one type."""
+    label = dict(Notification.TYPE_CHOICES).get(notification_type, 'Info')
+    return f'{count} {label} notifications'
+
+
+def push_notification(notification):
+    """Send a notification to the user's WebSocket group if a layer exists."""
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+
+    async_to_sync(channel_layer.group_send)(
+        f'user_{notification.user_id}',
+        {
+            'type': 'notification.message',
+            'title': notification.title,
+            'message': notification.message,
+            'notification_type': notification.type,
+        }
+    )
+
+
+def render_qr_png(data, box_size=10, border=4):
+    """Render ``data`` as a QR code PNG and return the bytes."""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=box_size,
+        border=border,
+    )
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = BytesIO()
+    image = qr.make_image(fill_color="black", back_color="white")
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def get_qr_code(data):
+    """Get the storage name of the cached QR PNG for ``data``.
+
+    The PNG is rendered once. Files are named by the SHA-256 of the encoded
+    data, so a name always maps to the same image and can be served with
+    immutable cache headers. The file only appears under that name once it
+    is complete.
+    """
+    name = f'qr/{hashlib.sha256(data.encode()).hexdigest()}.png'
+    if not default_storage.exists(name):
+        save_atomic(name, render_qr_png(data))
+    return name
+
+
+def save_atomic(name, content):
+    """Write ``content`` to storage ``name``, replacing any existing file.
+
+    The bytes go to a temporary file in the same directory, which is then
+    renamed over ``name``. Readers, and nginx, see either the old file or the
+    complete new one, and concurrent writers never get suffixed copies.
+    """
+    path = default_storage.path(name)
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as handle:
+            handle.write(content)
+        os.chmod(temporary, default_storage.file_permissions_mode or 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+    return name
+
+
+def site_url(path):
+    """Absolute URL for ``path`` on the configured ``SITE_URL``.
+
+    Used for links that outlive the request, such as QR codes, so they never
+    depend on the Host header of whoever first asked for them.
+    """
+    return f"{settings.SITE_URL.rstrip('/')}{path}"
+
+
 def get_client_ip(request):
     """Get client IP address from request."""
     x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
@@ -36,3 +191,46 @@ def get_client_ip(request):
     else:
         ip = request.META.get('REMOTE_ADDR')
     return ip
+
+
+def cache_is_shared():
+    """False if the default cache lives in this process only.
+
+    Without a shared cache (``REDIS_URL``), ``SharedVersion`` bumps never
+    leave the process that made them.
+    """
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+STALE_SERVER_WARNING = (
+    'No shared cache is configured (set REDIS_URL), so a running server '
+    'keeps its rack index and recommendation pools. Restart it to reload them.'
+)
+
+
+class SharedVersion:
+    """A cache counter that tells processes their in-memory data is stale.
+
+    Each process remembers the version it loaded. A writer calls ``bump()``;
+    every other process sees a different ``current()`` and reloads. This only
+    reaches other processes when ``cache_is_shared()``.
+    """
+
+    def __init__(self, key):
+        self.key = key
+
+    def current(self):
+        version = cache.get(self.key)
+        if version is None:
+            # Seed from the clock so a flushed cache never repeats a version
+            cache.add(self.key, time.time_ns(), timeout=None)
+            version = cache.get(self.key)
+        return version
+
+    def bump(self):
+        try:
+            return cache.incr(self.key)
+        except ValueError:
+            version = time.time_ns()
+            cache.set(self.key, version, timeout=None)
+            return version
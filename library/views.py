@@ -1,36 +1,50 @@
 """Views for the library app."""
 from django.shortcuts import render, redirect, get_object_or_404
+from django.urls import reverse
+from django.core.files.storage import default_storage
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import (
+    FileResponse, Http404, JsonResponse, HttpResponse, StreamingHttpResponse,
+)
 from django.views.decorators.http import require_http_methods, require_POST
 from django.utils import timezone
+from django.utils.http import url_has_allowed_host_and_scheme
 from django.core.paginator import Paginator
-from django.db.models import Q, Avg
+from django.db.models import Q
 from datetime import timedelta
 
-# Optional: OpenCV and pyzbar for barcode scanning (not available in all environments)
-try:
-    import cv2
-    from pyzbar.pyzbar import decode
-    BARCODE_SCANNING_AVAILABLE = True
-except ImportError:
-    BARCODE_SCANNING_AVAILABLE = False
-    cv2 = None
-    decode = None
-
-import qrcode
-from io import BytesIO
+import asyncio
 import base64
 import json
+import time
+from asgiref.sync import sync_to_async
+from channels.layers import get_channel_layer
+from django.conf import settings
 from functools import wraps
 
 from .models import (
-    User, Book, Borrowing, Reservation, Review, ActivityLog, Notification, UserRole, BookStatus
+    User, Book, Borrowing, Reservation, Review, ActivityLog, Notification,
+    UserRole, BookStatus, NotificationDelivery
 )
 from .forms import UserRegistrationForm, UserLoginForm, BookForm, ReviewForm
-from .utils import log_activity, create_notification
+from .utils import log_activity, create_notification, get_qr_code, site_url
+from .audit import (
+    audit_report, decode_frames, image_frames, video_upload_frames
+)
+from .labels import iter_label_sheets, iterate_in_thread, stream_label_zip
+from .metrics import is_metrics_client, registry as metrics_registry
+from .profiling import profile_path, profile_report, slowest_profiles
+from .rack_index import rack_index, CORRECT, UNKNOWN
+from .recommendations import genre_pools, readers_also_borrowed, trending_books
+from .scanning import (
+    BARCODE_SCANNING_AVAILABLE, DecodeTimeout, InvalidImage, ScannerBusy,
+    decode_uploads, run_decoder,
+)
+from .consumers import (
+    get_cached_realtime_counts, get_connection_metrics, notification_payload,
+)
 
 
 def librarian_required(view_func):
@@ -121,6 +135,7 @@ def index(request):
         'book_count': book_count,
         'user_count': user_count,
         'total_borrowed': total_borrowed,
+        'trending': trending_books(),
     }
     return render(request, 'index.html', context)
 
@@ -134,23 +149,31 @@ def dashboard(request):
         available_books = Book.objects.filter(status=BookStatus.AVAILABLE).count()
         total_members = User.objects.filter(role=UserRole.STUDENT).count()
         active_borrowings = Borrowing.objects.filter(returned_at__isnull=True).count()
-        overdue_count = sum(1 for b in Borrowing.objects.filter(returned_at__isnull=True) if b.is_overdue())
+        overdue_count = Borrowing.objects.filter(
+            returned_at__isnull=True, due_date__lt=timezone.now()
+        ).count()
 
         # Recent activities
-        recent_activities = ActivityLog.objects.order_by('-timestamp')[:10]
+        recent_activities = ActivityLog.objects.select_related(
+            'book', 'user'
+        ).order_by('-timestamp')[:10]
 
         context = {
             'total_books': total_books,
             'available_books': available_books,
+            'checked_out_books': total_books - available_books,
             'total_members': total_members,
             'active_borrowings': active_borrowings,
             'overdue_count': overdue_count,
             'recent_activities': recent_activities,
+            'trending': trending_books(),
         }
         return render(request, 'librarian_dashboard.html', context)
     else:
         # Student dashboard
-        active_borrowings = request.user.get_active_borrowings()
+        active_borrowings = list(
+            request.user.get_active_borrowings().select_related('book')
+        )
         overdue_count = sum(1 for b in active_borrowings if b.is_overdue())
         total_fine = sum(b.calculate_fine() for b in active_borrowings if b.is_overdue())
 
@@ -164,6 +187,8 @@ def dashboard(request):
             'overdue_count': overdue_count,
             'total_fine': total_fine,
             'notifications': notifications,
+            'due_soon': timezone.now() + timedelta(days=3),
+            'trending': trending_books(5),
         }
         return render(request, 'student_dashboard.html', context)
 
@@ -203,6 +228,7 @@ def view_books(request):
 
     context = {
         'books': books,
+        'page_range': paginator.get_elided_page_range(books.number),
         'genres': genres,
         'search_query': search_query,
         'genre_filter': genre_filter,
@@ -210,11 +236,38 @@ def view_books(request):
     return render(request, 'list_books.html', context)
 
 
+REVIEWS_PER_PAGE = 10
+
+# Each sort mode is backed by a (book, ...) composite index on Review
+REVIEW_SORTS = {
+    'helpful': ('-helpful_count', '-created_at'),
+    'newest': ('-created_at',),
+}
+
+
+def get_review_page(book, sort, page):
+    """Get one page of a book's reviews plus whether another page follows.
+
+    Fetches one extra row instead of running a COUNT query.
+    """
+    ordering = REVIEW_SORTS.get(sort, REVIEW_SORTS['helpful'])
+    start = (page - 1) * REVIEWS_PER_PAGE
+    reviews = list(
+        Review.objects.filter(book=book)
+        .select_related('user')
+        .order_by(*ordering)[start:start + REVIEWS_PER_PAGE + 1]
+    )
+    return reviews[:REVIEWS_PER_PAGE], len(reviews) > REVIEWS_PER_PAGE
+
+
 @login_required
 def view_book_detail(request, book_id):
     """View book details and reviews."""
     book = get_object_or_404(Book, pk=book_id)
-    reviews = Review.objects.filter(book=book).order_by('-created_at')
+    review_sort = request.GET.get('sort', 'helpful')
+    if review_sort not in REVIEW_SORTS:
+        review_sort = 'helpful'
+    reviews, reviews_has_next = get_review_page(book, review_sort, 1)
     user_review = None
 
     if request.user.is_authenticated:
@@ -225,8 +278,14 @@ def view_book_detail(request, book_id):
     context = {
         'book': book,
         'reviews': reviews,
+        'reviews_has_next': reviews_has_next,
+        'review_sort': review_sort,
         'user_review': user_review,
         'review_form': ReviewForm(),
+        'more_like_this': genre_pools.recommend(
+            book.genre, exclude=book.id, limit=4
+        ),
+        'also_borrowed': readers_also_borrowed(book, limit=4),
     }
     return render(request, 'book_detail.html', context)
 
@@ -287,102 +346,276 @@ def delete_book(request, book_id):
 
 # ============== BARCODE & QR CODE VIEWS ==============
 
+def _scan_error(request, message):
+    return render(request, 'scan.html', {'error': message})
+
+
 @login_required
 def scan_book(request):
-    """Barcode scanning page."""
+    """Barcode scanning page: decode an uploaded photo and check its rack."""
     if not BARCODE_SCANNING_AVAILABLE:
         return render(request, 'scan.html', {
-            'error': 'Barcode scanning is not available. Required libraries (OpenCV, pyzbar) are not installed. '
-                     'Please use QR code scanning or manual ISBN entry instead.'
+            'error': 'Barcode scanning is not available. Required library '
+                     '(pyzbar/zbar) is not installed. Please use QR code '
+                     'scanning or manual ISBN entry instead.'
         })
-    
+
     if request.method == 'POST':
         rack_no = request.POST.get('rack_no')
         if not rack_no:
-            return render(request, 'scan.html', {'error': 'Please enter a rack number.'})
+            return _scan_error(request, 'Please enter a rack number.')
 
-        # Initialize camera
-        cap = cv2.VideoCapture(0)
-        scanned_data = None
+        image = request.FILES.get('image')
+        if not image:
+            return _scan_error(
+                request, 'Please take or upload a photo of the barcode.'
+            )
 
         try:
-            while True:
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                barcodes = decode(frame)
-                for barcode in barcodes:
-                    scanned_data = barcode.data.decode('utf-8')
-                    break
-
-                if scanned_data:
-                    break
-
-                cv2.imshow("Barcode Scanner", frame)
-                if cv2.waitKey(1) & 0xFF == ord('q'):
-                    break
-        finally:
-            cap.release()
-            cv2.destroyAllWindows()
-
-        if not scanned_data:
-            return render(request, 'scan.html', {'error': 'No barcode detected. Try again.'})
-
-        book = Book.objects.filter(barcode=scanned_data).first()
-        if book:
-            if book.rack_no == rack_no:
-                recommendations = Book.objects.filter(
-                    genre=book.genre,
-                    status=BookStatus.AVAILABLE
-                ).exclude(id=book.id)[:3]
-
-                log_activity(request, 'scan_success', book=book)
-                return render(request, 'scan_result.html', {
-                    'success': True,
-                    'message': f"✓ '{book.title}' is in the correct rack!",
-                    'book': book,
-                    'recommendations': recommendations,
-                })
-            else:
-                log_activity(request, 'scan_misplaced', book=book)
-                return render(request, 'scan_result.html', {
-                    'success': False,
-                    'message': f"✗ '{book.title}' is in the wrong rack. Should be in rack {book.rack_no}",
-                    'book': book,
-                })
-        else:
+            barcodes = decode_uploads([image.read()])
+        except InvalidImage:
+            return _scan_error(
+                request, 'The uploaded file is not a readable image.'
+            )
+        except (ScannerBusy, DecodeTimeout):
+            return _scan_error(
+                request, 'The scanner is busy right now. Please try again.'
+            )
+
+        if not barcodes:
+            return _scan_error(request, 'No barcode detected. Try again.')
+        scanned_data = barcodes[0]['data']
+
+        status, entry = rack_index.classify(scanned_data, rack_no)
+        # The index can lag behind a delete made by another process
+        book = Book.objects.filter(pk=entry.book_id).first() if entry else None
+        if status == UNKNOWN or book is None:
             return render(request, 'scan_result.html', {
                 'success': False,
                 'message': 'Book not found in database.',
             })
 
+        if status == CORRECT:
+            recommendations = genre_pools.recommend(
+                book.genre, exclude=book.id
+            )
+
+            log_activity(request, 'scan_success', book=book)
+            return render(request, 'scan_result.html', {
+                'success': True,
+                'message': f"✓ '{book.title}' is in the correct rack!",
+                'book': book,
+                'recommendations': recommendations,
+            })
+
+        log_activity(request, 'scan_misplaced', book=book)
+        return render(request, 'scan_result.html', {
+            'success': False,
+            'message': f"✗ '{book.title}' is in the wrong rack. "
+                       f"Should be in rack {entry.rack_no}",
+            'book': book,
+        })
+
     return render(request, 'scan.html')
 
 
+@require_POST
 @login_required
-def generate_qr_code(request, book_id):
-    """Generate QR code for a book."""
-    book = get_object_or_404(Book, pk=book_id)
+def decode_barcodes(request):
+    """Decode barcodes in uploaded images or camera frames; look books up."""
+    if not BARCODE_SCANNING_AVAILABLE:
+        return JsonResponse(
+            {'error': 'Barcode decoding is not available on this server'},
+            status=503,
+        )
+
+    images = request.FILES.getlist('image')
+    if not images:
+        return JsonResponse({'error': 'No image uploaded'}, status=400)
+    if len(images) > settings.BARCODE_MAX_IMAGES:
+        return JsonResponse(
+            {'error': f'At most {settings.BARCODE_MAX_IMAGES} images per '
+                      'request'},
+            status=400,
+        )
+
+    try:
+        barcodes = decode_uploads([image.read() for image in images])
+    except InvalidImage:
+        return JsonResponse({'error': 'Unreadable image'}, status=400)
+    except ScannerBusy:
+        return JsonResponse(
+            {'error': 'Scanner busy, retry shortly'}, status=503
+        )
+    except DecodeTimeout:
+        return JsonResponse({'error': 'Decoding timed out'}, status=504)
 
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+    rack_no = request.POST.get('rack_no')
+    entries = {b['data']: rack_index.lookup(b['data']) for b in barcodes}
+    details = Book.objects.only('title', 'status').in_bulk(
+        [entry.book_id for entry in entries.values() if entry]
     )
-    qr.add_data(f"{request.build_absolute_uri('/book/' + str(book_id) + '/')}")
-    qr.make(fit=True)
+    results = []
+    for barcode in barcodes:
+        entry = entries[barcode['data']]
+        book = details.get(entry.book_id) if entry else None
+        results.append({
+            **barcode,
+            'book': {
+                'id': entry.book_id,
+                'title': book.title,
+                'rack_no': entry.rack_no,
+                'shelf_no': entry.shelf_no,
+                'status': book.status,
+            } if book else None,
+            'correct_rack': (
+                entry.rack_no == rack_no if book and rack_no else None
+            ),
+        })
+
+    return JsonResponse({'barcodes': results})
+
+
+@require_POST
+@login_required
+@librarian_required
+def rack_audit(request):
+    """Audit a rack from a batch of shelf photos or a short video.
+
+    Frames are decoded in the shared scanner pool, so audits are admitted and
+    timed out like other scans. At most ``AUDIT_MAX_FRAMES`` distinct frames
+    are decoded per request, within ``AUDIT_TIMEOUT`` seconds.
+    """
+    if not BARCODE_SCANNING_AVAILABLE:
+        return JsonResponse(
+            {'error': 'Barcode decoding is not available on this server'},
+            status=503,
+        )
+
+    rack_no = request.POST.get('rack_no')
+    if not rack_no:
+        return JsonResponse({'error': 'rack_no is required'}, status=400)
+
+    max_frames = settings.AUDIT_MAX_FRAMES
+    video = request.FILES.get('video')
+    images = request.FILES.getlist('image')
+    if video:
+        frames = video_upload_frames(video, settings.AUDIT_VIDEO_FRAME_STEP)
+    elif len(images) > max_frames:
+        return JsonResponse(
+            {'error': f'At most {max_frames} images per audit'}, status=400
+        )
+    elif images:
+        frames = image_frames(image.read() for image in images)
+    else:
+        return JsonResponse(
+            {'error': 'Upload images or a video of the rack'}, status=400
+        )
+
+    timeout = settings.AUDIT_TIMEOUT
+    try:
+        seen, decoded = run_decoder(
+            decode_frames, frames, 0, max_frames,
+            time.monotonic() + timeout, timeout=timeout,
+        )
+    except InvalidImage:
+        return JsonResponse({'error': 'Unreadable image'}, status=400)
+    except ScannerBusy:
+        return JsonResponse(
+            {'error': 'Scanner busy, retry shortly'}, status=503
+        )
+    except DecodeTimeout:
+        return JsonResponse({'error': 'Audit timed out'}, status=504)
+    except RuntimeError as exc:
+        return JsonResponse({'error': str(exc)}, status=503)
+
+    report = audit_report(rack_no, seen, decoded)
+    action = 'scan_misplaced' if report['misplaced'] else 'scan_success'
+    log_activity(request, action,
+                 details=f"Audit of rack {rack_no}: "
+                         f"{len(report['verified'])} verified, "
+                         f"{len(report['misplaced'])} misplaced, "
+                         f"{len(report['missing'])} missing")
+    return JsonResponse(report)
+
+
+@login_required
+@librarian_required
+def rack_summary(request):
+    """Get the number of catalogued books on each rack from the rack index."""
+    rack_no = request.GET.get('rack_no')
+    if rack_no:
+        return JsonResponse({
+            'rack_no': rack_no,
+            'barcodes': sorted(rack_index.rack_barcodes(rack_no)),
+        })
+    racks = rack_index.rack_sizes()
+    return JsonResponse({'racks': racks, 'total_books': sum(racks.values())})
+
+
+def _book_qr_code(book_id):
+    """Get the cached QR code storage name for a book's detail URL."""
+    book = get_object_or_404(Book, pk=book_id)
+    return get_qr_code(site_url(reverse('view_book_detail', args=[book.id])))
+
+
+@login_required
+def generate_qr_code(request, book_id):
+    """Generate QR code for a book (JSON, kept for older clients)."""
+    name = _book_qr_code(book_id)
+    with default_storage.open(name) as qr_file:
+        img_base64 = base64.b64encode(qr_file.read()).decode()
 
-    img = qr.make_image(fill_color="black", back_color="white")
+    return JsonResponse({
+        'qr_code': f'data:image/png;base64,{img_base64}',
+        'url': default_storage.url(name),
+    })
+
+
+@login_required
+def book_qr_png(request, book_id):
+    """Redirect to the content-addressed QR code PNG.
+
+    nginx serves it as immutable.
+    """
+    return redirect(default_storage.url(_book_qr_code(book_id)))
+
+
+@login_required
+@librarian_required
+def qr_label_sheets(request):
+    """Stream a ZIP of printable QR label pages for the filtered books.
+
+    Up to ``QR_LABEL_MAX_BOOKS`` labels are rendered inline, one page at a
+    time; larger runs belong to ``manage.py generate_qr_labels``.
+    """
+    books = Book.objects.order_by('rack_no', 'shelf_no', 'id')
+    for field in ('genre', 'rack_no', 'status'):
+        if request.GET.get(field):
+            books = books.filter(**{field: request.GET[field]})
+
+    limit = settings.QR_LABEL_MAX_BOOKS
+    rows = list(books.values_list('id', 'title', 'barcode')[:limit + 1])
+    if len(rows) > limit:
+        messages.error(
+            request,
+            f'Label sheets are limited to {limit} books per download. '
+            'Narrow the filters or run manage.py generate_qr_labels.'
+        )
+        return redirect('dashboard')
 
-    # Convert to base64
-    buffer = BytesIO()
-    img.save(buffer, format='PNG')
-    buffer.seek(0)
-    img_base64 = base64.b64encode(buffer.getvalue()).decode()
+    labels = [
+        (site_url(reverse('view_book_detail', args=[book_id])),
+         f'{barcode} {title}')
+        for book_id, title, barcode in rows
+    ]
+    chunks = stream_label_zip(iter_label_sheets(labels, workers=0))
 
-    return JsonResponse({'qr_code': f'data:image/png;base64,{img_base64}'})
+    response = StreamingHttpResponse(
+        iterate_in_thread(chunks), content_type='application/zip'
+    )
+    response['Content-Disposition'] = 'attachment; filename="qr-labels.zip"'
+    return response
 
 
 # ============== BORROWING SYSTEM ==============
@@ -492,6 +725,7 @@ def reserve_book(request, book_id):
         user=request.user,
         book=book
     )
+    log_activity(request, 'reserve', book=book)
 
     create_notification(
         request.user,
@@ -525,11 +759,8 @@ def add_review(request, book_id):
                 'review_text': review_text,
             }
         )
-
-        # Update book's average rating
-        avg_rating = Review.objects.filter(book=book).aggregate(Avg('rating'))['rating__avg'] or 0
-        book.average_rating = round(avg_rating, 2)
-        book.save()
+        # The book's rating aggregates are adjusted by the Review post_save
+        # signal
 
         messages.success(request, 'Review posted successfully!')
     else:
@@ -569,6 +800,54 @@ def mark_notification_read(request, notification_id):
     return JsonResponse({'status': 'success'})
 
 
+@require_POST
+@login_required
+def mark_notifications_read(request):
+    """Mark selected (or all) unread notifications as read in one UPDATE."""
+    notifications_query = Notification.objects.filter(
+        user=request.user, is_read=False
+    )
+
+    ids = request.POST.getlist('ids')
+    if ids:
+        try:
+            ids = [int(i) for i in ids]
+        except ValueError:
+            return JsonResponse(
+                {'error': 'Invalid notification id'}, status=400
+            )
+        notifications_query = notifications_query.filter(pk__in=ids)
+
+    updated = notifications_query.update(is_read=True)
+
+    # The notifications page posts a plain form with ``next``; scripts get JSON
+    next_url = request.POST.get('next')
+    if next_url and url_has_allowed_host_and_scheme(
+        next_url, allowed_hosts={request.get_host()},
+        require_https=request.is_secure(),
+    ):
+        messages.success(request, f'Marked {updated} notification(s) as read.')
+        return redirect(next_url)
+
+    return JsonResponse({'status': 'success', 'updated': updated})
+
+
+@require_POST
+@login_required
+def update_notification_preferences(request):
+    """Switch between instant notifications and a daily digest."""
+    delivery = request.POST.get('notification_delivery')
+    if delivery not in NotificationDelivery.values:
+        messages.error(request, 'Invalid notification preference.')
+        return redirect('get_notifications')
+
+    request.user.notification_delivery = delivery
+    request.user.save(update_fields=['notification_delivery'])
+
+    messages.success(request, 'Notification preferences updated.')
+    return redirect('get_notifications')
+
+
 # ============== API ENDPOINTS FOR REAL-TIME UPDATES ==============
 
 @login_required
@@ -588,10 +867,38 @@ def get_book_status(request, book_id):
     })
 
 
+@login_required
+def get_book_reviews(request, book_id):
+    """Get further pages of a book's reviews as JSON."""
+    book = get_object_or_404(Book, pk=book_id)
+    try:
+        page = max(1, int(request.GET.get('page', 1)))
+    except ValueError:
+        page = 1
+    sort = request.GET.get('sort', 'helpful')
+    reviews, has_next = get_review_page(book, sort, page)
+
+    return JsonResponse({
+        'reviews': [
+            {
+                'id': review.id,
+                'user': review.user.get_full_name() or review.user.username,
+                'rating': review.rating,
+                'comment': review.review_text,
+                'helpful_count': review.helpful_count,
+                'created_at': review.created_at.isoformat(),
+            }
+            for review in reviews
+        ],
+        'page': page,
+        'has_next': has_next,
+    })
+
+
 @login_required
 def get_user_borrowings(request):
     """Get user's active borrowings."""
-    borrowings = request.user.get_active_borrowings()
+    borrowings = request.user.get_active_borrowings().select_related('book')
     data = []
     for b in borrowings:
         data.append({
@@ -617,6 +924,147 @@ def get_stats(request):
     })
 
 
+def _sse_event(event, data):
+    """Format one Server-Sent Events frame."""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+async def event_stream(request):
+    """Stream the NotificationConsumer events over Server-Sent Events.
+
+    Fallback for clients whose proxies block WebSocket upgrades. The stream
+    joins the same ``user_<id>`` channel-layer group, sends a comment line as
+    a heartbeat and ends after ``SSE_MAX_STREAM_SECONDS`` so the browser
+    reconnects, which bounds streams whose client silently went away. Counts
+    are only re-read when a group event arrives.
+    """
+    user = await sync_to_async(
+        lambda: request.user if request.user.is_authenticated else None
+    )()
+    if user is None:
+        return HttpResponse(status=401)
+
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return HttpResponse(status=503)
+
+    async def stream():
+        group_name = f'user_{user.id}'
+        channel_name = await channel_layer.new_channel()
+        await channel_layer.group_add(group_name, channel_name)
+        deadline = time.monotonic() + settings.SSE_MAX_STREAM_SECONDS
+        last_counts = {}
+        refresh_counts = True
+        try:
+            yield f'retry: {settings.SSE_RETRY_MILLISECONDS}\n\n'
+            while True:
+                # Counts are queried on connect and after each group event,
+                # never on heartbeats
+                if refresh_counts:
+                    refresh_counts = False
+                    counts = await sync_to_async(get_cached_realtime_counts)(
+                        user.id
+                    )
+                    changed = {
+                        key: value for key, value in counts.items()
+                        if last_counts.get(key) != value
+                    }
+                    if changed:
+                        last_counts = counts
+                        yield _sse_event('updates', {
+                            'type': 'updates', **changed,
+                            'timestamp': timezone.now().isoformat(),
+                        })
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(
+                        channel_layer.receive(channel_name),
+                        timeout=min(settings.SSE_HEARTBEAT_SECONDS, remaining)
+                    )
+                except asyncio.TimeoutError:
+                    yield ': heartbeat\n\n'
+                    continue
+                refresh_counts = True
+                if event.get('type') == 'notification.message':
+                    yield _sse_event(
+                        'notification', notification_payload(event)
+                    )
+        finally:
+            await channel_layer.group_discard(group_name, channel_name)
+
+    response = StreamingHttpResponse(
+        stream(), content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    # Let nginx pass events through unbuffered
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@librarian_required
+def get_realtime_metrics(request):
+    """Get WebSocket connection counters for this worker process."""
+    return JsonResponse({
+        **get_connection_metrics(),
+        'timestamp': timezone.now().isoformat(),
+    })
+
+
+def metrics(request):
+    """Request, database and cache metrics of this worker, for Prometheus."""
+    if not is_metrics_client(request):
+        return HttpResponse(status=403)
+    return HttpResponse(
+        metrics_registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@login_required
+@librarian_required
+def profile_list(request):
+    """The slowest profiled requests."""
+    return render(request, 'profiles.html', {
+        'profiles': slowest_profiles(),
+        'sample_rate': settings.PROFILING_SAMPLE_RATE,
+    })
+
+
+@login_required
+@librarian_required
+def profile_detail(request, name):
+    """The top functions of one profile."""
+    path = profile_path(name)
+    if path is None:
+        raise Http404('No such profile')
+    sort = request.GET.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'ncalls'):
+        sort = 'cumulative'
+    with open(path.with_suffix('.json')) as handle:
+        details = json.load(handle)
+    return render(request, 'profile_detail.html', {
+        'profile': details,
+        'report': profile_report(path, sort),
+        'sort': sort,
+    })
+
+
+@login_required
+@librarian_required
+def profile_download(request, name):
+    """Download a profile in pstats format."""
+    path = profile_path(name)
+    if path is None:
+        raise Http404('No such profile')
+    return FileResponse(
+        open(path, 'rb'), as_attachment=True, filename=path.name
+    )
+
+
 # ============== ERROR HANDLERS ==============
 
 def page_not_found(request, exception):
@@ -4,6 +4,8 @@ Django settings for smart_library project.
 
 from pathlib import Path
 import os
+
+import django
 from dotenv import load_dotenv
 
 # Load environment variables
@@ -33,11 +35,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'library.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'library.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -77,6 +81,39 @@ if os.environ.get('DATABASE_URL'):
     import dj_database_url
     DATABASES['default'] = dj_database_url.config(default=os.environ.get('DATABASE_URL'))
 
+# Keep connections open between requests (seconds; 0 closes them after each
+# request). Only raise this under a WSGI server: under ASGI (daphne) requests
+# run in varying threads, so kept connections pile up instead of being reused
+# (Django ticket #33497).
+DATABASES['default']['CONN_MAX_AGE'] = int(
+    os.environ.get('DB_CONN_MAX_AGE', 0)
+)
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# SQLite tuning, applied to every new SQLite connection (see library/db.py).
+# SQLITE_PRAGMAS = {} leaves SQLite's defaults alone.
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'wal'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'normal'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+    # Negative values are KiB, so 64 MB
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    'temp_store': 'memory',
+}
+# IMMEDIATE makes atomic() take the write lock at BEGIN so writers queue
+# instead of failing.
+SQLITE_TRANSACTION_MODE = os.environ.get(
+    'SQLITE_TRANSACTION_MODE', 'IMMEDIATE'
+)
+# Django 5.1 supports this natively; library/db.py patches older versions.
+if (django.VERSION >= (5, 1)
+        and DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+        and SQLITE_TRANSACTION_MODE.upper() in ('IMMEDIATE', 'EXCLUSIVE')):
+    DATABASES['default'].setdefault('OPTIONS', {})['transaction_mode'] = (
+        SQLITE_TRANSACTION_MODE.upper()
+    )
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -125,17 +162,187 @@ DATA_UPLOAD_MAX_MEMORY_SIZE = MAX_UPLOAD_SIZE
 FILE_UPLOAD_MAX_MEMORY_SIZE = MAX_UPLOAD_SIZE
 
 # Django Channels Configuration
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels.layers.InMemoryChannelLayer"
-        # For production, use:
-        # "BACKEND": "channels_redis.core.RedisChannelLayer",
-        # "CONFIG": {
-        #     "hosts": [("127.0.0.1", 6379)],
-        # },
+# The in-memory layer only reaches sockets held by the same process. Anything
+# running more than one daphne worker must use one of the Redis layers, which
+# work against any Redis-protocol server (Redis, KeyDB, a local stand-in...).
+#   memory       - single process, development only
+#   redis        - channels_redis.core.RedisChannelLayer (list-based queues)
+#   redis-pubsub - channels_redis.pubsub.RedisPubSubChannelLayer (fastest
+#                  group fan-out)
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://127.0.0.1:6379/0')
+CHANNEL_LAYER_BACKEND = os.environ.get(
+    'CHANNEL_LAYER_BACKEND',
+    'redis' if os.environ.get('REDIS_URL') else 'memory'
+)
+
+# Cache. The rack index and recommendation pools live in each process and
+# share a version number through this cache, so servers with several
+# processes, and management commands that bulk-change books, need Redis.
+CACHE_BACKEND = os.environ.get(
+    'CACHE_BACKEND',
+    'redis' if os.environ.get('REDIS_URL') else 'locmem'
+)
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
+
+if CHANNEL_LAYER_BACKEND == 'redis':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {
+                "hosts": [REDIS_URL],
+                "capacity": int(
+                    os.environ.get('CHANNEL_LAYER_CAPACITY', 1000)
+                ),
+                "expiry": 30,
+            },
+        }
+    }
+elif CHANNEL_LAYER_BACKEND == 'redis-pubsub':
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+            "CONFIG": {
+                "hosts": [REDIS_URL],
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels.layers.InMemoryChannelLayer"
+        }
+    }
+
+# Public base URL for links that outlive a request, such as QR codes and
+# labels. Never taken from the Host header.
+SITE_URL = os.environ.get('SITE_URL', 'http://localhost:8000')
+
+# Processes used by generate_qr_labels (0 = one per CPU)
+QR_LABEL_WORKERS = int(os.environ.get('QR_LABEL_WORKERS', 0))
+# Most books per label-sheet download; larger runs use generate_qr_labels
+QR_LABEL_MAX_BOOKS = int(os.environ.get('QR_LABEL_MAX_BOOKS', 2000))
+
+# Barcode decoding of uploaded images
+BARCODE_DECODE_WORKERS = int(os.environ.get('BARCODE_DECODE_WORKERS', 2))
+# Waiting requests beyond the workers
+BARCODE_DECODE_QUEUE = int(os.environ.get('BARCODE_DECODE_QUEUE', 8))
+BARCODE_DECODE_TIMEOUT = float(os.environ.get('BARCODE_DECODE_TIMEOUT', 5))
+BARCODE_MAX_IMAGES = int(os.environ.get('BARCODE_MAX_IMAGES', 10))
+# Applied to every frame before decoding; tune with
+# `manage.py benchmark_barcode_decoding`. roi is (left, top, right, bottom) as
+# fractions of the frame; skip_distance drops frames within that many hash
+# bits of the previous one (None keeps all).
+BARCODE_PREPROCESSING = {
+    'grayscale': True,
+    'max_width': int(os.environ.get('BARCODE_MAX_WIDTH', 1280)) or None,
+    'roi': None,
+    'skip_distance': None,
 }
 
+# Cover and profile image variants (max width in pixels, smallest first)
+IMAGE_VARIANTS = {'thumb': 160, 'card': 320, 'detail': 800}
+IMAGE_QUALITY = int(os.environ.get('IMAGE_QUALITY', 80))
+# Rendering threads, 0 = render inline
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+
+# Shelf audits
+# Processes used by the audit_rack command (0 = one per CPU)
+AUDIT_WORKERS = int(os.environ.get('AUDIT_WORKERS', 0))
+# Hash bits for "same frame"
+AUDIT_FRAME_MAX_DISTANCE = int(os.environ.get('AUDIT_FRAME_MAX_DISTANCE', 2))
+AUDIT_VIDEO_FRAME_STEP = int(os.environ.get('AUDIT_VIDEO_FRAME_STEP', 5))
+# Limits for audits uploaded through the web, which share the scanner pool
+AUDIT_MAX_FRAMES = int(os.environ.get('AUDIT_MAX_FRAMES', 120))
+AUDIT_TIMEOUT = float(os.environ.get('AUDIT_TIMEOUT', 30))
+
+# Recommendations
+# Top available books kept in memory per genre for scan results and "more like
+# this".
+GENRE_POOL_SIZE = int(os.environ.get('GENRE_POOL_SIZE', 12))
+# "Readers also borrowed" neighbours stored per book by
+# `manage.py rebuild_recommendations`.
+RECOMMENDATION_NEIGHBORS = int(os.environ.get('RECOMMENDATION_NEIGHBORS', 10))
+
+# Trending books
+# Each logged event adds its weight to the book's popularity;
+# `manage.py decay_popularity` (run every TRENDING_DECAY_INTERVAL_MINUTES from
+# cron) halves scores every half-life, measured from the time of its previous
+# run.
+TRENDING_WEIGHTS = {'borrow': 3.0, 'reserve': 2.0, 'view_book': 1.0}
+TRENDING_HALF_LIFE_HOURS = float(
+    os.environ.get('TRENDING_HALF_LIFE_HOURS', 72)
+)
+TRENDING_DECAY_INTERVAL_MINUTES = int(
+    os.environ.get('TRENDING_DECAY_INTERVAL_MINUTES', 60)
+)
+# Events are buffered per process and written to Book in one UPDATE once the
+# oldest is this many seconds old or this many books are pending.
+TRENDING_FLUSH_SECONDS = int(os.environ.get('TRENDING_FLUSH_SECONDS', 30))
+TRENDING_FLUSH_BOOKS = int(os.environ.get('TRENDING_FLUSH_BOOKS', 200))
+TRENDING_SIZE = int(os.environ.get('TRENDING_SIZE', 8))
+TRENDING_CACHE_SECONDS = int(os.environ.get('TRENDING_CACHE_SECONDS', 300))
+
+# Notifications
+# Same-type unread notifications for a user are merged into one row per
+# window of this many seconds.
+NOTIFICATION_COALESCE_WINDOW = int(
+    os.environ.get('NOTIFICATION_COALESCE_WINDOW', 120)
+)
+
+# Counts pushed by NotificationConsumer are shared across a user's sockets
+# for this long.
+REALTIME_COUNTS_CACHE_SECONDS = int(
+    os.environ.get('REALTIME_COUNTS_CACHE_SECONDS', 5)
+)
+
+# WebSocket limits (per daphne process)
+WEBSOCKET_MAX_CONNECTIONS = int(
+    os.environ.get('WEBSOCKET_MAX_CONNECTIONS', 5000)
+)
+# Messages per second
+WEBSOCKET_RATE_LIMIT = float(os.environ.get('WEBSOCKET_RATE_LIMIT', 1))
+WEBSOCKET_RATE_BURST = int(os.environ.get('WEBSOCKET_RATE_BURST', 5))
+WEBSOCKET_OUTBOUND_QUEUE_SIZE = int(
+    os.environ.get('WEBSOCKET_OUTBOUND_QUEUE_SIZE', 50)
+)
+
+# Server-Sent Events fallback for clients that cannot open WebSockets
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+SSE_MAX_STREAM_SECONDS = float(os.environ.get('SSE_MAX_STREAM_SECONDS', 300))
+SSE_RETRY_MILLISECONDS = int(os.environ.get('SSE_RETRY_MILLISECONDS', 3000))
+
+# Request metrics, served in Prometheus format at /metrics
+# Share of requests whose SQL queries are counted and timed (latency is
+# recorded for all).
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 0.1))
+# Addresses or networks (by REMOTE_ADDR) allowed to scrape /metrics without a
+# staff login.
+METRICS_ALLOWED_IPS = os.environ.get(
+    'METRICS_ALLOWED_IPS', '127.0.0.1,::1'
+).split(',')
+
+# Request profiling
+# Share of requests run under cProfile. Librarians can also profile one
+# request by sending "X-Profile: 1".
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', BASE_DIR / 'profiles')
+# The oldest profiles are deleted once the directory grows past this size.
+PROFILING_MAX_BYTES = int(
+    os.environ.get('PROFILING_MAX_BYTES', 200 * 1024 * 1024)
+)
+
 # Security Settings (Enable for production)
 if not DEBUG:
     SECURE_SSL_REDIRECT = True
@@ -6,9 +6,16 @@ const socket = io();
 // Connect to socket
 socket.on('connect', function() {
     console.log('Connected to server');
+    stopBadgePolling();
     socket.emit('get_updates');
 });
 
+socket.on('disconnect', function() {
+    if (!eventStreamOpen()) {
+        startBadgePolling();
+    }
+});
+
 // Handle real-time notifications
 socket.on('notification', function(data) {
     showNotification(data.title, data.message, data.type);
@@ -69,6 +76,50 @@ function updateNotificationBadge() {
         });
 }
 
+// Poll the badge every 30 seconds only while no live connection is open
+let badgePoll = null;
+function startBadgePolling() {
+    if (isAuthenticated() && !badgePoll) {
+        badgePoll = setInterval(updateNotificationBadge, 30000);
+    }
+}
+
+function stopBadgePolling() {
+    clearInterval(badgePoll);
+    badgePoll = null;
+}
+
+// Server-Sent Events fallback for networks that block WebSocket upgrades
+let eventStream = null;
+function eventStreamOpen() {
+    return eventStream !== null && eventStream.readyState === EventSource.OPEN;
+}
+
+function startEventStream() {
+    const stream = new EventSource('/api/stream/');
+
+    stream.addEventListener('open', stopBadgePolling);
+
+    // The browser reconnects by itself; poll until it does
+    stream.addEventListener('error', function() {
+        if (!socket.connected) {
+            startBadgePolling();
+        }
+    });
+
+    stream.addEventListener('notification', function(event) {
+        const data = JSON.parse(event.data);
+        showNotification(data.title, data.message, data.notification_type);
+        updateNotificationBadge();
+    });
+
+    stream.addEventListener('updates', function(event) {
+        updateDashboard(JSON.parse(event.data));
+    });
+
+    return stream;
+}
+
 // Update dashboard with real-time data
 function updateDashboard(data) {
     // This can be customized based on dashboard needs
@@ -246,17 +297,13 @@ function smoothScroll(target) {
 
 // Handle QR code generation
 function generateQRCode(bookId) {
-    fetch(`/book/${bookId}/qr`)
-        .then(response => response.json())
-        .then(data => {
-            const qrModal = new bootstrap.Modal(document.getElementById('qrModal'));
-            document.getElementById('qrImage').src = data.qr_code;
-            qrModal.show();
-        })
-        .catch(err => {
-            showNotification('Error', 'Failed to generate QR code', 'danger');
-            console.error('QR generation error:', err);
-        });
+    const qrImage = document.getElementById('qrImage');
+    qrImage.onerror = function() {
+        showNotification('Error', 'Failed to generate QR code', 'danger');
+    };
+    // Cached PNG served directly, no base64 round trip
+    qrImage.src = `/book/${bookId}/qr.png`;
+    new bootstrap.Modal(document.getElementById('qrModal')).show();
 }
 
 // Initialize on page load
@@ -264,7 +311,9 @@ document.addEventListener('DOMContentLoaded', function() {
     loadDarkModePreference();
     initializeTooltips();
     initializePopovers();
-    updateNotificationBadge();
+    if (isAuthenticated()) {
+        updateNotificationBadge();
+    }
 
     // Setup event listeners
     const searchInput = document.getElementById('searchBooks');
@@ -273,9 +322,21 @@ document.addEventListener('DOMContentLoaded', function() {
             bookSearch(this.value);
         });
     }
+});
 
-    // Update notification badge every 30 seconds
-    setInterval(updateNotificationBadge, 30000);
+function isAuthenticated() {
+    return document.body.dataset.authenticated === 'true';
+}
+
+// Open the event stream only when the WebSocket cannot connect, and poll
+// until one of them does
+socket.on('connect_error', function() {
+    if (isAuthenticated() && window.EventSource && !eventStream) {
+        eventStream = startEventStream();
+    }
+    if (!eventStreamOpen()) {
+        startBadgePolling();
+    }
 });
 
 // Export functions for use in templates